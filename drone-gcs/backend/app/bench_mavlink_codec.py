@@ -0,0 +1,72 @@
+"""
+Benchmark: built-in MAVLink decoder vs pymavlink
+Decodes a 20-vehicle telemetry mix and reports messages per second
+
+Usage: python app/bench_mavlink_codec.py [--vehicles 20] [--rounds 2000]
+"""
+import argparse
+import time
+from mavlink_codec import MAVLinkDecoder, TelemetryState, encode_frame
+
+
+def build_datagrams(vehicles: int, rounds: int):
+    """One datagram per message, cycling through the telemetry set for each vehicle"""
+    datagrams = []
+    for r in range(rounds):
+        for sysid in range(1, vehicles + 1):
+            seq = r & 0xFF
+            datagrams.append(encode_frame(0, (4, 2, 3, 0x81, 4, 3), sysid=sysid, seq=seq))
+            datagrams.append(encode_frame(1, (0, 0, 0, 0, 12600, 500, 0, 0, 0, 0, 0, 0, 87), sysid=sysid, seq=seq))
+            datagrams.append(encode_frame(24, (r, 129716000 + r, 775946000 + sysid, 100000, 150, 210, 1200, 9000, 3, 15), sysid=sysid, seq=seq))
+            datagrams.append(encode_frame(30, (r, 0.01, 0.02, 1.5, 0.0, 0.0, 0.0), sysid=sysid, seq=seq))
+            datagrams.append(encode_frame(74, (12.5, 12.0, 100.0, 0.5, 90, 50), sysid=sysid, seq=seq))
+    return datagrams
+
+
+def bench_builtin(datagrams, vehicles: int) -> float:
+    states = {(sysid, 1): TelemetryState(sysid, 1) for sysid in range(1, vehicles + 1)}
+    decoder = MAVLinkDecoder(state_for=lambda sysid, compid, msg_id: states.get((sysid, compid)))
+    start = time.perf_counter()
+    decoded = 0
+    for datagram in datagrams:
+        decoded += decoder.feed(datagram, 0.0)
+    elapsed = time.perf_counter() - start
+    assert decoded == len(datagrams), decoder.get_statistics()
+    return elapsed
+
+
+def bench_pymavlink(datagrams) -> float:
+    from pymavlink import mavutil
+    from mavlink_handler import MAVLinkHandler
+
+    parser = mavutil.mavlink.MAVLink(None)
+    handler = MAVLinkHandler()
+    start = time.perf_counter()
+    for datagram in datagrams:
+        for msg in parser.parse_buffer(datagram) or ():
+            handler.parse_mavlink_message(msg)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vehicles', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    datagrams = build_datagrams(args.vehicles, args.rounds)
+    count = len(datagrams)
+    print(f"📦 {count} messages from {args.vehicles} vehicles")
+
+    elapsed = bench_builtin(datagrams, args.vehicles)
+    print(f"built-in  : {count / elapsed:12,.0f} msg/s  {elapsed / count * 1e6:6.2f} us/msg")
+
+    try:
+        elapsed = bench_pymavlink(datagrams)
+        print(f"pymavlink : {count / elapsed:12,.0f} msg/s  {elapsed / count * 1e6:6.2f} us/msg")
+    except ImportError:
+        print("pymavlink : not installed, skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark: WebSocket telemetry encodings
+Reports encode cost and bytes per frame for JSON, MessagePack and the struct frame
+
+Usage: python app/bench_ws_encoding.py [--frames 50000]
+"""
+import argparse
+import time
+import ws_codec
+from mavlink_handler import MAVLinkHandler
+
+
+def build_messages(count: int):
+    handler = MAVLinkHandler()
+    handler.telemetry_data['armed'] = True
+    messages = []
+    for seq in range(count):
+        messages.append({
+            'type': 'telemetry',
+            'vehicle_id': '1:1',
+            'seq': seq,
+            'data': handler.update_simulation(),
+            'timestamp': time.time(),
+            'mavlink': True
+        })
+    return messages
+
+
+def bench(encoding: str, messages) -> tuple:
+    encode = ws_codec.ENCODERS[encoding]
+    start = time.perf_counter()
+    total_bytes = 0
+    for message in messages:
+        payload = encode(message)
+        total_bytes += len(payload) if isinstance(payload, bytes) else len(payload.encode())
+    elapsed = time.perf_counter() - start
+    return elapsed / len(messages) * 1e6, total_bytes / len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=50000)
+    args = parser.parse_args()
+
+    messages = build_messages(args.frames)
+    print(f"📦 {args.frames} telemetry frames")
+    print(f"{'encoding':<16}{'us/frame':>10}{'bytes/frame':>14}")
+    for encoding in (ws_codec.ENCODING_JSON, ws_codec.SUBPROTOCOL_MSGPACK, ws_codec.SUBPROTOCOL_STRUCT):
+        if encoding not in ws_codec.ENCODERS:
+            print(f"{encoding:<16}{'msgpack not installed, skipped':>24}")
+            continue
+        us, size = bench(encoding, messages)
+        print(f"{encoding:<16}{us:>10.2f}{size:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Reliable vehicle command channel
+Dashboard commands (ARM, DISARM, SET_MODE, TAKEOFF, RTL, LAND, GUIDED goto)
+are encoded as COMMAND_LONG, COMMAND_INT (positions) or legacy SET_MODE
+frames, tracked in flight per (sysid, command), retransmitted with exponential backoff and resolved
+with the result of the matching COMMAND_ACK. Every command is its own task,
+so commands to many vehicles proceed in parallel with the ingest loop
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from fleet import VehicleKey, vehicle_id
+from mavlink_codec import MODE_NAMES, MODE_NUMBERS, TelemetryState, encode_frame, register_message
+
+logger = logging.getLogger(__name__)
+
+SET_MODE = 11
+COMMAND_INT = 75
+COMMAND_LONG = 76
+COMMAND_ACK = 77
+
+register_message(SET_MODE, 'SET_MODE', 89, '<IBB')
+# param1-7, command, target system/component, confirmation
+register_message(COMMAND_LONG, 'COMMAND_LONG', 152, '<fffffffHBBB')
+# param1-4, x/y (degE7), z, command, target system/component, frame, current, autocontinue
+register_message(COMMAND_INT, 'COMMAND_INT', 158, '<ffffiifHBBBBB')
+# command, result, then the v2 extensions progress, result_param2, target system/component
+register_message(COMMAND_ACK, 'COMMAND_ACK', 143, '<HBBiBB')
+
+MAV_CMD_NAV_RETURN_TO_LAUNCH = 20
+MAV_CMD_NAV_LAND = 21
+MAV_CMD_NAV_TAKEOFF = 22
+MAV_CMD_DO_SET_MODE = 176
+MAV_CMD_DO_REPOSITION = 192
+MAV_CMD_COMPONENT_ARM_DISARM = 400
+
+# Commands autopilots only take as COMMAND_INT (ArduPilot answers COMMAND_INT_ONLY otherwise)
+INT_COMMANDS = (MAV_CMD_DO_REPOSITION,)
+MAV_FRAME_GLOBAL_RELATIVE_ALT_INT = 6
+
+MAV_MODE_FLAG_CUSTOM_MODE_ENABLED = 1
+MAV_DO_REPOSITION_FLAGS_CHANGE_MODE = 1
+ARM_DISARM_FORCE = 21196
+
+# MAV_RESULT
+MAV_RESULT_ACCEPTED = 0
+MAV_RESULT_TEMPORARILY_REJECTED = 1
+MAV_RESULT_DENIED = 2
+MAV_RESULT_UNSUPPORTED = 3
+MAV_RESULT_FAILED = 4
+MAV_RESULT_IN_PROGRESS = 5
+MAV_RESULT_CANCELLED = 6
+RESULT_NAMES = {0: 'ACCEPTED', 1: 'TEMPORARILY_REJECTED', 2: 'DENIED', 3: 'UNSUPPORTED',
+                4: 'FAILED', 5: 'IN_PROGRESS', 6: 'CANCELLED'}
+
+# Dashboard commands that are plain mode changes
+MODE_COMMANDS = ('AUTO', 'LOITER', 'GUIDED')
+
+Params = Tuple[float, float, float, float, float, float, float]
+
+
+def encode_command(command: str, params: Optional[Dict[str, Any]] = None) -> Tuple[int, Params]:
+    """MAV_CMD id and param1-7 for a dashboard command; ValueError if it has no MAVLink form"""
+    params = params or {}
+    if command in ('ARM', 'DISARM'):
+        return MAV_CMD_COMPONENT_ARM_DISARM, (1.0 if command == 'ARM' else 0.0,
+                                              ARM_DISARM_FORCE if params.get('force') else 0.0,
+                                              0.0, 0.0, 0.0, 0.0, 0.0)
+    if command == 'TAKEOFF':
+        altitude = float(params.get('altitude', params.get('alt', 10.0)))
+        return MAV_CMD_NAV_TAKEOFF, (0.0, 0.0, 0.0, math.nan, 0.0, 0.0, altitude)
+    if command == 'RTL':
+        return MAV_CMD_NAV_RETURN_TO_LAUNCH, (0.0,) * 7
+    if command == 'LAND':
+        return MAV_CMD_NAV_LAND, (0.0, 0.0, 0.0, math.nan, 0.0, 0.0, 0.0)
+    if command == 'GUIDED' and 'lat' in params and 'lon' in params:
+        # Sent as COMMAND_INT: lat/lon become degE7 integers, not float32
+        return MAV_CMD_DO_REPOSITION, (-1.0, MAV_DO_REPOSITION_FLAGS_CHANGE_MODE, 0.0, math.nan,
+                                       float(params['lat']), float(params['lon']),
+                                       float(params.get('alt', 0.0)))
+    if command == 'SET_MODE' or command in MODE_COMMANDS:
+        mode = str(params.get('mode', '')) if command == 'SET_MODE' else command
+        if mode not in MODE_NUMBERS:
+            raise ValueError(f"unknown mode {mode}")
+        return MAV_CMD_DO_SET_MODE, (MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, float(MODE_NUMBERS[mode]),
+                                     0.0, 0.0, 0.0, 0.0, 0.0)
+    raise ValueError(f"unknown command {command}")
+
+
+def decode_command(command: int, params: Sequence[float]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Dashboard command for a received COMMAND_LONG or COMMAND_INT (the vehicle side of encode_command)"""
+    if command == MAV_CMD_COMPONENT_ARM_DISARM:
+        return ('ARM' if params[0] == 1.0 else 'DISARM'), {'force': params[1] == ARM_DISARM_FORCE}
+    if command == MAV_CMD_NAV_TAKEOFF:
+        return 'TAKEOFF', {'altitude': params[6]}
+    if command == MAV_CMD_NAV_RETURN_TO_LAUNCH:
+        return 'RTL', {}
+    if command == MAV_CMD_NAV_LAND:
+        return 'LAND', {}
+    if command == MAV_CMD_DO_REPOSITION:
+        return 'GUIDED', {'lat': params[4], 'lon': params[5], 'alt': params[6]}
+    if command == MAV_CMD_DO_SET_MODE and int(params[1]) in MODE_NAMES:
+        return 'SET_MODE', {'mode': MODE_NAMES[int(params[1])]}
+    return None
+
+
+class InflightCommand:
+    """A command waiting for its COMMAND_ACK"""
+    __slots__ = ('future', 'in_progress', 'progress', 'sent')
+
+    def __init__(self):
+        self.future = asyncio.get_event_loop().create_future()
+        self.in_progress = False
+        self.progress = 0
+        self.sent = time.perf_counter()
+
+
+class CommandManager:
+    """GCS side of the command protocol for every vehicle
+
+    `send` writes a frame towards the vehicles and returns False when
+    there is no link. An attempt waits `timeout * backoff ** attempt`
+    seconds for the ACK; retransmissions bump the COMMAND_LONG
+    confirmation field. An IN_PROGRESS ack stops retransmission and
+    waits up to `progress_timeout` for the final result. Only one command
+    of a kind is in flight per vehicle; a second one waits its turn.
+    """
+
+    def __init__(self, send: Callable[[bytes], Any], sysid: int = 255, compid: int = 190,
+                 timeout: float = 0.5, retries: int = 3, backoff: float = 2.0,
+                 progress_timeout: float = 10.0, latency=None):
+        self.send = send
+        self.sysid = sysid
+        self.compid = compid
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.progress_timeout = progress_timeout
+        # Optional LatencyRecorder: command round trip to the final ACK
+        self._latency = latency.stage('command_ack') if latency else None
+        self.inflight: Dict[Tuple[int, int], InflightCommand] = {}
+        self._locks: Dict[Tuple[int, int], asyncio.Lock] = {}
+        self._seq = 0
+
+        # Counters
+        self.sent = 0
+        self.retransmits = 0
+        self.acked = 0
+        self.timeouts = 0
+        self.unmatched_acks = 0
+        self.results: Dict[str, int] = {}
+
+    def routes(self) -> Dict[int, Callable[[TelemetryState, Tuple], None]]:
+        return {COMMAND_ACK: self._on_ack}
+
+    async def send_command(self, sysid: int, compid: int, command: str,
+                           params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send a dashboard command and wait for the vehicle's verdict"""
+        try:
+            mav_cmd, values = encode_command(command, params)
+        except (ValueError, TypeError) as e:
+            return self._result(command, (sysid, compid), 'INVALID', 0, error=str(e))
+        if mav_cmd in INT_COMMANDS:
+            return await self.command_int(sysid, compid, mav_cmd, values, name=command)
+        return await self.command_long(sysid, compid, mav_cmd, values, name=command)
+
+    async def command_long(self, sysid: int, compid: int, command: int, params: Sequence[float],
+                           name: Optional[str] = None) -> Dict[str, Any]:
+        """Send COMMAND_LONG `command` with param1-7 and wait for its COMMAND_ACK"""
+        params = tuple(params) + (0.0,) * (7 - len(params))
+
+        def frame(attempt: int) -> Tuple:
+            return params + (command, sysid, compid, min(attempt, 255))
+        return await self._execute(COMMAND_LONG, command, (sysid, compid), frame, name or str(command))
+
+    async def command_int(self, sysid: int, compid: int, command: int, params: Sequence[float],
+                          frame: int = MAV_FRAME_GLOBAL_RELATIVE_ALT_INT,
+                          name: Optional[str] = None) -> Dict[str, Any]:
+        """Send COMMAND_INT `command` and wait for its COMMAND_ACK
+
+        `params` are param1-7 as for command_long; param5/6 (latitude and
+        longitude in degrees) are sent as degE7 integers.
+        """
+        p = tuple(params) + (0.0,) * (7 - len(params))
+        values = (p[0], p[1], p[2], p[3], int(round(p[4] * 1e7)), int(round(p[5] * 1e7)), p[6],
+                  command, sysid, compid, frame, 0, 0)
+        return await self._execute(COMMAND_INT, command, (sysid, compid), lambda attempt: values,
+                                   name or str(command))
+
+    async def set_mode(self, sysid: int, compid: int, mode: str, legacy: bool = False) -> Dict[str, Any]:
+        """Change flight mode; `legacy` uses the SET_MODE message for autopilots without DO_SET_MODE"""
+        if not legacy:
+            return await self.send_command(sysid, compid, 'SET_MODE', {'mode': mode})
+        if mode not in MODE_NUMBERS:
+            return self._result('SET_MODE', (sysid, compid), 'INVALID', 0, error=f"unknown mode {mode}")
+        values = (MODE_NUMBERS[mode], sysid, MAV_MODE_FLAG_CUSTOM_MODE_ENABLED)
+        # ArduPilot acks the SET_MODE message with COMMAND_ACK.command = its message id
+        return await self._execute(SET_MODE, SET_MODE, (sysid, compid), lambda attempt: values, 'SET_MODE')
+
+    def submit(self, sysid: int, compid: int, command: str,
+               params: Optional[Dict[str, Any]] = None) -> asyncio.Future:
+        """Start a command in the background"""
+        return asyncio.ensure_future(self.send_command(sysid, compid, command, params))
+
+    async def _execute(self, msg_id: int, command: int, key: VehicleKey, values: Callable[[int], Tuple],
+                       name: str) -> Dict[str, Any]:
+        inflight_key = (key[0], command)
+        lock = self._locks.get(inflight_key)
+        if lock is None:
+            lock = self._locks[inflight_key] = asyncio.Lock()
+        async with lock:
+            entry = self.inflight[inflight_key] = InflightCommand()
+            try:
+                for attempt in range(self.retries + 1):
+                    if not self._send(msg_id, values(attempt)):
+                        return self._result(name, key, 'NO_LINK', attempt)
+                    if attempt:
+                        self.retransmits += 1
+                    try:
+                        result = await asyncio.wait_for(asyncio.shield(entry.future),
+                                                        self.timeout * self.backoff ** attempt)
+                    except asyncio.TimeoutError:
+                        if not entry.in_progress:
+                            continue
+                        try:
+                            result = await asyncio.wait_for(asyncio.shield(entry.future), self.progress_timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    elapsed = time.perf_counter() - entry.sent
+                    if self._latency is not None:
+                        self._latency.record(elapsed)
+                    return self._result(name, key, RESULT_NAMES.get(result, str(result)), attempt + 1,
+                                        latency=elapsed)
+                self.timeouts += 1
+                logger.warning(f"⏱️ Command {name} to {vehicle_id(key)} timed out")
+                return self._result(name, key, 'TIMEOUT', self.retries + 1)
+            finally:
+                del self.inflight[inflight_key]
+
+    def _send(self, msg_id: int, values: Tuple) -> bool:
+        frame = encode_frame(msg_id, values, sysid=self.sysid, compid=self.compid, seq=self._seq)
+        self._seq = (self._seq + 1) & 0xFF
+        if self.send(frame) is False:
+            return False
+        self.sent += 1
+        return True
+
+    def _result(self, name: str, key: VehicleKey, result: str, attempts: int,
+                latency: Optional[float] = None, error: Optional[str] = None) -> Dict[str, Any]:
+        self.results[result] = self.results.get(result, 0) + 1
+        outcome = {
+            'command': name,
+            'vehicle_id': vehicle_id(key),
+            'result': result,
+            'success': result == 'ACCEPTED',
+            'attempts': attempts,
+            'latency_ms': round(latency * 1000.0, 3) if latency is not None else None
+        }
+        if error:
+            outcome['error'] = error
+        return outcome
+
+    def _on_ack(self, state: TelemetryState, v: Tuple):
+        command, result, progress, _, target_system, _ = v
+        # v1 acks have no target; others may be for another GCS
+        if target_system not in (0, self.sysid):
+            return
+        entry = self.inflight.get((state.sysid, command))
+        if entry is None or entry.future.done():
+            self.unmatched_acks += 1
+            return
+        if result == MAV_RESULT_IN_PROGRESS:
+            entry.in_progress = True
+            entry.progress = progress
+            return
+        self.acked += 1
+        entry.future.set_result(result)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            'inflight': len(self.inflight),
+            'sent': self.sent,
+            'retransmits': self.retransmits,
+            'acked': self.acked,
+            'timeouts': self.timeouts,
+            'unmatched_acks': self.unmatched_acks,
+            'results': dict(self.results)
+        }
+
+
+class VehicleCommandEndpoint:
+    """Autopilot side for a simulated vehicle: COMMAND_LONG/INT and SET_MODE in, COMMAND_ACK out
+
+    `execute(command, params)` runs a dashboard command and returns
+    whether the vehicle accepted it.
+    """
+
+    def __init__(self, send: Callable[[bytes], Any], sysid: int = 1, compid: int = 1,
+                 execute: Optional[Callable[[str, Dict[str, Any]], bool]] = None):
+        self.send = send
+        self.sysid = sysid
+        self.compid = compid
+        self.execute = execute
+        self._seq = 0
+
+    def routes(self) -> Dict[int, Callable[[TelemetryState, Tuple], None]]:
+        return {COMMAND_LONG: self._on_command_long, COMMAND_INT: self._on_command_int,
+                SET_MODE: self._on_set_mode}
+
+    def _ack(self, peer: TelemetryState, command: int, result: int):
+        frame = encode_frame(COMMAND_ACK, (command, result, 0, 0, peer.sysid, peer.compid),
+                             sysid=self.sysid, compid=self.compid, seq=self._seq)
+        self._seq = (self._seq + 1) & 0xFF
+        self.send(frame)
+
+    def _run(self, command: str, params: Dict[str, Any]) -> int:
+        if self.execute is None:
+            return MAV_RESULT_UNSUPPORTED
+        return MAV_RESULT_ACCEPTED if self.execute(command, params) else MAV_RESULT_FAILED
+
+    def _on_command_long(self, peer: TelemetryState, v: Tuple):
+        command, target_system = v[7], v[8]
+        if target_system not in (0, self.sysid):
+            return
+        decoded = decode_command(command, v[:7])
+        self._ack(peer, command, MAV_RESULT_UNSUPPORTED if decoded is None else self._run(*decoded))
+
+    def _on_command_int(self, peer: TelemetryState, v: Tuple):
+        command, target_system = v[7], v[8]
+        if target_system not in (0, self.sysid):
+            return
+        decoded = decode_command(command, v[:4] + (v[4] / 1e7, v[5] / 1e7, v[6]))
+        self._ack(peer, command, MAV_RESULT_UNSUPPORTED if decoded is None else self._run(*decoded))
+
+    def _on_set_mode(self, peer: TelemetryState, v: Tuple):
+        custom_mode, target_system, _ = v
+        if target_system != self.sysid:
+            return
+        mode = MODE_NAMES.get(custom_mode)
+        self._ack(peer, SET_MODE, MAV_RESULT_UNSUPPORTED if mode is None else self._run('SET_MODE', {'mode': mode}))
@@ -1,72 +1,109 @@
 import time
 import json
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
+from telemetry_store import TelemetryRing
+from telemetry_stats import STAT_FIELDS, WINDOWS, TelemetryStatistics, batch_statistics
+
+DEFAULT_VEHICLE_ID = '1:1'
+
 
 class Database:
-    def __init__(self):
-        self.telemetry_history = []
-        self.latest_telemetry = {}
-        self.max_history_size = 5000  # Keep last 5000 points
+    def __init__(self, history_capacity: int = 36000):
+        # One columnar ring per vehicle, grown as samples arrive (36000 samples = 1 hour at 10 Hz)
+        self.history: Dict[str, TelemetryRing] = {}
+        self.statistics: Dict[str, TelemetryStatistics] = {}
+        self.latest_telemetry: Dict[str, Dict[str, Any]] = {}
+        self.history_capacity = history_capacity
         self.telemetry_count = 0
-    
-    def store_telemetry(self, data: Dict[str, Any]):
+
+    def _ring(self, vehicle_id: str) -> TelemetryRing:
+        ring = self.history.get(vehicle_id)
+        if ring is None:
+            ring = self.history[vehicle_id] = TelemetryRing(self.history_capacity)
+            self.statistics[vehicle_id] = TelemetryStatistics()
+        return ring
+
+    def remove_vehicle(self, vehicle_id: str):
+        """Drop the history, statistics and latest sample of a vehicle that left the fleet"""
+        self.history.pop(vehicle_id, None)
+        self.statistics.pop(vehicle_id, None)
+        self.latest_telemetry.pop(vehicle_id, None)
+
+    def store_telemetry(self, data: Dict[str, Any], vehicle_id: str = DEFAULT_VEHICLE_ID):
         """Store telemetry data in memory"""
         try:
-            # Add timestamp if not present
-            if 'timestamp' not in data:
-                data['timestamp'] = time.time()
-            
-            # Update latest telemetry
-            self.latest_telemetry = data.copy()
-            
-            # Add to history
-            self.telemetry_history.append(data.copy())
+            timestamp = data.get('timestamp') or time.time()
+
+            # Latest sample keeps every field (including text like mode); history keeps numeric columns
+            self.latest_telemetry[vehicle_id] = data
+            self._ring(vehicle_id).append(timestamp, data)
+            self.statistics[vehicle_id].add(timestamp, data)
             self.telemetry_count += 1
-            
-            # Limit history size
-            if len(self.telemetry_history) > self.max_history_size:
-                self.telemetry_history.pop(0)
-                
+
         except Exception as e:
             print(f"❌ Error storing telemetry: {e}")
-    
-    def get_latest_telemetry(self) -> Dict[str, Any]:
+
+    def get_latest_telemetry(self, vehicle_id: str = DEFAULT_VEHICLE_ID) -> Dict[str, Any]:
         """Get latest telemetry data"""
-        return self.latest_telemetry.copy()
-    
-    def get_telemetry_history(self, hours: int = 1) -> List[Dict[str, Any]]:
+        return dict(self.latest_telemetry.get(vehicle_id, {}))
+
+    def get_telemetry_history(self, hours: float = 1, vehicle_id: str = DEFAULT_VEHICLE_ID) -> List[Dict[str, Any]]:
         """Get telemetry history for last N hours"""
-        cutoff_time = time.time() - (hours * 3600)
-        
-        return [
-            data for data in self.telemetry_history 
-            if data.get('timestamp', 0) >= cutoff_time
-        ]
-    
+        ring = self.history.get(vehicle_id)
+        if ring is None:
+            return []
+        return ring.rows(start=time.time() - (hours * 3600))
+
+    def get_telemetry_range(self, start: Optional[float] = None, end: Optional[float] = None,
+                            vehicle_id: str = DEFAULT_VEHICLE_ID,
+                            fields: Optional[List[str]] = None) -> Dict[str, List[float]]:
+        """Get a time range as columns: {'timestamp': [...], field: [...]}"""
+        ring = self.history.get(vehicle_id)
+        if ring is None:
+            return {}
+        return {name: column.tolist() for name, column in ring.columns_for(start, end, fields).items()}
+
     def get_telemetry_count(self) -> int:
         """Get total number of telemetry updates"""
         return self.telemetry_count
-    
-    def get_statistics(self) -> Dict[str, Any]:
-        """Get telemetry statistics"""
-        if not self.telemetry_history:
+
+    def get_statistics(self, vehicle_id: str = DEFAULT_VEHICLE_ID, window: str = '1h') -> Dict[str, Any]:
+        """Get telemetry statistics from the incremental rolling aggregates"""
+        stats = self.statistics.get(vehicle_id)
+        if stats is None or window not in WINDOWS:
             return {}
-        
-        recent_data = self.get_telemetry_history(hours=1)
-        if not recent_data:
+
+        fields = stats.query(window, now=time.time())
+        if not fields['alt']['count']:
             return {}
-        
-        altitudes = [d.get('alt', 0) for d in recent_data]
-        speeds = [d.get('groundspeed', 0) for d in recent_data]
-        voltages = [d.get('battery_voltage', 0) for d in recent_data]
-        
+
         return {
             'total_updates': self.telemetry_count,
-            'recent_updates': len(recent_data),
-            'avg_altitude': sum(altitudes) / len(altitudes) if altitudes else 0,
-            'max_altitude': max(altitudes) if altitudes else 0,
-            'avg_speed': sum(speeds) / len(speeds) if speeds else 0,
-            'max_speed': max(speeds) if speeds else 0,
-            'avg_voltage': sum(voltages) / len(voltages) if voltages else 0,
-        }
\ No newline at end of file
+            'recent_updates': fields['alt']['count'],
+            'window': window,
+            'avg_altitude': fields['alt']['mean'],
+            'max_altitude': fields['alt']['max'],
+            'avg_speed': fields['groundspeed']['mean'],
+            'max_speed': fields['groundspeed']['max'],
+            'avg_voltage': fields['voltage_battery']['mean'],
+            'fields': fields
+        }
+
+    def get_range_statistics(self, start: Optional[float] = None, end: Optional[float] = None,
+                             vehicle_id: str = DEFAULT_VEHICLE_ID,
+                             fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Recompute statistics for an arbitrary time range over the stored columns (NumPy)"""
+        ring = self.history.get(vehicle_id)
+        if ring is None:
+            return {}
+        fields = fields or list(STAT_FIELDS)
+        return batch_statistics(ring.numpy_columns(start, end, fields), fields)
+
+    def get_memory_usage(self) -> Dict[str, Any]:
+        """Allocated history bytes per vehicle"""
+        return {
+            vehicle_id: {'samples': len(ring), 'capacity': ring.capacity, 'allocated': ring.allocated,
+                         'bytes': ring.memory_bytes()}
+            for vehicle_id, ring in self.history.items()
+        }
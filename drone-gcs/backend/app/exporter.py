@@ -0,0 +1,444 @@
+"""
+Batched telemetry export to a time-series sink
+Points are accumulated into size- and time-bounded batches, written as
+InfluxDB line protocol over keep-alive HTTP connections by worker threads,
+retried with jittered backoff and spilled to disk when the sink falls behind
+
+Usage (local stand-in for InfluxDB):
+    python app/exporter.py serve --port 8087 --out exported.lp [--fail-rate 0.2] [--delay 0.5]
+    EXPORT_SINK=influx INFLUX_URL=http://127.0.0.1:8087 python app/main.py
+"""
+import argparse
+import asyncio
+import gzip
+import http.client
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+from telemetry_store import HISTORY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+MEASUREMENT = 'telemetry'
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Outcomes of one batch write
+WRITTEN, REJECTED, FAILED = 'written', 'rejected', 'failed'
+
+
+class SinkError(Exception):
+    """Write failed; `retryable` tells the exporter whether to try again"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _escape_tag(value: str) -> str:
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def format_line(vehicle_id: str, timestamp: float, telemetry: Dict[str, Any],
+                measurement: str = MEASUREMENT) -> Optional[str]:
+    """One line-protocol point; numeric fields are always written as floats to keep field types stable"""
+    fields = []
+    for name in HISTORY_FIELDS:
+        value = telemetry.get(name)
+        if value is None or value.__class__ is str or value != value:
+            continue
+        fields.append(f"{name}={float(value)!r}")
+    mode = telemetry.get('mode')
+    if mode.__class__ is str:
+        fields.append('mode="' + mode.replace('\\', '\\\\').replace('"', '\\"') + '"')
+    if not fields:
+        return None
+    return f"{measurement},vehicle={_escape_tag(vehicle_id)} {','.join(fields)} {int(timestamp * 1e9)}"
+
+
+class FileSink:
+    """Local stand-in sink: appends line protocol to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, body: bytes):
+        with self._lock, open(self.path, 'ab') as handle:
+            handle.write(body)
+
+    def close(self):
+        pass
+
+    def describe(self) -> str:
+        return f"file:{self.path}"
+
+
+class InfluxSink:
+    """InfluxDB 2.x /api/v2/write over one keep-alive connection per worker thread"""
+
+    def __init__(self, url: str, org: str, bucket: str, token: str = '', timeout: float = 10.0,
+                 compress: bool = True):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme or 'http'
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or (443 if self.scheme == 'https' else 8086)
+        self.path = f"{parts.path.rstrip('/')}/api/v2/write?org={quote(org)}&bucket={quote(bucket)}&precision=ns"
+        self.token = token
+        self.timeout = timeout
+        self.compress = compress
+        self._local = threading.local()
+        self._connections: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            connection = cls(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def write(self, body: bytes):
+        headers = {'Content-Type': 'text/plain; charset=utf-8'}
+        if self.token:
+            headers['Authorization'] = f"Token {self.token}"
+        if self.compress:
+            body = gzip.compress(body, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+
+        connection = self._connection()
+        try:
+            connection.request('POST', self.path, body=body, headers=headers)
+            response = connection.getresponse()
+            detail = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            # Drop the broken connection; the next attempt reconnects
+            connection.close()
+            raise SinkError(f"connection error: {e}")
+
+        if response.status >= 300:
+            raise SinkError(f"HTTP {response.status}: {detail[:200]!r}",
+                            retryable=response.status in RETRYABLE_STATUS)
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def describe(self) -> str:
+        return f"influx:{self.scheme}://{self.host}:{self.port}"
+
+
+class TelemetryExporter:
+    """Batching exporter fed from the telemetry pipeline
+
+    `export()` only appends to the open batch. A batch is handed to the
+    worker threads when it reaches `batch_size` points or `flush_interval`
+    seconds (see `flush_due()`). If more than `max_pending` batches are waiting
+    the batch goes to a spill thread that writes it to `spill_dir`, so
+    neither formatting nor disk I/O happens on the event loop; spilled
+    batches are replayed once the sink accepts writes again.
+    """
+
+    def __init__(self, sink, batch_size: int = 5000, flush_interval: float = 1.0,
+                 max_pending: int = 8, workers: int = 1, spill_dir: str = 'export_spill',
+                 max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.workers = workers
+        self.spill_dir = spill_dir
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._batch: List[Tuple[str, float, Dict[str, Any]]] = []
+        self._batch_started = 0.0
+        self._queue: queue.Queue = queue.Queue(max_pending)
+        # Overflow batches waiting for the spill thread; dropped when even the disk falls behind
+        self._spill_queue: queue.Queue = queue.Queue(max_pending * 4)
+        self._threads: List[threading.Thread] = []
+        self._spill_thread: Optional[threading.Thread] = None
+        self._spill_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._spill_seq = 0
+
+        # Exporter counters
+        self.points = 0
+        self.batches_written = 0
+        self.points_written = 0
+        self.bytes_written = 0
+        self.retries = 0
+        self.rejected_batches = 0
+        self.spilled_batches = 0
+        self.dropped_batches = 0
+        self.replayed_batches = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """Start the worker threads"""
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run_worker, name=f'exporter-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._spill_thread = threading.Thread(target=self._run_spill, name='exporter-spill', daemon=True)
+        self._spill_thread.start()
+        logger.info(f"📤 Telemetry export to {self.sink.describe()} "
+                    f"(batch {self.batch_size} points / {self.flush_interval}s)")
+
+    def export(self, vehicle_id: str, timestamp: float, telemetry: Dict[str, Any]):
+        """Add one point to the open batch (cheap; formatting happens on the workers)"""
+        if not self._batch:
+            self._batch_started = time.monotonic()
+        self._batch.append((vehicle_id, timestamp, telemetry))
+        self.points += 1
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the open batch to the workers, or to the spill thread if they are saturated"""
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            try:
+                self._spill_queue.put_nowait(batch)
+            except queue.Full:
+                self.dropped_batches += 1
+                self.last_error = 'spill queue full, batch dropped'
+
+    def flush_due(self):
+        """Time bound: flush a partially filled batch once it is `flush_interval` old"""
+        if self._batch and time.monotonic() - self._batch_started >= self.flush_interval:
+            self.flush()
+
+    async def run(self):
+        """Call flush_due() every `flush_interval` (when not driven by the scheduler)"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush_due()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush what is left, then stop the workers and close the sink"""
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._spill_thread is not None:
+            self._spill_queue.put(None)
+            self._spill_thread.join(timeout)
+            self._spill_thread = None
+        self.sink.close()
+
+    def _encode(self, batch) -> bytes:
+        lines = [format_line(vid, timestamp, telemetry) for vid, timestamp, telemetry in batch]
+        return ('\n'.join(line for line in lines if line) + '\n').encode()
+
+    def _run_worker(self):
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._replay_spill()
+                continue
+            if batch is None:
+                return
+            body = self._encode(batch)
+            status = self._write(body)
+            if status == WRITTEN:
+                self.points_written += len(batch)
+                self._replay_spill()
+            elif status == FAILED:
+                self._spill(body)
+
+    def _run_spill(self):
+        while True:
+            batch = self._spill_queue.get()
+            if batch is None:
+                return
+            try:
+                self._spill(self._encode(batch))
+            except OSError as e:
+                self.dropped_batches += 1
+                self.last_error = str(e)
+                logger.error(f"❌ Export spill failed: {e}")
+
+    def _write(self, body: bytes) -> str:
+        """Write one batch with jittered exponential backoff
+
+        Returns WRITTEN, REJECTED (refused by the sink; neither retried nor
+        counted as written) or FAILED (to be spilled).
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sink.write(body)
+                self.batches_written += 1
+                self.bytes_written += len(body)
+                return WRITTEN
+            except SinkError as e:
+                self.last_error = str(e)
+                if not e.retryable:
+                    # The sink refused the data itself; retrying or spilling would not help
+                    self.rejected_batches += 1
+                    logger.error(f"❌ Export batch rejected: {e}")
+                    return REJECTED
+            except Exception as e:
+                self.last_error = str(e)
+            if attempt < self.max_retries:
+                self.retries += 1
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+        logger.warning(f"⚠️ Export sink unavailable ({self.last_error}), spilling batch to disk")
+        return FAILED
+
+    def _spill(self, body: bytes):
+        with self._spill_lock:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._spill_seq += 1
+            name = f"spill-{time.time_ns()}-{self._spill_seq:06d}.lp"
+            with open(os.path.join(self.spill_dir, name), 'wb') as handle:
+                handle.write(body)
+            self.spilled_batches += 1
+
+    def _spill_files(self) -> List[str]:
+        if not os.path.isdir(self.spill_dir):
+            return []
+        return sorted(name for name in os.listdir(self.spill_dir) if name.endswith('.lp'))
+
+    def _replay_spill(self):
+        """Re-send spilled batches oldest first
+
+        Stops at the first retryable or transport failure; a file the sink
+        rejects is renamed to *.rejected and replay moves on.
+        """
+        if not self._replay_lock.acquire(blocking=False):
+            return  # another worker is replaying
+        try:
+            for name in self._spill_files():
+                path = os.path.join(self.spill_dir, name)
+                with open(path, 'rb') as handle:
+                    body = handle.read()
+                try:
+                    self.sink.write(body)
+                except SinkError as e:
+                    self.last_error = str(e)
+                    if e.retryable:
+                        return
+                    # Refused by the sink: set it aside so it does not block the files behind it
+                    self.rejected_batches += 1
+                    logger.error(f"❌ Spilled export batch {name} rejected: {e}")
+                    os.replace(path, path + '.rejected')
+                    continue
+                except Exception as e:
+                    self.last_error = str(e)
+                    return
+                os.remove(path)
+                self.batches_written += 1
+                self.bytes_written += len(body)
+                self.replayed_batches += 1
+        finally:
+            self._replay_lock.release()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get exporter counters"""
+        return {
+            'sink': self.sink.describe(),
+            'points': self.points,
+            'points_written': self.points_written,
+            'open_batch': len(self._batch),
+            'pending_batches': self._queue.qsize(),
+            'batches_written': self.batches_written,
+            'bytes_written': self.bytes_written,
+            'retries': self.retries,
+            'rejected_batches': self.rejected_batches,
+            'spilled_batches': self.spilled_batches,
+            'spill_queue': self._spill_queue.qsize(),
+            'dropped_batches': self.dropped_batches,
+            'spill_files': len(self._spill_files()),
+            'replayed_batches': self.replayed_batches,
+            'last_error': self.last_error
+        }
+
+
+def exporter_from_env() -> Optional[TelemetryExporter]:
+    """Build the exporter from EXPORT_SINK=influx|file (unset or 'off' disables export)"""
+    kind = os.environ.get('EXPORT_SINK', 'off')
+    if kind == 'influx':
+        sink = InfluxSink(
+            os.environ.get('INFLUX_URL', 'http://influxdb:8086'),
+            os.environ.get('INFLUX_ORG', 'urbanmirtalx'),
+            os.environ.get('INFLUX_BUCKET', 'telemetry'),
+            os.environ.get('INFLUX_TOKEN', '')
+        )
+    elif kind == 'file':
+        sink = FileSink(os.environ.get('EXPORT_FILE', 'telemetry.lp'))
+    else:
+        return None
+    return TelemetryExporter(
+        sink,
+        batch_size=int(os.environ.get('EXPORT_BATCH_SIZE', '5000')),
+        flush_interval=float(os.environ.get('EXPORT_FLUSH_INTERVAL', '1.0')),
+        spill_dir=os.environ.get('EXPORT_SPILL_DIR', 'export_spill')
+    )
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Accepts /api/v2/write like InfluxDB and appends the points to a file"""
+
+    protocol_version = 'HTTP/1.1'
+    out_path = 'exported.lp'
+    fail_rate = 0.0
+    delay = 0.0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.delay:
+            time.sleep(self.delay)
+        if not self.path.startswith('/api/v2/write'):
+            self.send_response(404)
+        elif random.random() < self.fail_rate:
+            self.send_response(503)
+        else:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            with self.lock, open(self.out_path, 'ab') as handle:
+                handle.write(body)
+            self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DroneNova telemetry export tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help='Run a local InfluxDB write stand-in')
+    serve.add_argument('--port', type=int, default=8087)
+    serve.add_argument('--out', default='exported.lp')
+    serve.add_argument('--fail-rate', type=float, default=0.0, help='fraction of writes answered with 503')
+    serve.add_argument('--delay', type=float, default=0.0, help='seconds to stall each write')
+    args = parser.parse_args()
+
+    _StandInHandler.out_path = args.out
+    _StandInHandler.fail_rate = args.fail_rate
+    _StandInHandler.delay = args.delay
+    server = ThreadingHTTPServer(('0.0.0.0', args.port), _StandInHandler)
+    print(f"🧪 Influx stand-in on :{args.port}, writing to {args.out}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
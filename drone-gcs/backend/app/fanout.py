@@ -0,0 +1,269 @@
+"""
+Serialize-once WebSocket fan-out
+Every client gets its own bounded send queue and writer task so one slow
+link never stalls the broadcast for everyone else
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Payload = Union[str, bytes]
+
+
+class Frame:
+    """An already-serialized message shared by every recipient"""
+
+    __slots__ = ('payload', 'topic', 'reliable', 'created', 'origin')
+
+    def __init__(self, payload: Payload, topic: Optional[str] = None, reliable: bool = False,
+                 origin: Optional[float] = None):
+        self.payload = payload
+        self.topic = topic
+        self.reliable = reliable or topic is None
+        self.created = time.monotonic()
+        # Wall-clock time the data was received (for end-to-end latency)
+        self.origin = origin
+
+
+class ClientChannel:
+    """Per-client send queue drained by its own writer task
+
+    Topic frames (telemetry, network status) are latest-value-wins: a new
+    frame replaces an unsent one with the same topic. Reliable frames
+    (command acks, personal replies) are queued in order and sent first;
+    if more than `max_reliable` pile up the client is disconnected.
+    Transports with a separate reliable path (WebRTC data channels) pass
+    it as `send_reliable`; topic frames then go through `send`.
+    """
+
+    def __init__(self, key: Hashable, send: Callable[[Payload], Awaitable[Any]],
+                 on_close: Optional[Callable[['ClientChannel'], None]] = None,
+                 max_reliable: int = 256, latency: Optional[Dict[str, Any]] = None,
+                 send_reliable: Optional[Callable[[Payload], Awaitable[Any]]] = None):
+        self.key = key
+        self.send = send
+        self.send_reliable = send_reliable or send
+        self.on_close = on_close
+        self.max_reliable = max_reliable
+        self.latest: Dict[str, Frame] = {}
+        self.reliable: deque = deque()
+        self.closed = False
+        self.encoding = 'json'
+        self.context: Dict[str, Any] = {}
+        # Per-client enqueue/send/end_to_end histograms (LatencyRecorder.client)
+        self.latency = latency
+
+        # Delivery counters
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.max_depth = 0
+        self.last_send_time = 0.0
+        self.send_lag = 0.0
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.reliable) + len(self.latest)
+
+    def offer(self, frame: Frame):
+        """Queue a frame without blocking the caller"""
+        if self.closed:
+            return
+        if frame.reliable:
+            if len(self.reliable) >= self.max_reliable:
+                logger.warning(f"⚠️ Client {self.key} send queue overflow, disconnecting")
+                self.close()
+                return
+            self.reliable.append(frame)
+        else:
+            if self.latest.pop(frame.topic, None) is not None:
+                self.dropped += 1
+            self.latest[frame.topic] = frame
+
+        depth = self.queue_depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self._wakeup.set()
+
+    def _next_frame(self) -> Optional[Frame]:
+        if self.reliable:
+            return self.reliable.popleft()
+        if self.latest:
+            topic = next(iter(self.latest))
+            return self.latest.pop(topic)
+        return None
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                latency = self.latency
+                frame = self._next_frame()
+                while frame is not None:
+                    started = time.monotonic()
+                    await (self.send_reliable if frame.reliable else self.send)(frame.payload)
+                    self.sent += 1
+                    self.bytes_sent += len(frame.payload)
+                    self.last_send_time = time.monotonic()
+                    # Smoothed queue-to-wire delay: grows when the socket pushes back
+                    self.send_lag = self.send_lag * 0.9 + (self.last_send_time - frame.created) * 0.1
+                    if latency is not None:
+                        latency['enqueue'].record(started - frame.created)
+                        latency['send'].record(self.last_send_time - started)
+                        if frame.origin is not None:
+                            latency['end_to_end'].record(time.time() - frame.origin)
+                    frame = self._next_frame()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"🔌 Client {self.key} send failed: {e}")
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the writer and notify the owner once"""
+        if self.closed:
+            return
+        self.closed = True
+        self.latest.clear()
+        self.reliable.clear()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        if self.on_close:
+            self.on_close(self)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Per-client delivery counters"""
+        return {
+            'encoding': self.encoding,
+            'queue_depth': self.queue_depth,
+            'max_depth': self.max_depth,
+            'send_lag': round(self.send_lag, 4),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'bytes_sent': self.bytes_sent
+        }
+
+
+class FanoutHub:
+    """Encode once per encoding, offer the same frame to every client channel
+
+    `encoders` maps a channel's negotiated encoding to a function turning a
+    message dict into a text or bytes payload; JSON is always available.
+    """
+
+    def __init__(self, max_reliable: int = 256,
+                 encoders: Optional[Dict[str, Callable[[Dict], Payload]]] = None,
+                 latency=None):
+        self.max_reliable = max_reliable
+        # Optional LatencyRecorder for serialize and per-client stages
+        self.latency = latency
+        self._serialize_latency = latency.stage('serialize') if latency else None
+        self.encoders: Dict[str, Callable[[Dict], Payload]] = {'json': json.dumps}
+        self.encoders.update(encoders or {})
+        self.clients: Dict[Hashable, ClientChannel] = {}
+        self.frames_published = 0
+
+    def add(self, key: Hashable, send: Callable[[Payload], Awaitable[Any]],
+            encoding: str = 'json', label: Optional[str] = None,
+            send_reliable: Optional[Callable[[Payload], Awaitable[Any]]] = None) -> ClientChannel:
+        """Register a client; `send` takes its text or bytes payloads"""
+        label = label or str(id(key))
+        channel = ClientChannel(key, send, on_close=self._on_close, max_reliable=self.max_reliable,
+                                latency=self.latency.client(label) if self.latency else None,
+                                send_reliable=send_reliable)
+        channel.context['label'] = label
+        channel.encoding = encoding if encoding in self.encoders else 'json'
+        self.clients[key] = channel
+        return channel
+
+    def remove(self, key: Hashable):
+        """Unregister a client and stop its writer"""
+        channel = self.clients.pop(key, None)
+        if channel is not None:
+            channel.close()
+
+    def _on_close(self, channel: ClientChannel):
+        if self.clients.get(channel.key) is channel:
+            del self.clients[channel.key]
+        if self.latency:
+            self.latency.remove_client(channel.context['label'])
+
+    def encode(self, message: Union[Dict, Payload], encoding: str = 'json') -> Payload:
+        """Serialize a message dict with the given encoding; payloads pass through"""
+        if isinstance(message, (str, bytes)):
+            return message
+        if self._serialize_latency is None:
+            return self.encoders.get(encoding, json.dumps)(message)
+        started = time.perf_counter()
+        payload = self.encoders.get(encoding, json.dumps)(message)
+        self._serialize_latency.record(time.perf_counter() - started)
+        return payload
+
+    def publish(self, message: Union[Dict, Payload], topic: Optional[str] = None,
+                reliable: bool = False,
+                predicate: Optional[Callable[[ClientChannel], bool]] = None) -> int:
+        """Serialize once per encoding and queue for every (matching) client; returns recipients"""
+        frames: Dict[str, Frame] = {}
+        recipients = 0
+        for channel in list(self.clients.values()):
+            if predicate is None or predicate(channel):
+                frame = frames.get(channel.encoding)
+                if frame is None:
+                    # Encoded lazily so messages nobody subscribes to cost nothing
+                    frame = Frame(self.encode(message, channel.encoding), topic, reliable)
+                    frames[channel.encoding] = frame
+                    self.frames_published += 1
+                channel.offer(frame)
+                recipients += 1
+        return recipients
+
+    def offer(self, channel: ClientChannel, message: Union[Dict, Payload], topic: Optional[str],
+              cache: Dict[Hashable, Frame], cache_key: Hashable, origin: Optional[float] = None):
+        """Queue a message for one channel, encoding it once per (cache_key, encoding) in `cache`
+
+        Lets callers that build per-client variants (rates, field groups)
+        still share one serialized frame between clients that get the same one.
+        """
+        key = (cache_key, channel.encoding)
+        frame = cache.get(key)
+        if frame is None:
+            frame = cache[key] = Frame(self.encode(message, channel.encoding), topic, origin=origin)
+            self.frames_published += 1
+        channel.offer(frame)
+
+    def send_to(self, key: Hashable, message: Union[Dict, Payload], topic: Optional[str] = None) -> bool:
+        """Queue a personal message for one client (reliable unless a topic is given)"""
+        channel = self.clients.get(key)
+        if channel is None:
+            return False
+        channel.offer(Frame(self.encode(message, channel.encoding), topic))
+        return True
+
+    def close_all(self):
+        """Stop every writer task"""
+        for channel in list(self.clients.values()):
+            channel.close()
+        self.clients.clear()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Aggregate and per-client queue statistics"""
+        clients = {channel.context['label']: channel.get_statistics() for channel in self.clients.values()}
+        return {
+            'clients': len(self.clients),
+            'frames_published': self.frames_published,
+            'total_queue_depth': sum(c['queue_depth'] for c in clients.values()),
+            'per_client': clients
+        }
+
+    def __len__(self) -> int:
+        return len(self.clients)
@@ -0,0 +1,131 @@
+"""
+Multi-vehicle fleet registry
+Demultiplexes MAVLink frames by system/component ID into per-vehicle state slots
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from geoindex import GeoIndex
+from mavlink_codec import MESSAGE_IDS, MessageSpec, TelemetryState
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_ID = MESSAGE_IDS['HEARTBEAT']
+MAV_TYPE_GCS = 6
+# Messages that move a vehicle in the spatial index
+POSITION_IDS = frozenset((MESSAGE_IDS['GPS_RAW_INT'], MESSAGE_IDS['GLOBAL_POSITION_INT']))
+
+VehicleKey = Tuple[int, int]
+
+
+def vehicle_id(key: VehicleKey) -> str:
+    """Public 'sysid:compid' identifier used by the REST and WebSocket APIs"""
+    return f"{key[0]}:{key[1]}"
+
+
+def parse_vehicle_id(vid: str) -> VehicleKey:
+    """Inverse of vehicle_id(); a bare sysid means component 1"""
+    sysid, _, compid = vid.partition(':')
+    return int(sysid), int(compid or 1)
+
+
+def parse_vehicle_filter(value: Optional[str]) -> Optional[Set[str]]:
+    """Parse '1,2:1' into {'1', '2:1'}; None or empty means every vehicle
+
+    A bare sysid matches every component of that system.
+    """
+    if not value:
+        return None
+    return {part.strip() for part in value.split(',') if part.strip()} or None
+
+
+def matches_filter(vid: str, vehicle_filter: Optional[Set[str]]) -> bool:
+    """Check a 'sysid:compid' identifier against a parsed vehicle filter"""
+    if vehicle_filter is None:
+        return True
+    return vid in vehicle_filter or vid.split(':', 1)[0] in vehicle_filter
+
+
+class FleetRegistry:
+    """O(1) registry of vehicles keyed by (sysid, compid)
+
+    Vehicles are created on their first heartbeat and evicted when no
+    heartbeat has been seen for `heartbeat_timeout` seconds. Frames from
+    unknown vehicles are dropped until they send a heartbeat. Positions
+    are mirrored into `geo` as they are decoded, for spatial queries.
+    """
+
+    def __init__(self, heartbeat_timeout: float = 5.0, max_vehicles: int = 256,
+                 geo: Optional[GeoIndex] = None):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_vehicles = max_vehicles
+        self.vehicles: Dict[VehicleKey, TelemetryState] = {}
+        self.geo = geo or GeoIndex()
+        self.created = 0
+        self.evicted = 0
+
+    def state_for(self, sysid: int, compid: int, msg_id: int) -> Optional[TelemetryState]:
+        """Decoder hook: return the vehicle's state, creating it on a heartbeat"""
+        state = self.vehicles.get((sysid, compid))
+        if state is None and msg_id == HEARTBEAT_ID and len(self.vehicles) < self.max_vehicles:
+            state = TelemetryState(sysid, compid)
+            self.vehicles[(sysid, compid)] = state
+            self.created += 1
+            logger.info(f"🛩️ Vehicle joined: {sysid}:{compid}. Fleet: {len(self.vehicles)}")
+        return state
+
+    def on_message(self, spec: MessageSpec, state: TelemetryState):
+        """Decoder hook: index new positions and drop other ground stations that announce themselves"""
+        if spec.msg_id in POSITION_IDS:
+            self.geo.update(vehicle_id((state.sysid, state.compid)), state.lat, state.lon)
+        elif spec.msg_id == HEARTBEAT_ID and state.vehicle_type == MAV_TYPE_GCS:
+            self.vehicles.pop((state.sysid, state.compid), None)
+            self.geo.remove(vehicle_id((state.sysid, state.compid)))
+
+    def get(self, sysid: int, compid: int = 1) -> Optional[TelemetryState]:
+        """Look up one vehicle"""
+        return self.vehicles.get((sysid, compid))
+
+    def select(self, vehicle_filter: Optional[Set[str]] = None) -> Iterable[Tuple[str, TelemetryState]]:
+        """Yield (vehicle_id, state) for every vehicle matching the filter"""
+        for key, state in self.vehicles.items():
+            vid = vehicle_id(key)
+            if matches_filter(vid, vehicle_filter):
+                yield vid, state
+
+    def snapshot(self, vehicle_filter: Optional[Set[str]] = None) -> Dict[str, Dict]:
+        """Telemetry dicts for the matching vehicles keyed by vehicle_id"""
+        return {vid: state.to_dict() for vid, state in self.select(vehicle_filter)}
+
+    def evict_stale(self, now: Optional[float] = None) -> List[str]:
+        """Remove vehicles whose last heartbeat is older than the timeout"""
+        if now is None:
+            now = time.time()
+        cutoff = now - self.heartbeat_timeout
+        stale = [key for key, state in self.vehicles.items() if state.last_heartbeat < cutoff]
+        for key in stale:
+            del self.vehicles[key]
+            self.geo.remove(vehicle_id(key))
+            self.evicted += 1
+            logger.info(f"🗑️ Vehicle lost (heartbeat timeout): {vehicle_id(key)}. Fleet: {len(self.vehicles)}")
+        return [vehicle_id(key) for key in stale]
+
+    async def run_eviction(self, interval: float = 1.0):
+        """Periodically evict vehicles that stopped sending heartbeats"""
+        while True:
+            self.evict_stale()
+            await asyncio.sleep(interval)
+
+    def get_statistics(self) -> Dict:
+        """Get fleet counters"""
+        return {
+            'vehicles': len(self.vehicles),
+            'created': self.created,
+            'evicted': self.evicted,
+            'geo': self.geo.get_statistics(),
+            'vehicle_ids': [vehicle_id(key) for key in self.vehicles]
+        }
+
+    def __len__(self) -> int:
+        return len(self.vehicles)
@@ -0,0 +1,478 @@
+"""
+Persistent append-only flight log
+Segment-rotated binary log written by a background thread, with an optional
+tlog-compatible raw MAVLink stream and a memory-mapped reader for
+time-range queries and replay
+
+Usage:
+    python app/flight_log.py info flight_logs
+    python app/flight_log.py replay flight_logs --udp 127.0.0.1:14550 --speed 10
+"""
+import argparse
+import asyncio
+import logging
+import mmap
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from telemetry_store import DOUBLE_FIELDS, FLOAT_FIELDS, HISTORY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+LOG_MAGIC = b'GCSLOG1\n'
+LOG_SUFFIX = '.gcslog'
+TLOG_SUFFIX = '.tlog'
+
+# Record header: f64 timestamp, u8 sysid, u8 compid, u8 kind, u8 reserved, u32 payload length
+RECORD_HEADER = struct.Struct('<dBBBBI')
+KIND_SAMPLE = 0
+KIND_MAVLINK = 1
+
+# Sample payload: telemetry_store column order, lat/lon as f64 and the rest as f32
+SAMPLE_STRUCT = struct.Struct('<' + 'd' * len(DOUBLE_FIELDS) + 'f' * len(FLOAT_FIELDS))
+NAN = float('nan')
+
+# tlog record: big-endian microsecond timestamp followed by one raw MAVLink frame
+TLOG_TIMESTAMP = struct.Struct('>Q')
+
+
+def _sample_values(sample: Dict[str, Any]) -> List[float]:
+    values = []
+    for name in HISTORY_FIELDS:
+        value = sample.get(name)
+        values.append(NAN if value is None or value.__class__ is str else float(value))
+    return values
+
+
+def _split_vehicle_id(vehicle_id: str) -> Tuple[int, int]:
+    sysid, _, compid = vehicle_id.partition(':')
+    return int(sysid), int(compid or 1)
+
+
+class FlightLogWriter:
+    """Background writer for rotating flight log segments
+
+    `write_sample()` and `write_frame()` only enqueue; packing, writing,
+    fsync and rotation happen on the writer thread. Data is fsynced at
+    most every `fsync_interval` seconds (or after `fsync_bytes`), trading
+    a bounded loss window for far fewer disk flushes. On every rotation
+    the oldest closed segments are deleted while the directory holds more
+    than `max_bytes` (0 = unlimited).
+    """
+
+    def __init__(self, directory: str = 'flight_logs', segment_bytes: int = 16 * 1024 * 1024,
+                 segment_seconds: float = 3600.0, fsync_interval: float = 1.0,
+                 fsync_bytes: int = 4 * 1024 * 1024, tlog: bool = False, max_queue: int = 100000,
+                 max_bytes: int = 0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes = fsync_bytes
+        self.tlog = tlog
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._files: Dict[str, Any] = {}
+        self._segment_started: Dict[str, float] = {}
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        # Writer counters
+        self.records = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.segments = 0
+        self.fsyncs = 0
+        self.segments_deleted = 0
+
+    def start(self):
+        """Start the writer thread"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='flight-log-writer', daemon=True)
+        self._thread.start()
+        logger.info(f"💾 Flight log writing to {os.path.abspath(self.directory)}")
+
+    def write_sample(self, vehicle_id: str, timestamp: float, sample: Dict[str, Any]):
+        """Enqueue one telemetry sample (non-blocking; dropped if the writer is far behind)"""
+        self._put((KIND_SAMPLE, timestamp, vehicle_id, sample))
+
+    def write_frame(self, frame: bytes, timestamp: float, sysid: int, compid: int):
+        """Enqueue one raw MAVLink frame"""
+        self._put((KIND_MAVLINK, timestamp, (sysid, compid), frame))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self, timeout: float = 5.0):
+        """Flush, fsync and close all segments"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            try:
+                while len(batch) < 4096:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = False
+            for entry in batch:
+                if entry is None:
+                    stop = True
+                    continue
+                try:
+                    self._write(entry)
+                except Exception as e:
+                    logger.error(f"❌ Flight log write error: {e}")
+
+            now = time.monotonic()
+            if stop or self._unsynced >= self.fsync_bytes or now - self._last_sync >= self.fsync_interval:
+                self._sync()
+            if stop:
+                for handle in self._files.values():
+                    handle.close()
+                self._files.clear()
+                return
+
+    def _write(self, entry):
+        kind, timestamp, source, payload = entry
+        if kind == KIND_SAMPLE:
+            sysid, compid = _split_vehicle_id(source)
+            body = SAMPLE_STRUCT.pack(*_sample_values(payload))
+            data = RECORD_HEADER.pack(timestamp, sysid, compid, KIND_SAMPLE, 0, len(body)) + body
+            stream = 'log'
+        elif self.tlog:
+            data = TLOG_TIMESTAMP.pack(int(timestamp * 1e6)) + payload
+            stream = 'tlog'
+        else:
+            sysid, compid = source
+            data = RECORD_HEADER.pack(timestamp, sysid, compid, KIND_MAVLINK, 0, len(payload)) + payload
+            stream = 'log'
+
+        handle = self._segment(stream, timestamp, len(data))
+        handle.write(data)
+        self.records += 1
+        self.bytes_written += len(data)
+        self._unsynced += len(data)
+
+    def _segment(self, stream: str, timestamp: float, incoming: int):
+        """Current segment for a stream, rotating on size or age"""
+        handle = self._files.get(stream)
+        if handle is not None:
+            too_big = handle.tell() + incoming > self.segment_bytes
+            too_old = timestamp - self._segment_started[stream] >= self.segment_seconds
+            if not (too_big or too_old):
+                return handle
+            self._sync()
+            handle.close()
+
+        suffix = TLOG_SUFFIX if stream == 'tlog' else LOG_SUFFIX
+        name = f"flight-{int(timestamp * 1000):013d}-{self.segments:04d}{suffix}"
+        handle = open(os.path.join(self.directory, name), 'ab', buffering=1024 * 1024)
+        if stream == 'log':
+            handle.write(LOG_MAGIC)
+        self._files[stream] = handle
+        self._segment_started[stream] = timestamp
+        self.segments += 1
+        if self.max_bytes:
+            self._enforce_retention()
+        return handle
+
+    def _enforce_retention(self):
+        """Delete the oldest closed segments until the directory fits in max_bytes"""
+        open_paths = {os.path.abspath(handle.name) for handle in self._files.values()}
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(LOG_SUFFIX) or name.endswith(TLOG_SUFFIX):
+                path = os.path.join(self.directory, name)
+                segments.append((path, os.path.getsize(path)))
+        total = sum(size for _, size in segments)
+        for path, size in segments:
+            if total <= self.max_bytes:
+                break
+            if os.path.abspath(path) in open_paths:
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not delete flight log segment {path}: {e}")
+                continue
+            total -= size
+            self.segments_deleted += 1
+            logger.info(f"🗑️ Flight log retention removed {os.path.basename(path)}")
+
+    def _sync(self):
+        for handle in self._files.values():
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.fsyncs += 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get writer counters"""
+        return {
+            'directory': self.directory,
+            'tlog': self.tlog,
+            'records': self.records,
+            'bytes_written': self.bytes_written,
+            'queued': self._queue.qsize(),
+            'dropped': self.dropped,
+            'segments': self.segments,
+            'fsyncs': self.fsyncs,
+            'max_bytes': self.max_bytes,
+            'segments_deleted': self.segments_deleted
+        }
+
+
+class LogSegment:
+    """One memory-mapped segment with a record index
+
+    The index only ever grows: when the file does, `extend()` remaps it
+    and indexes from the end of the last complete record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tlog = path.endswith(TLOG_SUFFIX)
+        self._file = open(path, 'rb')
+        self._map = None
+        self.view = memoryview(b'')
+        self.timestamps = array('d')
+        self.offsets = array('Q')
+        # End of the last complete record (None until the header checks out)
+        self._indexed: Optional[int] = 0 if self.tlog else None
+        self.extend()
+
+    def size(self) -> int:
+        return os.fstat(self._file.fileno()).st_size
+
+    def extend(self):
+        """Map whatever the file has grown to and index the new records"""
+        size = self.size()
+        if size == len(self.view):
+            return
+        self.view.release()
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.view = memoryview(self._map) if self._map is not None else memoryview(b'')
+        self._build_index()
+
+    def _build_index(self):
+        view = self.view
+        n = len(view)
+        if self.tlog:
+            pos = self._indexed
+            while pos + 8 + 8 <= n:
+                length = _mavlink_frame_length(view, pos + 8)
+                if length is None or pos + 8 + length > n:
+                    break
+                self.timestamps.append(TLOG_TIMESTAMP.unpack_from(view, pos)[0] / 1e6)
+                self.offsets.append(pos)
+                pos += 8 + length
+            self._indexed = pos
+            return
+
+        if self._indexed is None:
+            if n < len(LOG_MAGIC) or bytes(view[:len(LOG_MAGIC)]) != LOG_MAGIC:
+                return
+            self._indexed = len(LOG_MAGIC)
+        pos = self._indexed
+        header_size = RECORD_HEADER.size
+        while pos + header_size <= n:
+            timestamp, _, _, _, _, length = RECORD_HEADER.unpack_from(view, pos)
+            if pos + header_size + length > n:
+                break  # record still being written, or a torn tail from a crash
+            self.timestamps.append(timestamp)
+            self.offsets.append(pos)
+            pos += header_size + length
+        self._indexed = pos
+
+    def record(self, index: int) -> Tuple[float, int, int, int, memoryview]:
+        """(timestamp, sysid, compid, kind, payload view) without copying"""
+        pos = self.offsets[index]
+        if self.tlog:
+            length = _mavlink_frame_length(self.view, pos + 8)
+            frame = self.view[pos + 8:pos + 8 + length]
+            sysid, compid = _mavlink_frame_source(frame)
+            return self.timestamps[index], sysid, compid, KIND_MAVLINK, frame
+        timestamp, sysid, compid, kind, _, length = RECORD_HEADER.unpack_from(self.view, pos)
+        start = pos + RECORD_HEADER.size
+        return timestamp, sysid, compid, kind, self.view[start:start + length]
+
+    def range(self, start: Optional[float], end: Optional[float]) -> range:
+        """Record indices with start <= timestamp <= end (binary search)"""
+        lo = 0 if start is None else bisect_left(self.timestamps, start)
+        hi = len(self.timestamps) if end is None else bisect_right(self.timestamps, end)
+        return range(lo, hi)
+
+    def close(self):
+        self.view.release()
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+def _mavlink_frame_length(view, pos: int) -> Optional[int]:
+    if pos + 2 > len(view):
+        return None
+    stx = view[pos]
+    if stx == 0xFD:
+        signed = pos + 2 < len(view) and view[pos + 2] & 0x01
+        return 12 + view[pos + 1] + (13 if signed else 0)
+    if stx == 0xFE:
+        return 8 + view[pos + 1]
+    return None
+
+
+def _mavlink_frame_source(frame) -> Tuple[int, int]:
+    if frame[0] == 0xFD:
+        return frame[5], frame[6]
+    return frame[3], frame[4]
+
+
+class FlightLogReader:
+    """Zero-copy time-range queries and replay over the segments in a directory
+
+    `query()` refreshes and reads under a lock so it can run in an executor
+    thread instead of on the event loop.
+    """
+
+    def __init__(self, directory: str = 'flight_logs'):
+        self.directory = directory
+        self.segments: List[LogSegment] = []
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Map new segments and index only what was appended to known ones"""
+        if not os.path.isdir(self.directory):
+            return
+        current = {segment.path: segment for segment in self.segments}
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.endswith(LOG_SUFFIX) or name.endswith(TLOG_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            segment = current.pop(path, None)
+            if segment is not None:
+                segment.extend()
+            segments.append(segment or LogSegment(path))
+        for segment in current.values():
+            segment.close()  # removed by retention
+        self.segments = segments
+
+    def query(self, method: str, *args) -> Any:
+        """refresh() then one read method, e.g. query('samples', start, end, vehicle_id)"""
+        with self._lock:
+            self.refresh()
+            return getattr(self, method)(*args)
+
+    def records(self, start: Optional[float] = None, end: Optional[float] = None,
+                kind: Optional[int] = None, vehicle_id: Optional[str] = None
+                ) -> Iterator[Tuple[float, int, int, int, memoryview]]:
+        """Yield (timestamp, sysid, compid, kind, payload view) in time order per segment"""
+        source = _split_vehicle_id(vehicle_id) if vehicle_id else None
+        for segment in self.segments:
+            if not segment.timestamps:
+                continue
+            if start is not None and segment.timestamps[-1] < start:
+                continue
+            if end is not None and segment.timestamps[0] > end:
+                continue
+            for index in segment.range(start, end):
+                record = segment.record(index)
+                if kind is not None and record[3] != kind:
+                    continue
+                if source is not None and (record[1], record[2]) != source:
+                    continue
+                yield record
+
+    def samples(self, start: Optional[float] = None, end: Optional[float] = None,
+                vehicle_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Decoded telemetry samples for a time range"""
+        result = []
+        for timestamp, sysid, compid, _, payload in self.records(start, end, KIND_SAMPLE, vehicle_id):
+            sample = {name: (None if value != value else value)
+                      for name, value in zip(HISTORY_FIELDS, SAMPLE_STRUCT.unpack(payload))}
+            sample['timestamp'] = timestamp
+            sample['vehicle_id'] = f"{sysid}:{compid}"
+            result.append(sample)
+        return result
+
+    async def replay(self, start: Optional[float] = None, end: Optional[float] = None,
+                     speed: float = 1.0, kind: Optional[int] = KIND_MAVLINK):
+        """Async generator pacing records by their original timing (speed x real time)"""
+        loop = asyncio.get_running_loop()
+        origin = None
+        for record in self.records(start, end, kind):
+            if origin is None:
+                origin = (record[0], loop.time())
+            delay = origin[1] + (record[0] - origin[0]) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield record
+
+    def get_segments(self) -> List[Dict[str, Any]]:
+        """Segment list with time span and record count"""
+        return [{
+            'name': os.path.basename(segment.path),
+            'records': len(segment.timestamps),
+            'start': segment.timestamps[0] if segment.timestamps else None,
+            'end': segment.timestamps[-1] if segment.timestamps else None,
+            'bytes': len(segment.view)
+        } for segment in self.segments]
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+
+async def _replay_udp(directory: str, target: str, speed: float):
+    host, port = target.rsplit(':', 1)
+    reader = FlightLogReader(directory)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sent = 0
+    async for _, _, _, _, frame in reader.replay(speed=speed):
+        sock.sendto(frame, (host, int(port)))
+        sent += 1
+    print(f"✅ Replayed {sent} MAVLink frames to {target}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DroneNova flight log tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    info = sub.add_parser('info', help='List segments')
+    info.add_argument('directory')
+    replay = sub.add_parser('replay', help='Replay raw MAVLink frames over UDP')
+    replay.add_argument('directory')
+    replay.add_argument('--udp', default='127.0.0.1:14550')
+    replay.add_argument('--speed', type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        for segment in FlightLogReader(args.directory).get_segments():
+            print(segment)
+    else:
+        asyncio.run(_replay_udp(args.directory, args.udp, args.speed))
+
+
+if __name__ == "__main__":
+    main()
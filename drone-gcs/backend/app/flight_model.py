@@ -0,0 +1,427 @@
+"""
+SITL-lite flight model
+A stepping multicopter model on top of the vectorized simulator: takeoff,
+climb and descent rates, acceleration-limited waypoint navigation, RTL to
+home, landing with auto-disarm, a battery failsafe and an unpowered fall
+after a forced disarm in flight. Runs in real time
+for demos or as fast as possible in batch mode for soak tests, and emits
+the same MAVLink frames a real vehicle would
+
+Usage:
+    python app/flight_model.py soak [--vehicles 10] [--duration 3600]
+    python app/flight_model.py fly [--vehicles 3] [--target 127.0.0.1:14550] [--speed 1]
+"""
+import argparse
+import asyncio
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from mavlink_codec import MODE_NAMES, MODE_NUMBERS
+from simulator import (CAPACITY_AH, GRAVITY, HOVER_CURRENT, IDLE_CURRENT, M_PER_DEG_LAT, FleetSimulator,
+                       FrameBatch, run)
+
+# Navigation states (what the autopilot is doing, independent of the mode name)
+NAV_HOLD = 0
+NAV_TAKEOFF = 1
+NAV_GOTO = 2
+NAV_AUTO = 3
+NAV_RTL_CLIMB = 4
+NAV_RTL_RETURN = 5
+NAV_LAND = 6
+
+# Armed on the ground with motors spinning
+ARMED_IDLE_CURRENT = 2.0    # A
+# Falling multicopter with the motors stopped
+TERMINAL_VELOCITY = 20.0    # m/s
+
+Waypoint = Tuple[float, float, float]
+
+
+class FlightModel(FleetSimulator):
+    """Multicopter autopilot behaviour for every vehicle of the fleet
+
+    Vehicles start disarmed on the ground at their home position. Commands
+    use the names the dashboard sends (ARM, DISARM, SET_MODE, TAKEOFF,
+    GUIDED, RTL, LAND, AUTO) and return False when the autopilot would
+    refuse them. A forced DISARM in flight stops the motors: the vehicle
+    loses its horizontal speed and falls until it hits the ground. step()
+    is fully vectorized; only waypoint bookkeeping touches the vehicles
+    that reached a waypoint this step.
+    """
+
+    def __init__(self, count: int = 1, seed: Optional[int] = None, cruise_speed: float = 10.0,
+                 climb_rate: float = 2.5, descent_rate: float = 1.5, land_speed: float = 0.5,
+                 acceleration: float = 2.5, acceptance_radius: float = 2.0, rtl_alt: float = 30.0,
+                 takeoff_alt: float = 10.0, battery_failsafe: float = 15.0, **kwargs):
+        super().__init__(count, seed=seed, armed=False, **kwargs)
+        self.cruise_speed = cruise_speed
+        self.climb_rate = climb_rate
+        self.descent_rate = descent_rate
+        self.land_speed = land_speed
+        self.acceleration = acceleration
+        self.acceptance_radius = acceptance_radius
+        self.rtl_alt = rtl_alt
+        self.takeoff_alt = takeoff_alt
+        self.battery_failsafe = battery_failsafe
+
+        self.home_lat = self.lat.copy()
+        self.home_lon = self.lon.copy()
+        self.relative_alt[:] = 0.0
+        self.vn = np.zeros(count)
+        self.ve = np.zeros(count)
+        self.landed = np.ones(count, dtype=bool)
+        self.nav = np.full(count, NAV_HOLD, dtype=np.int8)
+        self.target_lat = self.lat.copy()
+        self.target_lon = self.lon.copy()
+        self.target_alt = np.zeros(count)
+        self.failsafe = np.zeros(count, dtype=bool)
+        self.missions: List[List[Waypoint]] = [[] for _ in range(count)]
+        self.mission_index = np.zeros(count, dtype=np.int32)
+        self.mission_rtl = np.ones(count, dtype=bool)
+        self.mission_land = np.zeros(count, dtype=bool)
+        # MISSION_CURRENT seq of the first waypoint (1 when item 0 is ArduPilot's home)
+        self.mission_seq_base = np.zeros(count, dtype=np.int32)
+
+        # Flight counters
+        self.takeoffs = 0
+        self.landings = 0
+        self.waypoints_reached = 0
+        self.failsafes = 0
+        self.crashes = 0
+
+        self._batches['MISSION_CURRENT'] = FrameBatch('MISSION_CURRENT', self.sysids, self.compids)
+
+    # ------------------------------------------------------------ commands
+
+    def command(self, index: int, command: str, params: Optional[Dict[str, Any]] = None) -> bool:
+        """Apply a dashboard command to one vehicle"""
+        params = params or {}
+        if command == 'ARM':
+            if not self.landed[index]:
+                return bool(self.armed[index])
+            self.armed[index] = True
+            return True
+        if command == 'DISARM':
+            # Like the autopilot, refuse to disarm in flight unless forced
+            if not self.landed[index] and not params.get('force'):
+                return False
+            self.armed[index] = False
+            self._hold(index)
+            return True
+        if command == 'SET_MODE':
+            return self.set_mode(index, str(params.get('mode', '')))
+        if command == 'TAKEOFF':
+            return self.takeoff(index, float(params.get('altitude', params.get('alt', self.takeoff_alt))))
+        if command == 'GUIDED':
+            if 'lat' in params and 'lon' in params:
+                return self.goto(index, float(params['lat']), float(params['lon']),
+                                 float(params.get('alt', self.relative_alt[index])))
+            return self.set_mode(index, 'GUIDED')
+        if command in ('RTL', 'LAND', 'AUTO', 'LOITER'):
+            return self.set_mode(index, command)
+        return False
+
+    def set_mode(self, index: int, mode: str) -> bool:
+        number = MODE_NUMBERS.get(mode)
+        if number is None:
+            return False
+        if mode == 'AUTO' and not self.missions[index]:
+            return False
+        self.custom_mode[index] = number
+        if mode == 'RTL':
+            self.nav[index] = NAV_LAND if self.landed[index] else NAV_RTL_CLIMB
+        elif mode == 'LAND':
+            self.nav[index] = NAV_LAND
+        elif mode == 'AUTO':
+            self.nav[index] = NAV_AUTO
+            self._target_waypoint(index)
+        else:
+            self._hold(index)
+        return True
+
+    def takeoff(self, index: int, altitude: float) -> bool:
+        """Climb straight up to `altitude` metres above home (GUIDED takeoff)"""
+        if not self.armed[index] or altitude <= 0:
+            return False
+        self.custom_mode[index] = MODE_NUMBERS['GUIDED']
+        self.nav[index] = NAV_TAKEOFF
+        self.target_lat[index] = self.lat[index]
+        self.target_lon[index] = self.lon[index]
+        self.target_alt[index] = altitude
+        return True
+
+    def goto(self, index: int, lat: float, lon: float, alt: float) -> bool:
+        """Fly to a position in GUIDED mode (airborne vehicles only)"""
+        if not self.armed[index] or self.landed[index]:
+            return False
+        self.custom_mode[index] = MODE_NUMBERS['GUIDED']
+        self.nav[index] = NAV_GOTO
+        self.target_lat[index] = lat
+        self.target_lon[index] = lon
+        self.target_alt[index] = max(alt, 1.0)
+        return True
+
+    def set_mission(self, index: int, waypoints: Sequence[Waypoint], rtl: bool = True,
+                    land: bool = False, seq_base: int = 0):
+        """Load (lat, lon, relative alt) waypoints; after the last one LAND if `land`,
+        else RTL if `rtl`, else loiter"""
+        self.missions[index] = [tuple(map(float, waypoint)) for waypoint in waypoints]
+        self.mission_index[index] = 0
+        self.mission_rtl[index] = rtl
+        self.mission_land[index] = land
+        self.mission_seq_base[index] = seq_base
+
+    def _hold(self, index: int):
+        self.nav[index] = NAV_HOLD
+        self.target_lat[index] = self.lat[index]
+        self.target_lon[index] = self.lon[index]
+        self.target_alt[index] = self.relative_alt[index]
+
+    def _target_waypoint(self, index: int):
+        lat, lon, alt = self.missions[index][self.mission_index[index]]
+        self.target_lat[index] = lat
+        self.target_lon[index] = lon
+        self.target_alt[index] = alt
+
+    # ------------------------------------------------------------ dynamics
+
+    def step(self, dt: float):
+        """Advance every vehicle by `dt` seconds"""
+        nav = self.nav
+        armed = self.armed
+        noise = self.rng.standard_normal((2, self.count))
+
+        # Armed vehicles with somewhere to go leave the ground
+        lifting = self.landed & armed & np.isin(nav, (NAV_TAKEOFF, NAV_GOTO, NAV_AUTO))
+        if lifting.any():
+            self.landed &= ~lifting
+            self.takeoffs += int(lifting.sum())
+        flying = ~self.landed
+        # Disarmed in the air: no thrust, no control
+        powered = flying & armed
+        falling = flying & ~armed
+
+        # RTL: climb to the return altitude in place, then head home
+        climbing = nav == NAV_RTL_CLIMB
+        self.target_lat = np.where(climbing, self.lat, self.target_lat)
+        self.target_lon = np.where(climbing, self.lon, self.target_lon)
+        self.target_alt = np.where(climbing, np.maximum(self.relative_alt, self.rtl_alt), self.target_alt)
+        returning = nav == NAV_RTL_RETURN
+        self.target_lat = np.where(returning, self.home_lat, self.target_lat)
+        self.target_lon = np.where(returning, self.home_lon, self.target_lon)
+
+        # Horizontal: accelerate towards the target, braking to stop on it
+        cos_lat = np.cos(np.radians(self.lat))
+        north = (self.target_lat - self.lat) * M_PER_DEG_LAT
+        east = (self.target_lon - self.lon) * M_PER_DEG_LAT * cos_lat
+        distance = np.hypot(north, east)
+        moving = powered & np.isin(nav, (NAV_GOTO, NAV_AUTO, NAV_RTL_RETURN)) & (self.relative_alt >= 2.0)
+        speed = np.where(moving, np.minimum(self.cruise_speed, np.sqrt(2.0 * self.acceleration * distance)), 0.0)
+        scale = np.divide(speed, distance, out=np.zeros_like(distance), where=distance > 1e-6)
+        dvn = north * scale - self.vn
+        dve = east * scale - self.ve
+        change = np.hypot(dvn, dve)
+        limit = np.minimum(1.0, np.divide(self.acceleration * dt, change,
+                                          out=np.ones_like(change), where=change > 1e-9))
+        accel_n = np.where(powered, dvn * limit / dt, 0.0)
+        accel_e = np.where(powered, dve * limit / dt, 0.0)
+        self.vn = np.where(powered, self.vn + accel_n * dt, 0.0)
+        self.ve = np.where(powered, self.ve + accel_e * dt, 0.0)
+
+        # Vertical: rate-limited towards the target altitude; LAND descends to the ground
+        landing = nav == NAV_LAND
+        climb = np.clip(1.0 * (self.target_alt - self.relative_alt), -self.descent_rate, self.climb_rate)
+        land_rate = np.where(self.relative_alt > 10.0, self.descent_rate, self.land_speed)
+        climb = np.where(landing, -land_rate, climb)
+        fall = np.maximum(self.climb - GRAVITY * dt, -TERMINAL_VELOCITY)
+        self.climb = np.where(powered, climb, np.where(falling, fall, 0.0))
+
+        # Integrate
+        self.lat += self.vn * dt / M_PER_DEG_LAT
+        self.lon += self.ve * dt / (M_PER_DEG_LAT * cos_lat)
+        self.relative_alt = np.maximum(0.0, self.relative_alt + self.climb * dt)
+        previous_heading = self.heading
+        self.groundspeed = np.hypot(self.vn, self.ve)
+        self.heading = np.where(self.groundspeed > 0.5, np.degrees(np.arctan2(self.ve, self.vn)) % 360.0,
+                                self.heading)
+        turn = (self.heading - previous_heading + 540.0) % 360.0 - 180.0
+        self.turn_rate = turn / dt
+
+        # Attitude from the commanded acceleration (body frame), plus sensor noise
+        yaw = np.radians(self.heading)
+        forward = accel_n * np.cos(yaw) + accel_e * np.sin(yaw)
+        lateral = -accel_n * np.sin(yaw) + accel_e * np.cos(yaw)
+        self.pitch = np.where(powered, -np.arctan(forward / GRAVITY) + 0.005 * noise[0], 0.0)
+        self.roll = np.where(powered, np.arctan(lateral / GRAVITY) + 0.005 * noise[1], 0.0)
+
+        # Battery drains while armed; on the ground with motors idle it barely moves
+        self.current = np.where(powered, HOVER_CURRENT + 0.08 * self.groundspeed ** 2 + 2.0 * np.abs(self.climb),
+                                np.where(armed, ARMED_IDLE_CURRENT, IDLE_CURRENT))
+        self.battery = np.maximum(0.0, self.battery - self.current * dt / 3600.0 / CAPACITY_AH * 100.0)
+        self._update_battery()
+        self.time += dt
+
+        self._advance(distance, flying)
+
+    def _advance(self, distance: np.ndarray, flying: np.ndarray):
+        """Navigation state changes: arrivals, touchdowns and the battery failsafe"""
+        # One transition per vehicle per step: `distance` was measured against this step's targets
+        previous = self.nav
+        at_alt = np.abs(self.target_alt - self.relative_alt) < 0.5
+        arrived = distance < self.acceptance_radius
+
+        nav = self.nav = previous.copy()
+        nav[(previous == NAV_TAKEOFF) & at_alt] = NAV_HOLD
+        nav[(previous == NAV_RTL_CLIMB) & at_alt] = NAV_RTL_RETURN
+        nav[(previous == NAV_RTL_RETURN) & arrived] = NAV_LAND
+        nav[(previous == NAV_GOTO) & arrived & at_alt] = NAV_HOLD
+
+        for index in np.nonzero((previous == NAV_AUTO) & arrived & at_alt)[0]:
+            self.waypoints_reached += 1
+            self.mission_index[index] += 1
+            if self.mission_index[index] < len(self.missions[index]):
+                self._target_waypoint(index)
+            elif self.mission_land[index]:
+                self.mission_index[index] = len(self.missions[index]) - 1
+                self.custom_mode[index] = MODE_NUMBERS['LAND']
+                nav[index] = NAV_LAND
+            elif self.mission_rtl[index]:
+                self.mission_index[index] = len(self.missions[index]) - 1
+                self.custom_mode[index] = MODE_NUMBERS['RTL']
+                nav[index] = NAV_RTL_CLIMB
+            else:
+                self.mission_index[index] = len(self.missions[index]) - 1
+                self.custom_mode[index] = MODE_NUMBERS['LOITER']
+                self._hold(index)
+
+        # Touchdown: auto-disarm like the autopilot does after landing; a disarmed vehicle hits the ground
+        crashed = flying & ~self.armed & (self.relative_alt <= 0.0)
+        touchdown = ((previous == NAV_LAND) & flying & (self.relative_alt <= 0.0)) | crashed
+        if touchdown.any():
+            self.landings += int((touchdown & ~crashed).sum())
+            self.crashes += int(crashed.sum())
+            self.landed |= touchdown
+            self.armed &= ~touchdown
+            self.vn[touchdown] = 0.0
+            self.ve[touchdown] = 0.0
+            self.climb[touchdown] = 0.0
+            for index in np.nonzero(touchdown)[0]:
+                self._hold(index)
+
+        failsafe = flying & self.armed & ~self.failsafe & (self.battery < self.battery_failsafe) & ~np.isin(
+            nav, (NAV_RTL_CLIMB, NAV_RTL_RETURN, NAV_LAND))
+        if failsafe.any():
+            self.failsafes += int(failsafe.sum())
+            self.failsafe |= failsafe
+            self.custom_mode[failsafe] = MODE_NUMBERS['RTL']
+            self.nav[failsafe] = NAV_RTL_CLIMB
+
+    # ------------------------------------------------------------ output
+
+    def status_frames(self) -> np.ndarray:
+        """Heartbeat, status and GPS plus MISSION_CURRENT"""
+        mission = self._batches['MISSION_CURRENT']
+        mission.payload['seq'] = self.mission_index + self.mission_seq_base
+        return np.concatenate([super().status_frames(), mission.finish(self._next_seq())], axis=1)
+
+    def telemetry(self, index: int = 0) -> Dict[str, Any]:
+        telemetry = super().telemetry(index)
+        telemetry['mission_current'] = int(self.mission_index[index] + self.mission_seq_base[index])
+        telemetry['mission_total'] = len(self.missions[index])
+        telemetry['landed'] = bool(self.landed[index])
+        return telemetry
+
+    def advance(self, seconds: float, max_dt: float = 0.1):
+        """Step by `seconds` in increments of at most `max_dt` (accelerated real-time runs)"""
+        while seconds > 1e-9:
+            dt = min(seconds, max_dt)
+            self.step(dt)
+            seconds -= dt
+
+    def run_batch(self, duration: float, dt: float = 0.1,
+                  on_step: Optional[Callable[['FlightModel'], None]] = None) -> Dict[str, Any]:
+        """Step as fast as possible for `duration` simulated seconds (soak tests)"""
+        started = time.perf_counter()
+        steps = int(round(duration / dt))
+        for _ in range(steps):
+            self.step(dt)
+            if on_step is not None:
+                on_step(self)
+        elapsed = time.perf_counter() - started
+        stats = self.get_statistics()
+        stats['steps'] = steps
+        stats['speedup'] = round(duration / elapsed, 1) if elapsed else None
+        return stats
+
+    def get_statistics(self) -> Dict[str, Any]:
+        stats = super().get_statistics()
+        stats.update({
+            'airborne': int((~self.landed).sum()),
+            'takeoffs': self.takeoffs,
+            'landings': self.landings,
+            'waypoints_reached': self.waypoints_reached,
+            'failsafes': self.failsafes,
+            'crashes': self.crashes,
+            'min_battery': round(float(self.battery.min()), 2) if self.count else None,
+            'modes': {MODE_NAMES.get(int(number), str(number)): int(count)
+                      for number, count in zip(*np.unique(self.custom_mode, return_counts=True))}
+        })
+        return stats
+
+
+def box_mission(lat: float, lon: float, size: float = 200.0, alt: float = 40.0, laps: int = 1) -> List[Waypoint]:
+    """Square pattern of `size` metres starting at (lat, lon), flown `laps` times"""
+    dlat = size / M_PER_DEG_LAT
+    dlon = size / (M_PER_DEG_LAT * math.cos(math.radians(lat)))
+    corners = [(lat + dlat, lon), (lat + dlat, lon + dlon), (lat, lon + dlon), (lat, lon)]
+    return [(corner[0], corner[1], alt) for _ in range(laps) for corner in corners]
+
+
+def launch(model: FlightModel, size: float, laps: int):
+    """Arm every vehicle and start a box mission from its home"""
+    for index in range(model.count):
+        model.set_mission(index, box_mission(model.home_lat[index], model.home_lon[index], size,
+                                             alt=30.0 + 5.0 * (index % 4), laps=laps))
+        model.command(index, 'ARM')
+        model.set_mode(index, 'AUTO')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest='action', required=True)
+    soak = sub.add_parser('soak', help='run box missions as fast as possible')
+    soak.add_argument('--duration', type=float, default=3600.0, help='simulated seconds')
+    soak.add_argument('--dt', type=float, default=0.1)
+    fly = sub.add_parser('fly', help='fly box missions and send MAVLink frames over UDP')
+    fly.add_argument('--target', default='127.0.0.1:14550', help='GCS MAVLink UDP host:port')
+    fly.add_argument('--rate', type=float, default=10.0, help='telemetry ticks per second')
+    fly.add_argument('--speed', type=float, default=1.0, help='simulated seconds per real second')
+    fly.add_argument('--duration', type=float, help='stop after this many seconds')
+    for action in (soak, fly):
+        action.add_argument('--vehicles', type=int, default=3)
+        action.add_argument('--seed', type=int)
+        action.add_argument('--size', type=float, default=200.0, help='box mission side in metres')
+        action.add_argument('--laps', type=int, default=3)
+    args = parser.parse_args()
+
+    model = FlightModel(args.vehicles, seed=args.seed, radius=500.0)
+    launch(model, args.size, args.laps)
+    if args.action == 'soak':
+        print(f"🔁 {args.vehicles} vehicles, {args.duration:g}s simulated")
+        print(model.run_batch(args.duration, args.dt))
+        return
+
+    host, _, port = args.target.rpartition(':')
+    print(f"🛩️  {args.vehicles} vehicles at {args.speed:g}x -> {host}:{port}")
+    try:
+        asyncio.run(run(model, (host, int(port)), args.rate, speed=args.speed, duration=args.duration))
+    except KeyboardInterrupt:
+        pass
+    print(model.get_statistics())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Grid spatial index over the fleet's latest positions
+Answers "within radius", "nearest k", "inside polygon" and map-viewport
+queries by visiting only the grid cells that can hold a match
+"""
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180.0
+# Half the earth's circumference: every point is within this distance
+MAX_DISTANCE = math.pi * EARTH_RADIUS
+# ~1.1 km cells: a city-sized viewport touches tens of cells, not thousands
+DEFAULT_CELL_DEG = 0.01
+
+Cell = Tuple[int, int]
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def valid_position(lat: float, lon: float) -> bool:
+    """A fix the index can hold; (0, 0) is what autopilots report before GPS lock"""
+    if lat == 0.0 and lon == 0.0:
+        return False
+    return -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+
+
+def point_in_polygon(lat: float, lon: float, polygon: Sequence[Tuple[float, float]]) -> bool:
+    """Even-odd rule on [(lat, lon), ...]; the polygon closes itself"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            crossing = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if lon < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+def parse_polygon(points) -> List[Tuple[float, float]]:
+    """[[lat, lon], ...] with at least three vertices"""
+    polygon = [(float(point[0]), float(point[1])) for point in points]
+    if len(polygon) < 3:
+        raise ValueError("polygon needs at least 3 points")
+    return polygon
+
+
+def parse_bbox(value) -> Optional[Tuple[float, float, float, float]]:
+    """[south, west, north, east] (or 's,w,n,e'); west > east crosses the antimeridian"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    south, west, north, east = (float(part) for part in value)
+    if south > north:
+        raise ValueError("bbox south must not exceed north")
+    return south, west, north, east
+
+
+class GeoIndex:
+    """Uniform lat/lon grid of vehicle ids, updated in place as positions arrive
+
+    A position update only touches the grid when the vehicle crosses into
+    another cell. Queries gather candidates from the cells overlapping the
+    query's bounding box (or from the occupied cells, when that is fewer)
+    and then test each candidate exactly.
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.columns = int(round(360.0 / cell_deg))
+        self.cells: Dict[Cell, Set[str]] = {}
+        self.points: Dict[str, Tuple[float, float, Cell]] = {}
+
+        # Index counters
+        self.updates = 0
+        self.moves = 0
+        self.queries = 0
+        self.candidates = 0
+
+    def _column(self, lon: float) -> int:
+        return min(int(math.floor((lon + 180.0) / self.cell_deg)), self.columns - 1)
+
+    def cell(self, lat: float, lon: float) -> Cell:
+        return int(math.floor(lat / self.cell_deg)), self._column(lon)
+
+    def update(self, vid: str, lat: float, lon: float):
+        """Move a vehicle to its latest position; positions without a fix take it out"""
+        if not valid_position(lat, lon):
+            self.remove(vid)
+            return
+        self.updates += 1
+        cell = self.cell(lat, lon)
+        point = self.points.get(vid)
+        if point is not None and point[2] == cell:
+            self.points[vid] = (lat, lon, cell)
+            return
+        if point is not None:
+            self._unlink(vid, point[2])
+        self.cells.setdefault(cell, set()).add(vid)
+        self.points[vid] = (lat, lon, cell)
+        self.moves += 1
+
+    def remove(self, vid: str):
+        point = self.points.pop(vid, None)
+        if point is not None:
+            self._unlink(vid, point[2])
+
+    def _unlink(self, vid: str, cell: Cell):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(vid)
+            if not members:
+                del self.cells[cell]
+
+    def position(self, vid: str) -> Optional[Tuple[float, float]]:
+        point = self.points.get(vid)
+        return (point[0], point[1]) if point else None
+
+    def _column_ranges(self, west: float, east: float) -> List[Tuple[int, int]]:
+        """Inclusive column ranges for a longitude span, split at the antimeridian"""
+        first = self._column(west)
+        last = self._column(east)
+        if west <= east:
+            return [(first, last)]
+        return [(first, self.columns - 1), (0, last)]
+
+    def _candidates(self, south: float, west: float, north: float, east: float) -> Iterable[str]:
+        """Vehicle ids in every cell overlapping the box (a superset of the matches)"""
+        self.queries += 1
+        row_min = int(math.floor(south / self.cell_deg))
+        row_max = int(math.floor(north / self.cell_deg))
+        ranges = self._column_ranges(west, east)
+        span = (row_max - row_min + 1) * sum(last - first + 1 for first, last in ranges)
+        if span > len(self.cells):
+            # Wide query over a sparse fleet: walk the occupied cells instead
+            cells = [cell for cell in self.cells
+                     if row_min <= cell[0] <= row_max
+                     and any(first <= cell[1] <= last for first, last in ranges)]
+        else:
+            cells = [(row, column) for row in range(row_min, row_max + 1)
+                     for first, last in ranges for column in range(first, last + 1)]
+        for cell in cells:
+            members = self.cells.get(cell)
+            if members:
+                self.candidates += len(members)
+                yield from members
+
+    def within_bbox(self, south: float, west: float, north: float, east: float) -> Set[str]:
+        """Vehicles inside [south, north] x [west, east]; west > east wraps across 180°"""
+        result = set()
+        wraps = west > east
+        for vid in self._candidates(south, west, north, east):
+            lat, lon, _ = self.points[vid]
+            if south <= lat <= north and ((west <= lon or lon <= east) if wraps else west <= lon <= east):
+                result.add(vid)
+        return result
+
+    def within_radius(self, lat: float, lon: float, radius: float) -> List[Tuple[str, float]]:
+        """(vehicle_id, meters) within `radius` meters of the point, nearest first"""
+        dlat = radius / METERS_PER_DEGREE
+        south = max(-90.0, lat - dlat)
+        north = min(90.0, lat + dlat)
+        # Widest longitude span of the circle is at the latitude nearest a pole
+        cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+        if north >= 90.0 or south <= -90.0 or dlat / max(cos_lat, 1e-12) >= 180.0:
+            west, east = -180.0, 180.0
+        else:
+            dlon = dlat / cos_lat
+            west, east = lon - dlon, lon + dlon
+            if west < -180.0:
+                west += 360.0
+            if east > 180.0:
+                east -= 360.0
+        result = []
+        for vid in self._candidates(south, west, north, east):
+            point = self.points[vid]
+            distance = haversine(lat, lon, point[0], point[1])
+            if distance <= radius:
+                result.append((vid, distance))
+        result.sort(key=lambda entry: entry[1])
+        return result
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                max_distance: Optional[float] = None) -> List[Tuple[str, float]]:
+        """The `k` vehicles closest to the point as (vehicle_id, meters), nearest first
+
+        Searches a growing radius; once it holds k vehicles, no vehicle
+        outside it can be closer.
+        """
+        limit = MAX_DISTANCE if max_distance is None else min(max_distance, MAX_DISTANCE)
+        if k <= 0 or not self.points:
+            return []
+        radius = min(self.cell_deg * METERS_PER_DEGREE, limit)
+        while True:
+            found = self.within_radius(lat, lon, radius)
+            if len(found) >= k or radius >= limit:
+                return found[:k]
+            radius = min(radius * 4, limit)
+
+    def within_polygon(self, polygon: Sequence[Tuple[float, float]]) -> List[str]:
+        """Vehicles inside the polygon [(lat, lon), ...] (even-odd rule)"""
+        lats = [point[0] for point in polygon]
+        lons = [point[1] for point in polygon]
+        result = []
+        for vid in self._candidates(min(lats), min(lons), max(lats), max(lons)):
+            lat, lon, _ = self.points[vid]
+            if point_in_polygon(lat, lon, polygon):
+                result.append(vid)
+        return sorted(result)
+
+    def get_statistics(self) -> Dict:
+        """Get index counters"""
+        return {
+            'vehicles': len(self.points),
+            'cells': len(self.cells),
+            'cell_deg': self.cell_deg,
+            'updates': self.updates,
+            'moves': self.moves,
+            'queries': self.queries,
+            'candidates': self.candidates
+        }
+
+    def __len__(self) -> int:
+        return len(self.points)
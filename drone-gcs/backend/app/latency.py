@@ -0,0 +1,174 @@
+"""
+Telemetry pipeline latency instrumentation
+HDR-style log-linear histograms per pipeline stage and per client, cheap
+enough to stay on in production, exported as Prometheus text and JSON
+
+Stages (seconds):
+    ingest        datagram received -> every frame in it decoded and applied
+    state_update  one message applied to vehicle state
+    queue         telemetry age when picked up for dispatch
+    serialize     one frame encoded (per encoding)
+    enqueue       frame queued -> client writer starts sending it (per client)
+    send          websocket send call (per client)
+    end_to_end    socket receive -> send complete (per client)
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 16 linear sub-buckets per power of two: ~6% relative precision, 1 us resolution
+SUB_BUCKET_BITS = 4
+LINEAR_LIMIT = 2 << SUB_BUCKET_BITS            # values below this (us) get their own bucket
+BUCKET_COUNT = ((32 - SUB_BUCKET_BITS) << SUB_BUCKET_BITS) + LINEAR_LIMIT  # up to ~35 min
+
+# Prometheus `le` boundaries in seconds
+PROMETHEUS_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                      0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CLIENT_STAGES = ('enqueue', 'send', 'end_to_end')
+
+
+def bucket_bounds(index: int) -> Tuple[int, int]:
+    """Inclusive [low, high] microsecond range of a bucket"""
+    if index < LINEAR_LIMIT:
+        return index, index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    mantissa = index - (shift << SUB_BUCKET_BITS)
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in microseconds; record() is a few integer ops"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        value = int(seconds * 1e6)
+        if value < LINEAR_LIMIT:
+            index = value if value > 0 else 0
+        else:
+            shift = value.bit_length() - SUB_BUCKET_BITS - 1
+            index = (shift << SUB_BUCKET_BITS) + (value >> shift)
+            if index >= BUCKET_COUNT:
+                index = BUCKET_COUNT - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given fraction, in seconds"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= target:
+                    return min(bucket_bounds(index)[1] / 1e6, self.max)
+        return self.max
+
+    def cumulative(self, bounds: Iterable[float]) -> List[int]:
+        """Counts at or below each bound (seconds), for Prometheus buckets"""
+        result = []
+        index = 0
+        seen = 0
+        for bound in bounds:
+            limit = bound * 1e6
+            while index < BUCKET_COUNT and bucket_bounds(index)[1] <= limit:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        """count/mean/p50/p90/p99/p999/max in milliseconds"""
+        def ms(value):
+            return None if value is None else round(value * 1000.0, 3)
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count) if self.count else None,
+            'p50_ms': ms(self.percentile(0.5)),
+            'p90_ms': ms(self.percentile(0.9)),
+            'p99_ms': ms(self.percentile(0.99)),
+            'p999_ms': ms(self.percentile(0.999)),
+            'max_ms': ms(self.max) if self.count else None
+        }
+
+
+class LatencyRecorder:
+    """Named stage histograms plus per-client histograms for the client stages"""
+
+    def __init__(self):
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self.clients: Dict[str, Dict[str, LatencyHistogram]] = {}
+
+    def stage(self, name: str) -> LatencyHistogram:
+        """Histogram for a stage; hot paths keep the returned object and call record() on it"""
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = self.stages[name] = LatencyHistogram()
+        return histogram
+
+    def record(self, name: str, seconds: float):
+        self.stage(name).record(seconds)
+
+    def client(self, label: str) -> Dict[str, LatencyHistogram]:
+        """Per-client histograms for CLIENT_STAGES"""
+        histograms = self.clients.get(label)
+        if histograms is None:
+            histograms = self.clients[label] = {name: LatencyHistogram() for name in CLIENT_STAGES}
+        return histograms
+
+    def remove_client(self, label: str):
+        self.clients.pop(label, None)
+
+    def summary(self, clients: bool = True) -> Dict[str, Any]:
+        """JSON summary per stage (and per client)"""
+        result: Dict[str, Any] = {'stages': {name: h.summary() for name, h in self.stages.items()}}
+        if clients:
+            result['clients'] = {
+                label: {name: h.summary() for name, h in histograms.items()}
+                for label, histograms in self.clients.items()
+            }
+        return result
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of every histogram"""
+        lines = [
+            '# HELP gcs_latency_seconds Telemetry pipeline latency per stage',
+            '# TYPE gcs_latency_seconds histogram'
+        ]
+        for name, histogram in self.stages.items():
+            _prometheus_histogram(lines, 'gcs_latency_seconds', f'stage="{name}"', histogram)
+        lines += [
+            '# HELP gcs_client_latency_seconds Telemetry latency per WebSocket client',
+            '# TYPE gcs_client_latency_seconds histogram'
+        ]
+        for label, histograms in self.clients.items():
+            for name, histogram in histograms.items():
+                _prometheus_histogram(lines, 'gcs_client_latency_seconds',
+                                      f'client="{_escape_label(label)}",stage="{name}"', histogram)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _prometheus_histogram(lines: List[str], metric: str, labels: str, histogram: LatencyHistogram):
+    for bound, count in zip(PROMETHEUS_BUCKETS, histogram.cumulative(PROMETHEUS_BUCKETS)):
+        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{metric}_sum{{{labels}}} {histogram.total}')
+    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+
+
+# Shared recorder for the application
+metrics = LatencyRecorder()
@@ -0,0 +1,408 @@
+"""
+Load test: N synthetic MAVLink vehicles, M WebSocket clients, one in-process GCS
+Starts the FastAPI app with uvicorn in this process, drives vehicles over
+local UDP and clients over loopback from worker processes (so the load
+generators do not share the server's GIL), then reports ingest msg/s,
+fan-out throughput, end-to-end latency, CPU and RSS as a JSON file that
+can be compared between commits
+
+Usage: python app/loadtest.py [--vehicles 20] [--clients 50] [--duration 10]
+                              [--out loadtest.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from latency import BUCKET_COUNT, LatencyHistogram, bucket_bounds
+from simulator import FleetSimulator, run as fly
+
+# Headline numbers for --compare: (path in results, higher is better)
+COMPARE_KEYS = (
+    ('ingest.decoded_per_second', True),
+    ('fanout.client_messages_per_second', True),
+    ('fanout.client_bytes_per_second', True),
+    ('fanout.server_dropped', False),
+    ('latency.client_end_to_end.p50_ms', False),
+    ('latency.client_end_to_end.p99_ms', False),
+    ('resources.server_cpu_percent', False),
+    ('resources.server_rss_mb', False),
+)
+
+
+def free_port(kind: int = socket.SOCK_STREAM) -> int:
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# ---------------------------------------------------------------- histograms
+
+def merge_counts(histogram: LatencyHistogram, counts: List[int], total: float, maximum: float):
+    for index, count in enumerate(counts):
+        if count:
+            histogram.counts[index] += count
+    histogram.count += sum(counts)
+    histogram.total += total
+    histogram.max = max(histogram.max, maximum)
+
+
+def snapshot_histogram(histogram: LatencyHistogram) -> Tuple[List[int], float]:
+    return list(histogram.counts), histogram.total
+
+
+def window_histogram(before: Optional[Tuple[List[int], float]], histogram: LatencyHistogram) -> LatencyHistogram:
+    """Samples recorded since `before`; max is the upper bound of the highest bucket hit"""
+    counts_before, total_before = before or ([0] * BUCKET_COUNT, 0.0)
+    counts = [now - then for now, then in zip(histogram.counts, counts_before)]
+    window = LatencyHistogram()
+    highest = max((index for index, count in enumerate(counts) if count), default=None)
+    maximum = 0.0 if highest is None else min(bucket_bounds(highest)[1] / 1e6, histogram.max)
+    merge_counts(window, counts, histogram.total - total_before, maximum)
+    return window
+
+
+# ---------------------------------------------------------------- load generator (worker process)
+
+class WorkerStats:
+    def __init__(self):
+        self.vehicles: Dict[str, int] = {}
+        self.reset()
+
+    def reset(self):
+        # Zeroed in place: the simulator keeps counting into the same dict
+        self.vehicles.update(frames=0, datagrams=0)
+        self.received = 0
+        self.received_bytes = 0
+        self.latency = LatencyHistogram()
+        self.cpu = time.process_time()
+        self.started = time.time()
+
+
+async def drive_vehicles(first: int, count: int, udp_port: int, hz: float, seed: int, stats: WorkerStats):
+    """Fly a slice of the fleet with the vectorized simulator, one datagram per vehicle per tick"""
+    simulator = FleetSimulator(count, seed=seed, first_vehicle=first)
+    await fly(simulator, ('127.0.0.1', udp_port), hz, counters=stats.vehicles)
+
+
+async def run_client(url: str, stats: WorkerStats, ready: asyncio.Event):
+    """One dashboard: count telemetry, measure age from server receive, answer RTT probes"""
+    import websockets
+
+    async with websockets.connect(url, max_size=None, compression=None) as ws:
+        await ws.recv()  # connection message
+        ready.set()
+        async for payload in ws:
+            now = time.time()
+            message = json.loads(payload)
+            kind = message.get('type')
+            if kind == 'telemetry':
+                stats.received += 1
+                stats.received_bytes += len(payload)
+                received = message['data'].get('timestamp')
+                if received:
+                    stats.latency.record(now - received)
+            elif kind == 'rtt_probe':
+                await ws.send(json.dumps({'type': 'rtt_ack', 'probe_id': message['probe_id']}))
+
+
+async def worker_main(conn, worker: int, vehicles: range, clients: int, port: int, udp_port: int,
+                      hz: float, rate: float, seed: int):
+    stats = WorkerStats()
+    tasks = []
+    if vehicles:
+        tasks.append(asyncio.create_task(drive_vehicles(vehicles.start, len(vehicles), udp_port, hz,
+                                                        seed + worker, stats)))
+    url = f"ws://127.0.0.1:{port}/ws?rate={rate}"
+    ready = []
+    for _ in range(clients):
+        event = asyncio.Event()
+        ready.append(event)
+        tasks.append(asyncio.create_task(run_client(url, stats, event)))
+    for event in ready:
+        await event.wait()
+    conn.send(('ready', worker))
+
+    while True:
+        await asyncio.sleep(0.01)
+        for task in tasks:
+            if task.done() and task.exception():
+                conn.send(('error', repr(task.exception())))
+                return
+        if not conn.poll():
+            continue
+        command = conn.recv()
+        if command == 'measure':
+            stats.reset()
+        elif command == 'stop':
+            elapsed = time.time() - stats.started
+            conn.send(('result', {
+                'sent': stats.vehicles['frames'],
+                'received': stats.received,
+                'received_bytes': stats.received_bytes,
+                'latency': (stats.latency.counts, stats.latency.total, stats.latency.max),
+                'cpu_percent': 100.0 * (time.process_time() - stats.cpu) / elapsed if elapsed else 0.0
+            }))
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return
+
+
+def worker_entry(conn, *args):
+    asyncio.run(worker_main(conn, *args))
+
+
+# ---------------------------------------------------------------- server side (this process)
+
+def process_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_mb() -> Tuple[Optional[float], float]:
+    """(current RSS, peak RSS) of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        current = None
+    return current, peak_mb
+
+
+def server_counters(main) -> Dict[str, Any]:
+    channels = list(main.connection_mgr.hub.clients.values())
+    return {
+        'messages': main.mavlink_ingest.messages,
+        'packets': main.mavlink_ingest.packets,
+        'decode_errors': main.mavlink_ingest.decoder.get_statistics().get('crc_errors', 0),
+        'sent': sum(channel.sent for channel in channels),
+        'bytes_sent': sum(channel.bytes_sent for channel in channels),
+        'dropped': sum(channel.dropped for channel in channels),
+        'stages': {name: snapshot_histogram(h) for name, h in main.metrics.stages.items()},
+        'cpu': process_cpu(),
+        'time': time.time()
+    }
+
+
+def client_end_to_end(main) -> LatencyHistogram:
+    """Server-side end_to_end merged over every client"""
+    merged = LatencyHistogram()
+    for histograms in main.metrics.clients.values():
+        h = histograms['end_to_end']
+        merge_counts(merged, h.counts, h.total, h.max)
+    return merged
+
+
+async def send_all(workers, command: str):
+    for conn, _ in workers:
+        conn.send(command)
+
+
+async def receive_all(workers, expected: str, timeout: float) -> List[Any]:
+    results = []
+    deadline = time.monotonic() + timeout
+    for conn, process in workers:
+        while not conn.poll():
+            if time.monotonic() > deadline or not process.is_alive():
+                raise RuntimeError(f"load worker did not report '{expected}'")
+            await asyncio.sleep(0.01)
+        kind, value = conn.recv()
+        if kind == 'error':
+            raise RuntimeError(f"load worker failed: {value}")
+        results.append(value)
+    return results
+
+
+async def run_load(args) -> Dict[str, Any]:
+    udp_port = free_port(socket.SOCK_DGRAM)
+    port = free_port()
+    os.environ['MAVLINK_CONNECTION'] = f"udp:127.0.0.1:{udp_port}"
+    os.environ.setdefault('FLIGHT_LOG', 'off')
+    os.environ.setdefault('EXPORT_SINK', 'off')
+    os.environ.setdefault('SIMULATION', 'off')
+
+    import logging
+    import uvicorn
+    import main
+
+    logging.getLogger().setLevel(logging.WARNING)
+    server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning',
+                                           ws_max_size=1 << 24))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        if serve.done():
+            serve.result()
+        await asyncio.sleep(0.01)
+
+    context = multiprocessing.get_context('spawn')
+    workers = []
+    try:
+        for worker in range(args.workers):
+            vehicles = range(args.vehicles * worker // args.workers, args.vehicles * (worker + 1) // args.workers)
+            clients = args.clients // args.workers + (1 if worker < args.clients % args.workers else 0)
+            parent, child = context.Pipe()
+            process = context.Process(target=worker_entry, daemon=True,
+                                      args=(child, worker, vehicles, clients, port, udp_port, args.hz, args.rate,
+                                            args.seed))
+            process.start()
+            workers.append((parent, process))
+        await receive_all(workers, 'ready', timeout=60.0)
+
+        await asyncio.sleep(args.warmup)
+        await send_all(workers, 'measure')
+        before = server_counters(main)
+        e2e_before = snapshot_histogram(client_end_to_end(main))
+        await asyncio.sleep(args.duration)
+        after = server_counters(main)
+        e2e_after = client_end_to_end(main)
+        await send_all(workers, 'stop')
+        results = await receive_all(workers, 'result', timeout=30.0)
+        fleet_size = len(main.fleet)
+        dispatch = main.scheduler.jobs['telemetry_dispatch'].get_statistics()
+    finally:
+        for _, process in workers:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        server.should_exit = True
+        await serve
+
+    elapsed = after['time'] - before['time']
+    client_latency = LatencyHistogram()
+    for result in results:
+        merge_counts(client_latency, *result['latency'])
+    sent = sum(result['sent'] for result in results)
+    received = sum(result['received'] for result in results)
+    received_bytes = sum(result['received_bytes'] for result in results)
+    current_rss, peak_rss = rss_mb()
+
+    def rate(value: float) -> float:
+        return round(value / elapsed, 1)
+
+    return {
+        'ingest': {
+            'vehicles_seen': fleet_size,
+            'sent_per_second': rate(sent),
+            'decoded_per_second': rate(after['messages'] - before['messages']),
+            'packets_per_second': rate(after['packets'] - before['packets']),
+            'decode_errors': after['decode_errors'] - before['decode_errors'],
+            'loss_ratio': round(1.0 - (after['messages'] - before['messages']) / sent, 4) if sent else None
+        },
+        'fanout': {
+            'server_frames_per_second': rate(after['sent'] - before['sent']),
+            'server_bytes_per_second': rate(after['bytes_sent'] - before['bytes_sent']),
+            'server_dropped': after['dropped'] - before['dropped'],
+            'client_messages_per_second': rate(received),
+            'client_bytes_per_second': rate(received_bytes),
+            'dispatch_missed_ticks': dispatch['missed'],
+            'dispatch_jitter_p99_ms': dispatch['jitter_p99_ms']
+        },
+        'latency': {
+            # Vehicle datagram received by the server -> JSON parsed by the client
+            'client_end_to_end': client_latency.summary(),
+            'server_end_to_end': window_histogram(e2e_before, e2e_after).summary(),
+            'stages': {name: window_histogram(before['stages'].get(name), h).summary()
+                       for name, h in main.metrics.stages.items()}
+        },
+        'resources': {
+            'server_cpu_percent': round(100.0 * (after['cpu'] - before['cpu']) / elapsed, 1),
+            'server_rss_mb': round(current_rss, 1) if current_rss is not None else None,
+            'server_peak_rss_mb': round(peak_rss, 1),
+            'worker_cpu_percent': [round(result['cpu_percent'], 1) for result in results]
+        },
+        'elapsed': round(elapsed, 3)
+    }
+
+
+# ---------------------------------------------------------------- reporting
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lookup(results: Dict[str, Any], path: str):
+    value: Any = results
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]):
+    print(f"\n📊 vs {baseline.get('label') or baseline.get('git_commit') or 'baseline'}")
+    for path, higher_is_better in COMPARE_KEYS:
+        old = lookup(baseline['results'], path)
+        new = lookup(current['results'], path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100.0 if old else 0.0
+        better = (change >= 0) == higher_is_better or change == 0
+        print(f"  {'✅' if better else '⚠️'} {path:40} {old:>12} -> {new:>12}  ({change:+.1f}%)")
+
+
+def report(result: Dict[str, Any]):
+    results = result['results']
+    ingest, fanout, resources = results['ingest'], results['fanout'], results['resources']
+    e2e = results['latency']['client_end_to_end']
+    print(f"🛩️  ingest   {ingest['decoded_per_second']:>10,.0f} msg/s  "
+          f"(sent {ingest['sent_per_second']:,.0f}, loss {ingest['loss_ratio']})")
+    print(f"📡 fan-out  {fanout['client_messages_per_second']:>10,.0f} msg/s  "
+          f"{fanout['client_bytes_per_second'] / 1e6:.2f} MB/s  dropped {fanout['server_dropped']}")
+    print(f"⏱️  latency  p50 {e2e['p50_ms']} ms  p99 {e2e['p99_ms']} ms  max {e2e['max_ms']} ms")
+    print(f"🖥️  server   CPU {resources['server_cpu_percent']}%  RSS {resources['server_rss_mb']} MB  "
+          f"(workers {resources['worker_cpu_percent']}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vehicles', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--hz', type=float, default=10.0, help='telemetry ticks per vehicle per second')
+    parser.add_argument('--rate', type=float, default=10.0, help='client subscription rate (Hz)')
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--workers', type=int, default=2, help='load generator processes')
+    parser.add_argument('--seed', type=int, default=1, help='simulator seed (same seed, same flights)')
+    parser.add_argument('--label', help='name of this run in the results file')
+    parser.add_argument('--out', default='loadtest.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    args = parser.parse_args()
+    args.workers = max(1, min(args.workers, max(args.vehicles, args.clients, 1)))
+
+    print(f"🚀 {args.vehicles} vehicles at {args.hz:g} Hz, {args.clients} clients at {args.rate:g} Hz, "
+          f"{args.duration:g}s measured")
+    result = {
+        'label': args.label,
+        'git_commit': git_commit(),
+        'timestamp': time.time(),
+        'python': sys.version.split()[0],
+        'config': {key: getattr(args, key) for key in ('vehicles', 'clients', 'hz', 'rate', 'duration',
+                                                        'warmup', 'workers', 'seed')},
+        'results': asyncio.run(run_load(args))
+    }
+    report(result)
+    with open(args.out, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
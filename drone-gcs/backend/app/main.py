@@ -2,16 +2,45 @@
 COMPLETE GCS Backend with MAVLink, WebRTC, and Network Features
 Meets all UAVcast-Pro and AirCast requirements
 """
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import asyncio
-import json
+import os
 import time
 import random
 import uvicorn
 import logging
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Set
+from commands import CommandManager, VehicleCommandEndpoint
+from database import Database
+from exporter import exporter_from_env
+from fanout import FanoutHub
+from fleet import (MAV_TYPE_GCS, FleetRegistry, matches_filter, parse_vehicle_filter, parse_vehicle_id,
+                   vehicle_id)
+from geoindex import GeoIndex, parse_bbox, parse_polygon
+from flight_model import FlightModel
+from latency import metrics
+from flight_log import FlightLogReader, FlightLogWriter
+from mavlink_codec import MESSAGE_IDS, MAVLinkDecoder, TelemetryState, encode_frame
+from mavlink_ingest import MAVLinkIngest
+from mission_planner import MissionPlanner
+from mission import (MAV_AUTOPILOT_ARDUPILOTMEGA, MissionError, MissionItem, MissionManager, MissionTransfer,
+                     VehicleMissionEndpoint, flight_plan, waypoint_items)
+from rate_control import (DEFAULT_RATE, FULL_FRAME, MAX_RATE, RateController, clamp_rate, group_filter,
+                          parse_groups, select_fields)
+from scheduler import scheduler
+from telemetry_delta import DeltaStream
+import ws_codec
+
+try:
+    # Video needs aiortc, PyAV and OpenCV; the GCS runs without them
+    from peer_governor import AdmissionError
+    from webrtc_server import webrtc_server
+    from video_recorder import VideoIndex, VideoRecorder
+except ImportError:
+    webrtc_server = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -35,114 +64,60 @@ app.add_middleware(
 )
 
 class MAVLinkTelemetry:
-    """MAVLink protocol telemetry simulation"""
-    def __init__(self):
+    """Simulated vehicle: SITL-lite flight model that emits real MAVLink frames"""
+    def __init__(self, seed: Optional[int] = None, speed: float = 1.0):
         # Bangalore, India coordinates
-        self.lat = 12.9716
-        self.lon = 77.5946
-        self.alt = 100.0
-        self.armed = False
-        self.mode = "GUIDED"
-        self.battery = 95.0
-        self.satellites = 15
-        self.heading = 0.0
-        self.groundspeed = 0.0
-        self.voltage = 12.6
-        self.current = 0.0
-        self.rssi = -55
-        
-    def get_telemetry(self) -> Dict:
-        """Generate MAVLink-style telemetry data"""
-        # Simulate GPS movement around Bangalore
-        self.lat += random.uniform(-0.0001, 0.0001)
-        self.lon += random.uniform(-0.0001, 0.0001)
-        
-        # Flight dynamics simulation
-        if self.armed:
-            self.groundspeed = random.uniform(8.0, 15.0)
-            self.alt += random.uniform(-2.0, 2.0)
-            self.battery = max(0, self.battery - 0.02)
-            self.voltage = 12.0 + (self.battery / 100) * 0.6
-            self.current = random.uniform(5.0, 15.0)
-        else:
-            self.groundspeed = 0.0
-            self.current = 0.0
-            
-        # Update orientation
-        self.heading = (self.heading + random.uniform(-5.0, 5.0)) % 360
+        self.model = FlightModel(1, seed=seed)
+        self.speed = speed
+        self.last_step: Optional[float] = None
+        self.last_status = float("-inf")
+        # Autopilot side of the mission and command protocols; replies queue until receive() returns them
+        self.replies: List[bytes] = []
+        sysid, compid = int(self.model.sysids[0]), int(self.model.compids[0])
+        self.missions = VehicleMissionEndpoint(self.replies.append, sysid, compid, on_mission=self.load_mission)
+        self.commands = VehicleCommandEndpoint(self.replies.append, sysid, compid, execute=self.handle_command)
+        self.peers: Dict[tuple, TelemetryState] = {}
+        self.decoder = MAVLinkDecoder(state_for=self._peer,
+                                      routes={**self.missions.routes(), **self.commands.routes()})
+        # True while the GCS decoder is reading our own frames
+        self.feeding = False
+        # First real vehicle heard; the simulation stops for good once it is set
+        self.superseded_by: Optional[str] = None
         
-        # GPS simulation
-        self.satellites = random.randint(12, 18)
-        
-        # Signal strength simulation
-        self.rssi = random.uniform(-75, -45)
-        
-        return {
-            # MAVLink GPS data
-            'lat': self.lat,
-            'lon': self.lon,
-            'alt': self.alt,
-            'relative_alt': self.alt,
-            'groundspeed': self.groundspeed,
-            'airspeed': self.groundspeed * 1.1,
-            'heading': self.heading,
-            
-            # MAVLink system status
-            'armed': self.armed,
-            'mode': self.mode,
-            'system_status': 'ACTIVE' if self.armed else 'STANDBY',
-            
-            # MAVLink battery status
-            'battery_remaining': self.battery,
-            'voltage_battery': self.voltage,
-            'current_battery': self.current,
-            
-            # MAVLink GPS info
-            'satellites': self.satellites,
-            'fix_type': 3,  # 3D fix
-            'eph': random.uniform(0.5, 2.0),  # HDOP
-            'epv': random.uniform(1.0, 3.0),  # VDOP
-            
-            # MAVLink communication
-            'rssi': self.rssi,
-            'noise': random.uniform(-90, -80),
-            
-            # MAVLink attitude
-            'roll': random.uniform(-10.0, 10.0),
-            'pitch': random.uniform(-5.0, 5.0),
-            'yaw': self.heading,
-            
-            # Timestamps
-            'timestamp': time.time(),
-            'message_id': f"MAV_{int(time.time())}"
-        }
+    def step(self) -> List[bytes]:
+        """Advance the flight model by the elapsed time (times `speed`) and return its datagrams"""
+        now = time.monotonic()
+        if self.last_step is not None:
+            self.model.advance(min(now - self.last_step, 1.0) * self.speed)
+        self.last_step = now
+        status = now - self.last_status >= 1.0
+        if status:
+            self.last_status = now
+        return self.model.datagrams(status)
     
     def handle_command(self, command: str, params: Dict) -> bool:
-        """Handle MAVLink commands"""
+        """Handle MAVLink commands (TAKEOFF, GUIDED goto, RTL, LAND, ... fly the model)"""
         logger.info(f"📡 MAVLink Command: {command} {params}")
-        
-        if command == "ARM":
-            self.armed = True
-            return True
-        elif command == "DISARM":
-            self.armed = False
-            return True
-        elif command == "SET_MODE":
-            if 'mode' in params:
-                self.mode = params['mode']
-            return True
-        elif command == "TAKEOFF":
-            if self.armed:
-                self.mode = "TAKEOFF"
-                return True
-        elif command == "RTL":
-            self.mode = "RTL"
-            return True
-        elif command == "GUIDED":
-            self.mode = "GUIDED"
-            return True
-            
-        return False
+        return self.model.command(0, command, params)
+    
+    def _peer(self, sysid: int, compid: int, msg_id: int) -> TelemetryState:
+        state = self.peers.get((sysid, compid))
+        if state is None:
+            state = self.peers[(sysid, compid)] = TelemetryState(sysid, compid)
+        return state
+    
+    def receive(self, frame: bytes) -> List[bytes]:
+        """Hand a GCS frame to the simulated autopilot and return its replies"""
+        self.decoder.feed(frame)
+        replies = self.replies[:]
+        self.replies.clear()
+        return replies
+    
+    def load_mission(self, items: List[MissionItem]) -> bool:
+        """Fly an uploaded mission the way ArduPilot reads it (item 0 is home)"""
+        waypoints, rtl, land, seq_base = flight_plan(items)
+        self.model.set_mission(0, waypoints, rtl, land, seq_base)
+        return True
 
 class NetworkManager:
     """UAVcast-Pro style network management"""
@@ -196,6 +171,20 @@ class NetworkManager:
         """Get ZeroTier network status"""
         return self.zerotier_networks
     
+    def get_connection_quality(self) -> str:
+        """Calculate connection quality"""
+        latency = self.network_status["latency"]
+        packet_loss = self.network_status["packet_loss"]
+        
+        if latency < 50 and packet_loss < 0.5:
+            return "excellent"
+        elif latency < 100 and packet_loss < 1.0:
+            return "good"
+        elif latency < 200 and packet_loss < 2.0:
+            return "fair"
+        else:
+            return "poor"
+    
     def connect_to_zerotier(self, network_id: str) -> bool:
         """Simulate ZeroTier connection"""
         for network in self.zerotier_networks:
@@ -207,46 +196,537 @@ class NetworkManager:
         return False
 
 class ConnectionManager:
-    """Manage WebSocket connections"""
+    """Manage WebSocket connections through per-client send queues"""
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.hub = FanoutHub(encoders=ws_codec.ENCODERS, latency=metrics)
+        self.queue_latency = metrics.stage("queue")
+        self.probe_id = 0
+    
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.hub.clients)
+    
+    async def connect(self, websocket: WebSocket, vehicle_filter: Optional[Set[str]] = None,
+                      protocol: str = "json", rate: Optional[float] = None,
+                      groups: Optional[Dict[str, float]] = None, viewport: Optional[tuple] = None) -> str:
+        """Accept the client, negotiating a binary subprotocol if it asked for one"""
+        subprotocol = ws_codec.negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        
+        async def send(payload):
+            if isinstance(payload, bytes):
+                await websocket.send_bytes(payload)
+            else:
+                await websocket.send_text(payload)
+        
+        encoding = subprotocol or ws_codec.ENCODING_JSON
+        label = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else None
+        self.register(websocket, send, encoding, label, vehicle_filter, protocol, rate, groups, viewport)
+        logger.info(f"✅ Client connected ({encoding}). Total: {len(self.hub)}")
+        return encoding
     
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"✅ Client connected. Total: {len(self.active_connections)}")
+    def register(self, key, send, encoding: str, label: Optional[str],
+                 vehicle_filter: Optional[Set[str]] = None, protocol: str = "json",
+                 rate: Optional[float] = None, groups: Optional[Dict[str, float]] = None,
+                 viewport: Optional[tuple] = None, send_reliable=None):
+        """Add a hub client (WebSocket or WebRTC data channels) with its subscription state"""
+        if encoding == ws_codec.SUBPROTOCOL_STRUCT:
+            # Struct frames always carry full telemetry
+            protocol = "json"
+            groups = None
+        channel = self.hub.add(key, send, encoding, label, send_reliable)
+        channel.context["vehicle_filter"] = vehicle_filter
+        # Map bbox (south, west, north, east) and the vehicles last seen inside it
+        channel.context["viewport"] = viewport
+        channel.context["in_view"] = set()
+        channel.context["protocol"] = protocol
+        channel.context["rate"] = RateController(rate, groups)
+        # Last delta seq / telemetry timestamp sent per (vehicle, group)
+        channel.context["delta_seq"] = {}
+        channel.context["sent_version"] = {}
+        # Set while the client takes telemetry over its WebRTC data channel instead
+        channel.context["paused"] = False
+        return channel
     
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        logger.info(f"🔌 Client disconnected. Total: {len(self.active_connections)}")
+        self.hub.remove(websocket)
+        logger.info(f"🔌 Client disconnected. Total: {len(self.hub)}")
     
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+    def set_vehicle_filter(self, websocket: WebSocket, vehicle_filter: Optional[Set[str]]):
+        channel = self.hub.clients.get(websocket)
+        if channel is not None:
+            channel.context["vehicle_filter"] = vehicle_filter
     
-    async def broadcast(self, message: str):
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                disconnected.append(connection)
-        for connection in disconnected:
-            self.disconnect(connection)
+    def set_paused(self, websocket: WebSocket, paused: bool):
+        channel = self.hub.clients.get(websocket)
+        if channel is not None:
+            channel.context["paused"] = paused
+            if not paused:
+                self.reset_stream(websocket)
+    
+    def set_viewport(self, websocket: WebSocket, viewport: Optional[tuple]):
+        channel = self.hub.clients.get(websocket)
+        if channel is not None:
+            channel.context["viewport"] = viewport
+            if viewport is None:
+                channel.context["in_view"] = set()
+    
+    def get_protocol(self, websocket: WebSocket) -> str:
+        channel = self.hub.clients.get(websocket)
+        return channel.context.get("protocol", "json") if channel else "json"
+    
+    def set_protocol(self, websocket: WebSocket, protocol: str):
+        channel = self.hub.clients.get(websocket)
+        if channel is not None and channel.encoding != ws_codec.SUBPROTOCOL_STRUCT:
+            channel.context["protocol"] = protocol
+    
+    def set_rate(self, websocket: WebSocket, rate: Optional[float], groups: Optional[Dict[str, float]]):
+        channel = self.hub.clients.get(websocket)
+        if channel is not None:
+            if channel.encoding == ws_codec.SUBPROTOCOL_STRUCT:
+                groups = None
+            channel.context["rate"].subscribe(rate, groups)
+            self.reset_stream(websocket)
+    
+    def get_rate(self, websocket: WebSocket) -> Dict:
+        channel = self.hub.clients.get(websocket)
+        return channel.context["rate"].get_statistics() if channel else {}
+    
+    def reset_stream(self, websocket: WebSocket, vid: Optional[str] = None):
+        """Forget what a client has seen so its next due tick carries keyframes (connect, subscribe, resync)"""
+        channel = self.hub.clients.get(websocket)
+        if channel is None:
+            return
+        for state in (channel.context["delta_seq"], channel.context["sent_version"]):
+            for key in [key for key in state if vid is None or key[0] == vid]:
+                del state[key]
+        controller = channel.context["rate"]
+        for group in controller.next_due:
+            controller.next_due[group] = 0.0
+    
+    def dispatch_telemetry(self, vehicles: Dict[str, Dict], now: float, geo: Optional[GeoIndex] = None) -> int:
+        """Queue telemetry for every client whose groups are due at its own rate
+        
+        Full-frame (json) clients get each vehicle's latest sample; delta
+        clients get the fields changed since the seq they last received.
+        Clients due for the same thing share one serialized frame. Clients
+        with a map viewport only get the vehicles `geo` places inside it.
+        """
+        mono = time.monotonic()
+        messages: Dict = {}
+        frames: Dict = {}
+        visible: Dict = {}
+        queued = 0
+        for channel in list(self.hub.clients.values()):
+            context = channel.context
+            if context["paused"]:
+                continue
+            controller = context["rate"]
+            due = controller.due(mono, DISPATCH_SLACK)
+            if not due:
+                continue
+            vehicle_filter = context.get("vehicle_filter")
+            delta = context.get("protocol") == "delta"
+            viewport = context.get("viewport")
+            in_view = None
+            if viewport is not None and geo is not None:
+                in_view = visible.get(viewport)
+                if in_view is None:
+                    in_view = visible[viewport] = geo.within_bbox(*viewport)
+                self._leave_viewport(channel, in_view)
+            for group in due:
+                sent = False
+                for vid, telemetry in vehicles.items():
+                    if in_view is not None and vid not in in_view:
+                        continue
+                    if not matches_filter(vid, vehicle_filter):
+                        continue
+                    if delta:
+                        stream = delta_streams.get(vid)
+                        base = context["delta_seq"].get((vid, group), 0)
+                        if stream is None or base >= stream.seq:
+                            continue
+                        key = ("delta", vid, group, base)
+                        message = messages.get(key)
+                        if message is None:
+                            message = messages[key] = stream.since(base, group_filter(group), now)
+                            self._record_queue(telemetry, now)
+                        context["delta_seq"][(vid, group)] = stream.seq
+                    else:
+                        version = telemetry.get("timestamp")
+                        if version is not None and context["sent_version"].get((vid, group)) == version:
+                            continue
+                        key = ("json", vid, group)
+                        message = messages.get(key)
+                        if message is None:
+                            message = messages[key] = {
+                                "type": "telemetry",
+                                "vehicle_id": vid,
+                                "data": select_fields(telemetry, group),
+                                "timestamp": now,
+                                "mavlink": True
+                            }
+                            self._record_queue(telemetry, now)
+                        context["sent_version"][(vid, group)] = version
+                    if group != FULL_FRAME:
+                        message["groups"] = [group]
+                    topic = f"telemetry:{vid}" if group == FULL_FRAME else f"telemetry:{vid}:{group}"
+                    self.hub.offer(channel, message, topic, frames, key, origin=telemetry.get("timestamp"))
+                    queued += 1
+                    sent = True
+                if sent:
+                    controller.consume(group, mono)
+        return queued
+    
+    def _leave_viewport(self, channel, in_view: Set[str]):
+        """Tell the client which vehicles left its viewport; their next update is a keyframe"""
+        context = channel.context
+        left = context["in_view"] - in_view
+        context["in_view"] = in_view
+        if not left:
+            return
+        for state in (context["delta_seq"], context["sent_version"]):
+            for key in [key for key in state if key[0] in left]:
+                del state[key]
+        self.hub.send_to(channel.key, {
+            "type": "viewport_leave",
+            "vehicle_ids": sorted(left),
+            "timestamp": time.time()
+        })
+    
+    def _record_queue(self, telemetry: Dict, now: float):
+        """Age of the telemetry when it is picked up for dispatch"""
+        received = telemetry.get("timestamp")
+        if received:
+            self.queue_latency.record(now - received)
+    
+    def observe_links(self, quality: Optional[str] = None):
+        """Feed each client's delivery counters (and the link quality, if given) to its rate controller"""
+        mono = time.monotonic()
+        for channel in list(self.hub.clients.values()):
+            controller = channel.context["rate"]
+            if quality is not None:
+                controller.set_link_quality(quality)
+            controller.observe(mono, channel.dropped, len(channel.reliable), channel.send_lag)
+    
+    def send_rtt_probes(self):
+        """Ask every client to echo a probe; answered with {"type": "rtt_ack", "probe_id": n}"""
+        self.probe_id += 1
+        mono = time.monotonic()
+        for key, channel in list(self.hub.clients.items()):
+            channel.context["probe"] = (self.probe_id, mono)
+            self.hub.send_to(key, {"type": "rtt_probe", "probe_id": self.probe_id, "timestamp": time.time()})
+    
+    def record_rtt(self, websocket: WebSocket, probe_id):
+        channel = self.hub.clients.get(websocket)
+        probe = channel.context.get("probe") if channel else None
+        if probe and probe[0] == probe_id:
+            channel.context["rate"].record_rtt(time.monotonic() - probe[1])
+    
+    def get_rates(self) -> Dict[str, Dict[str, float]]:
+        """Effective rate of each client's groups in Hz"""
+        return {channel.context["label"]: channel.context["rate"].get_statistics()["rates"]
+                for channel in self.hub.clients.values()}
+    
+    def get_rate_statistics(self) -> Dict[str, Dict]:
+        return {channel.context["label"]: channel.context["rate"].get_statistics()
+                for channel in self.hub.clients.values()}
+    
+    def send_personal_message(self, message, websocket: WebSocket):
+        """Queue a reliable message (reply, command ack) for one client"""
+        self.hub.send_to(websocket, message)
+    
+    def broadcast(self, message, topic: Optional[str] = None, vid: Optional[str] = None,
+                  protocol: Optional[str] = None) -> int:
+        """Serialize once and queue for every client, or those subscribed to vehicle `vid`
+        and speaking `protocol`
+        
+        Messages with a topic are latest-value-wins for clients that fall behind.
+        """
+        def predicate(channel):
+            context = channel.context
+            if protocol is not None and context.get("protocol", "json") != protocol:
+                return False
+            return vid is None or matches_filter(vid, context.get("vehicle_filter"))
+        return self.hub.publish(message, topic=topic, predicate=predicate)
 
 # Initialize managers
-mavlink = MAVLinkTelemetry()
+MAVLINK_CONNECTION = os.environ.get("MAVLINK_CONNECTION", "udp:0.0.0.0:14550")
+SIM_VEHICLE_ID = "1:1"
+SIM_ENABLED = os.environ.get("SIMULATION", "on") != "off"
+SIM_SEED = int(os.environ["SIM_SEED"]) if os.environ.get("SIM_SEED") else None
+SIM_SPEED = float(os.environ.get("SIM_SPEED", "1"))
+FLIGHT_LOG_DIR = os.environ.get("FLIGHT_LOG_DIR", "flight_logs")
+FLIGHT_LOG_ENABLED = os.environ.get("FLIGHT_LOG", "on") != "off"
+FLIGHT_LOG_TLOG = os.environ.get("FLIGHT_LOG_TLOG", "0") == "1"
+# Oldest segments are deleted beyond this many MiB (0 = keep everything)
+FLIGHT_LOG_MAX_MB = int(os.environ.get("FLIGHT_LOG_MAX_MB", "2048"))
+# Camera recording muxes the packets of the shared WebRTC encode (no second encode)
+VIDEO_RECORD_DIR = os.environ.get("VIDEO_RECORD_DIR", "video_segments")
+VIDEO_RECORD_ENABLED = os.environ.get("VIDEO_RECORD", "off") == "on"
+VIDEO_RECORD_FORMAT = os.environ.get("VIDEO_RECORD_FORMAT", "mkv")
+# VP8 is what browsers negotiate first, so mkv recordings share the viewers' encode
+VIDEO_RECORD_CODEC = os.environ.get("VIDEO_RECORD_CODEC", "H264" if VIDEO_RECORD_FORMAT == "mp4" else "VP8")
+VIDEO_SEGMENT_SECONDS = float(os.environ.get("VIDEO_SEGMENT_SECONDS", "60"))
+# WebRTC admission: concurrent peers, and CPU cores video encoding may use (0 = no limit)
+WEBRTC_MAX_PEERS = int(os.environ.get("WEBRTC_MAX_PEERS", "32"))
+WEBRTC_ENCODE_BUDGET = float(os.environ.get("WEBRTC_ENCODE_BUDGET", str(max(1, (os.cpu_count() or 2) // 2))))
+WEBRTC_SWEEP_INTERVAL = 5.0
+# NetworkManager's link figures are simulated; only cap client rates by them when they are real
+LINK_QUALITY_CEILING = os.environ.get("LINK_QUALITY_CEILING", "off") == "on"
+
+TELEMETRY_PROTOCOLS = ("json", "delta")
+# Telemetry data channel: frames beyond this much unsent data are dropped (latest-wins)
+DATACHANNEL_BUFFER_LIMIT = 64 * 1024
+
+# Dispatch at the highest client rate; sample, store and advance delta streams at 10 Hz
+DISPATCH_INTERVAL = 1.0 / MAX_RATE
+DISPATCH_SLACK = DISPATCH_INTERVAL / 2
+SAMPLE_INTERVAL = 0.1
+RTT_PROBE_INTERVAL = 2.0
+NETWORK_STATUS_INTERVAL = 10.0
+GCS_HEARTBEAT_INTERVAL = 1.0
+HEARTBEAT_ID = MESSAGE_IDS['HEARTBEAT']
+STATS_INTERVAL = 60.0
+
+# GCS identity for the heartbeat we send to vehicles (MAV_AUTOPILOT_INVALID, MAV_STATE_ACTIVE)
+GCS_SYSID = 255
+GCS_COMPID = 190
+
+# Mission transfers: per-step timeout, retries in a row, download request window (ArduPilot)
+MISSION_TIMEOUT = 1.5
+MISSION_RETRIES = 5
+MISSION_WINDOW = 16
+
+mavlink = MAVLinkTelemetry(SIM_SEED, SIM_SPEED)
+fleet = FleetRegistry()
+delta_streams: Dict[str, DeltaStream] = {}
+flight_log = FlightLogWriter(FLIGHT_LOG_DIR, tlog=FLIGHT_LOG_TLOG, max_bytes=FLIGHT_LOG_MAX_MB * 1024 * 1024) \
+    if FLIGHT_LOG_ENABLED else None
+flight_log_reader = FlightLogReader(FLIGHT_LOG_DIR)
+exporter = exporter_from_env()
+video_index = VideoIndex(VIDEO_RECORD_DIR) if webrtc_server else None
+video_recorder = VideoRecorder(webrtc_server.video.stream("camera", VIDEO_RECORD_CODEC), video_index,
+                               VIDEO_RECORD_FORMAT, VIDEO_SEGMENT_SECONDS) \
+    if webrtc_server and VIDEO_RECORD_ENABLED else None
+
+def log_frame(frame, sysid: int, compid: int, now: float):
+    """Decoder tap: every raw MAVLink frame goes to the flight log"""
+    flight_log.write_frame(bytes(frame), now, sysid, compid)
+
+def send_to_vehicles(frame: bytes) -> bool:
+    """Vehicle link for GCS frames; the simulated autopilot answers while it flies"""
+    if simulating():
+        loop = asyncio.get_event_loop()
+        for reply in mavlink.receive(frame):
+            # Next loop turn, so replies never re-enter the decoder that triggered them
+            loop.call_soon(feed_simulated, reply)
+        return True
+    return mavlink_ingest.send(frame)
+
+def on_vehicle_message(spec, state: TelemetryState):
+    """Decoder hook: fleet bookkeeping, and the simulation gives way to the first real vehicle
+    
+    Only a decoded HEARTBEAT from a vehicle (not a ground station, not the
+    simulator's own frames) counts; junk datagrams or port scans do not.
+    """
+    fleet.on_message(spec, state)
+    if (spec.msg_id == HEARTBEAT_ID and not mavlink.feeding and mavlink.superseded_by is None
+            and state.vehicle_type != MAV_TYPE_GCS):
+        mavlink.superseded_by = vehicle_id((state.sysid, state.compid))
+        if SIM_ENABLED:
+            logger.info(f"✅ Real vehicle {mavlink.superseded_by} connected, simulation stopped")
+
+def vehicle_autopilot(sysid: int, compid: int) -> Optional[int]:
+    state = fleet.get(sysid, compid)
+    return state.autopilot if state else None
+
+def report_mission_progress(transfer: MissionTransfer):
+    """Mission transfer progress to the clients watching that vehicle"""
+    status = transfer.get_status()
+    vid = status["vehicle_id"]
+    connection_mgr.broadcast({
+        "type": "mission_progress",
+        "data": status,
+        "timestamp": time.time()
+    }, topic=f"mission:{vid}", vid=vid)
+
+mission_mgr = MissionManager(send_to_vehicles, GCS_SYSID, GCS_COMPID, timeout=MISSION_TIMEOUT,
+                             retries=MISSION_RETRIES, window=MISSION_WINDOW, autopilot_for=vehicle_autopilot,
+                             on_progress=report_mission_progress)
+mission_planner = MissionPlanner()
+command_mgr = CommandManager(send_to_vehicles, GCS_SYSID, GCS_COMPID, latency=metrics)
+mavlink_ingest = MAVLinkIngest(
+    MAVLINK_CONNECTION,
+    MAVLinkDecoder(state_for=fleet.state_for, on_message=on_vehicle_message,
+                   on_frame=log_frame if flight_log else None, latency=metrics,
+                   routes={**mission_mgr.routes(), **command_mgr.routes()}),
+    latency=metrics
+)
 network_mgr = NetworkManager()
 connection_mgr = ConnectionManager()
+database = Database()
+
+def simulating() -> bool:
+    """The simulated vehicle flies until the first real vehicle's HEARTBEAT is decoded"""
+    return SIM_ENABLED and mavlink.superseded_by is None
+
+def feed_simulated(datagram: bytes, now: Optional[float] = None):
+    """Decode the simulated vehicle's frames like any received datagram"""
+    mavlink.feeding = True
+    try:
+        mavlink_ingest.decoder.feed(datagram, now)
+    finally:
+        mavlink.feeding = False
+
+def camera_vehicle() -> Optional[TelemetryState]:
+    """Vehicle whose telemetry the camera HUD shows: the simulated one, else the first live one"""
+    return fleet.get(*parse_vehicle_id(SIM_VEHICLE_ID)) or next(iter(fleet.vehicles.values()), None)
+
+# WebRTC telemetry peers: {"telemetry": unordered maxRetransmits=0 channel, "control": reliable channel}
+datachannel_peers: Dict[Any, Dict[str, Any]] = {}
+
+def attach_datachannel(pc, channel, offer: Dict[str, Any]):
+    """Serve a peer's data channels like a /ws client once both are open
+    
+    Telemetry frames (latest-wins) go over the unreliable "telemetry"
+    channel, so a lost packet never holds back later updates; replies,
+    command acks and client messages use the reliable "control" channel.
+    """
+    channels = datachannel_peers.setdefault(pc, {})
+    channels[channel.label] = channel
+    options = offer.get("telemetry") or {}
+    encoding = ws_codec.negotiate([options.get("encoding")]) or ws_codec.ENCODING_JSON
+    
+    @channel.on("close")
+    def on_close():
+        if datachannel_peers.pop(pc, None) is not None and pc in connection_mgr.hub.clients:
+            connection_mgr.disconnect(pc)
+    
+    if channel.label == "control":
+        @channel.on("message")
+        def on_message(data):
+            try:
+                message = ws_codec.decode_message(encoding, data)
+            except (ValueError, TypeError):
+                connection_mgr.send_personal_message({"type": "error", "message": "Invalid message format"}, pc)
+                return
+            asyncio.ensure_future(handle_control_message(message, pc))
+    
+    telemetry = channels.get("telemetry")
+    control = channels.get("control")
+    if telemetry is None or control is None or pc in connection_mgr.hub.clients:
+        return
+    
+    async def send(payload):
+        if telemetry.readyState != "open":
+            raise ConnectionError("telemetry channel closed")
+        if telemetry.bufferedAmount > DATACHANNEL_BUFFER_LIMIT:
+            # Congested: drop rather than queue stale telemetry behind it; the rate controller sees the drop
+            client.dropped += 1
+            return
+        telemetry.send(payload)
+    
+    async def send_reliable(payload):
+        if control.readyState != "open":
+            raise ConnectionError("control channel closed")
+        control.send(payload)
+    
+    vehicle_filter, protocol, rate, groups, viewport = parse_subscription(options)
+    client = connection_mgr.register(pc, send, encoding, f"webrtc-{id(pc):x}", vehicle_filter,
+                                     protocol, rate, groups, viewport, send_reliable)
+    logger.info(f"✅ WebRTC telemetry client connected ({encoding}). Total: {len(connection_mgr.hub)}")
+    connection_mgr.send_personal_message({
+        "type": "connection",
+        "status": "connected",
+        "message": "Telemetry over WebRTC data channels",
+        "timestamp": time.time(),
+        "transport": "webrtc",
+        "encoding": encoding,
+        "protocol": connection_mgr.get_protocol(pc),
+        "rate": connection_mgr.get_rate(pc)
+    }, pc)
+
+async def handle_control_message(message: Dict, pc):
+    try:
+        await handle_websocket_message(message, pc)
+    except Exception as e:
+        logger.error(f"Error processing data channel message: {e}")
+
+if webrtc_server:
+    webrtc_server.camera.telemetry = camera_vehicle
+    webrtc_server.governor.max_peers = WEBRTC_MAX_PEERS
+    webrtc_server.governor.encode_budget = WEBRTC_ENCODE_BUDGET or None
+    webrtc_server.on_datachannel = attach_datachannel
+
+def get_fleet_telemetry(vehicle_filter: Optional[Set[str]] = None) -> Dict[str, Dict]:
+    """Telemetry per vehicle, decoded from real or simulated MAVLink frames"""
+    return fleet.snapshot(vehicle_filter)
+
+def mission_items(body: Dict[str, Any], sysid: int, compid: int) -> List[MissionItem]:
+    """Items from a request: full `items`, or `waypoints` [[lat, lon, alt], ...] plus `rtl`
+    and `trigger_distance`
+    
+    Waypoints for an ArduPilot vehicle get the home item it expects at seq 0.
+    """
+    if "items" in body:
+        return [MissionItem.from_dict(item, seq) for seq, item in enumerate(body["items"])]
+    waypoints = [tuple(map(float, waypoint[:3])) for waypoint in body.get("waypoints", [])]
+    home = None
+    state = fleet.get(sysid, compid)
+    if state is not None and state.autopilot == MAV_AUTOPILOT_ARDUPILOTMEGA:
+        home = (state.lat, state.lon, state.alt - state.relative_alt)
+    return waypoint_items(waypoints, home, rtl=bool(body.get("rtl", False)),
+                          trigger_distance=body.get("trigger_distance"))
+
+def mission_result(transfer: MissionTransfer) -> Dict[str, Any]:
+    """Final status of a transfer, with the items for a finished download"""
+    status = transfer.get_status()
+    result = {
+        "type": "mission_result",
+        "success": transfer.state == "done",
+        "data": status,
+        "timestamp": time.time()
+    }
+    if transfer.operation == "download" and transfer.state == "done":
+        result["items"] = [item.to_dict() for item in transfer.items]
+    return result
+
+def parse_subscription(params) -> tuple:
+    """Vehicle filter, protocol, rate, groups and viewport from query params or offer options"""
+    vehicle_filter = parse_vehicle_filter(params.get("vehicle"))
+    try:
+        viewport = parse_bbox(params.get("viewport"))
+    except ValueError:
+        viewport = None
+    protocol = params.get("protocol", "json")
+    if protocol not in TELEMETRY_PROTOCOLS:
+        protocol = "json"
+    try:
+        rate = params.get("rate")
+        rate = clamp_rate(rate) if rate else None
+    except ValueError:
+        rate = None
+    groups = parse_groups(params.get("groups"))
+    return vehicle_filter, protocol, rate, groups, viewport
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """Main WebSocket endpoint for real-time communication"""
-    await connection_mgr.connect(websocket)
+    """Main WebSocket endpoint for real-time communication
+    
+    Optional `?vehicle=1,2:1` limits telemetry to the listed sysid or sysid:compid.
+    Optional `?protocol=delta` sends keyframes plus changed fields only.
+    Optional `?rate=20` (1-50 Hz) and `?groups=attitude:30,gps:5` set the
+    telemetry rate; the server lowers it while the client's link is congested.
+    Optional `?viewport=south,west,north,east` limits telemetry to vehicles on the map.
+    """
+    vehicle_filter, protocol, rate, groups, viewport = parse_subscription(websocket.query_params)
+    encoding = await connection_mgr.connect(websocket, vehicle_filter, protocol, rate, groups, viewport)
+    protocol = connection_mgr.get_protocol(websocket)
     
     try:
         # Send initial connection data
-        await websocket.send_json({
+        connection_mgr.send_personal_message({
             "type": "connection",
             "status": "connected", 
             "message": "Connected to DroneNova GCS",
@@ -254,119 +734,293 @@ async def websocket_endpoint(websocket: WebSocket):
             "system_info": {
                 "version": "2.0.0",
                 "mavlink": "enabled",
-                "webrtc": "available",
+                "webrtc": "available" if webrtc_server else "unavailable",
                 "network": "4G/LTE + ZeroTier"
-            }
-        })
+            },
+            "encoding": encoding,
+            "protocol": protocol,
+            "rate": connection_mgr.get_rate(websocket)
+        }, websocket)
         
         # Send initial network status
-        await websocket.send_json({
+        connection_mgr.send_personal_message({
             "type": "network_status",
             "data": network_mgr.get_network_status(),
             "zerotier_networks": network_mgr.get_zerotier_networks()
-        })
+        }, websocket)
         
         # Handle incoming messages
         while True:
             try:
-                data = await websocket.receive_text()
-                message = json.loads(data)
+                message = await receive_message(websocket, encoding)
                 await handle_websocket_message(message, websocket)
                 
-            except json.JSONDecodeError:
-                await websocket.send_json({
+            except (ValueError, TypeError):
+                connection_mgr.send_personal_message({
                     "type": "error",
-                    "message": "Invalid JSON format"
-                })
+                    "message": "Invalid message format"
+                }, websocket)
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 logger.error(f"Error processing message: {e}")
                 break
                 
     except WebSocketDisconnect:
+        pass
+    finally:
         connection_mgr.disconnect(websocket)
 
+async def receive_message(websocket: WebSocket, encoding: str) -> Dict:
+    """Receive one client message as text JSON or binary in the negotiated encoding"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        return ws_codec.decode_message(encoding, message["bytes"])
+    return ws_codec.decode_message(encoding, message["text"])
+
+async def send_vehicle_command(command: str, params: Dict, vid: str) -> Dict[str, Any]:
+    try:
+        sysid, compid = parse_vehicle_id(vid)
+    except ValueError as e:
+        return {"command": command, "vehicle_id": vid, "result": "INVALID", "success": False, "error": str(e)}
+    logger.info(f"📡 MAVLink Command: {command} {params} -> {vid}")
+    return await command_mgr.send_command(sysid, compid, command, params)
+
+async def run_command(command: str, params: Dict, vid: str, websocket: WebSocket):
+    outcome = await send_vehicle_command(command, params, vid)
+    connection_mgr.send_personal_message({
+        "type": "command_ack",
+        **outcome,
+        "timestamp": time.time()
+    }, websocket)
+
 async def handle_websocket_message(message: Dict, websocket: WebSocket):
     """Handle different types of WebSocket messages"""
     msg_type = message.get("type")
     
     if msg_type == "command":
-        # MAVLink commands
-        command = message.get("command")
-        params = message.get("params", {})
-        success = mavlink.handle_command(command, params)
-        
-        await websocket.send_json({
-            "type": "command_ack",
-            "command": command,
-            "success": success,
-            "timestamp": time.time()
-        })
+        # MAVLink commands: the ack reports the vehicle's COMMAND_ACK (or TIMEOUT)
+        command = str(message.get("command"))
+        params = message.get("params") or {}
+        vid = str(message.get("vehicle_id") or SIM_VEHICLE_ID)
+        asyncio.ensure_future(run_command(command, params, vid, websocket))
         
     elif msg_type == "network_command":
         # Network management commands
         command = message.get("command")
         if command == "get_network_status":
-            await websocket.send_json({
+            connection_mgr.send_personal_message({
                 "type": "network_status",
                 "data": network_mgr.get_network_status()
-            })
+            }, websocket)
         elif command == "connect_zerotier":
             network_id = message.get("network_id")
             success = network_mgr.connect_to_zerotier(network_id)
-            await websocket.send_json({
+            connection_mgr.send_personal_message({
                 "type": "zerotier_connection",
                 "success": success,
                 "network_id": network_id
-            })
+            }, websocket)
             
+    elif msg_type == "subscribe":
+        # Change the vehicle filter, protocol and/or rate:
+        # {"type": "subscribe", "vehicles": ["1", "2:1"], "protocol": "delta",
+        #  "rate": 20, "groups": {"attitude": 30, "gps": 5}}
+        vehicles = message.get("vehicles")
+        vehicle_filter = set(map(str, vehicles)) if vehicles else None
+        connection_mgr.set_vehicle_filter(websocket, vehicle_filter)
+        if message.get("protocol") in TELEMETRY_PROTOCOLS:
+            connection_mgr.set_protocol(websocket, message["protocol"])
+        rate = message.get("rate")
+        connection_mgr.set_rate(websocket, clamp_rate(rate) if rate else None,
+                                parse_groups(message.get("groups")))
+        connection_mgr.send_personal_message({
+            "type": "subscribed",
+            "vehicles": sorted(vehicle_filter) if vehicle_filter else None,
+            "protocol": connection_mgr.get_protocol(websocket),
+            "rate": connection_mgr.get_rate(websocket)
+        }, websocket)
+        
+    elif msg_type == "telemetry_transport":
+        # {"type": "telemetry_transport", "transport": "webrtc"} while the client's WebRTC data channel
+        # carries telemetry (this socket keeps everything else); "ws" resumes telemetry here
+        connection_mgr.set_paused(websocket, message.get("transport") == "webrtc")
+        
+    elif msg_type == "viewport":
+        # Only send vehicles on the client's map: {"type": "viewport", "bbox": [south, west, north, east]}
+        # (null bbox for everything). Vehicles that drift out arrive as viewport_leave
+        try:
+            viewport = parse_bbox(message.get("bbox"))
+        except (ValueError, TypeError) as e:
+            connection_mgr.send_personal_message({"type": "error", "message": f"Invalid viewport: {e}"}, websocket)
+            return
+        connection_mgr.set_viewport(websocket, viewport)
+        connection_mgr.send_personal_message({
+            "type": "viewport",
+            "bbox": list(viewport) if viewport else None,
+            "vehicle_ids": sorted(fleet.geo.within_bbox(*viewport)) if viewport else None
+        }, websocket)
+        
+    elif msg_type == "resync":
+        # Delta-mode client detected a seq gap: {"type": "resync", "vehicle_id": "1:1"}
+        # Its next due tick carries keyframes
+        connection_mgr.reset_stream(websocket, message.get("vehicle_id"))
+        
+    elif msg_type in ("mission_upload", "mission_download", "mission_clear"):
+        # {"type": "mission_upload", "vehicle_id": "1:1", "items": [...]} (or "waypoints": [[lat, lon, alt], ...])
+        # Progress is broadcast as mission_progress; the outcome comes back as mission_result
+        operation = msg_type.split("_", 1)[1]
+        vid = str(message.get("vehicle_id", SIM_VEHICLE_ID))
+        try:
+            sysid, compid = parse_vehicle_id(vid)
+            items = mission_items(message, sysid, compid) if operation == "upload" else None
+            transfer = mission_mgr.start(operation, sysid, compid, items)
+        except (MissionError, ValueError, TypeError) as e:
+            connection_mgr.send_personal_message({
+                "type": "mission_result",
+                "success": False,
+                "data": {"operation": operation, "vehicle_id": vid, "state": "failed", "error": str(e)},
+                "timestamp": time.time()
+            }, websocket)
+            return
+        transfer.task.add_done_callback(
+            lambda _: connection_mgr.send_personal_message(mission_result(transfer), websocket))
+        
+    elif msg_type == "rtt_ack":
+        connection_mgr.record_rtt(websocket, message.get("probe_id"))
+        
     elif msg_type == "ping":
-        await websocket.send_json({
+        connection_mgr.send_personal_message({
             "type": "pong",
             "timestamp": time.time()
-        })
+        }, websocket)
 
-async def broadcast_telemetry():
-    """Broadcast MAVLink telemetry to all connected clients"""
-    while True:
-        try:
-            if connection_mgr.active_connections:
-                # Get MAVLink telemetry
-                telemetry = mavlink.get_telemetry()
-                
-                # Create telemetry message
-                telemetry_msg = {
-                    "type": "telemetry",
-                    "data": telemetry,
-                    "timestamp": time.time(),
-                    "mavlink": True
-                }
-                
-                # Broadcast telemetry
-                await connection_mgr.broadcast(json.dumps(telemetry_msg))
-                
-                # Broadcast network status every 10 seconds
-                if int(time.time()) % 10 == 0:
-                    network_msg = {
-                        "type": "network_status", 
-                        "data": network_mgr.get_network_status(),
-                        "timestamp": time.time()
-                    }
-                    await connection_mgr.broadcast(json.dumps(network_msg))
-            
-            await asyncio.sleep(0.1)  # 10Hz MAVLink update rate
-            
-        except Exception as e:
-            logger.error(f"Telemetry broadcast error: {e}")
-            await asyncio.sleep(1)
+def step_simulation():
+    """10 Hz: fly the simulated vehicle and decode its frames like any received datagram"""
+    if not simulating():
+        return
+    now = time.time()
+    for datagram in mavlink.step():
+        feed_simulated(datagram, now)
+
+def sample_telemetry():
+    """10 Hz: store history, flight log and export, and advance the delta streams
+    
+    History and the flight log are kept whether or not anyone is watching.
+    """
+    now = time.time()
+    vehicles = get_fleet_telemetry()
+    for vid, telemetry in vehicles.items():
+        database.store_telemetry(telemetry, vid)
+        if flight_log:
+            flight_log.write_sample(vid, now, telemetry)
+        if exporter:
+            exporter.export(vid, now, telemetry)
+    
+    # Delta clients share one keyframe/delta stream per vehicle
+    for vid in [vid for vid in delta_streams if vid not in vehicles]:
+        del delta_streams[vid]
+    for vid, telemetry in vehicles.items():
+        stream = delta_streams.get(vid)
+        if stream is None:
+            stream = delta_streams[vid] = DeltaStream(vid)
+        stream.update(telemetry, now)
+    
+    connection_mgr.observe_links(network_mgr.get_connection_quality() if LINK_QUALITY_CEILING else None)
+
+def dispatch_telemetry():
+    """50 Hz: send each client the telemetry that is due at its own rate"""
+    if not len(connection_mgr.hub):
+        return
+    # Live vehicles can be sent faster than the sample rate
+    vehicles = fleet.snapshot()
+    connection_mgr.dispatch_telemetry(vehicles, time.time(), fleet.geo)
+
+def broadcast_network_status():
+    """Broadcast network status every 10 seconds"""
+    if not len(connection_mgr.hub):
+        return
+    network_msg = {
+        "type": "network_status", 
+        "data": network_mgr.get_network_status(),
+        "timestamp": time.time()
+    }
+    connection_mgr.broadcast(network_msg, topic="network_status")
+
+def send_rtt_probes():
+    if len(connection_mgr.hub):
+        connection_mgr.send_rtt_probes()
+
+gcs_heartbeat_seq = 0
+
+def send_gcs_heartbeat():
+    """1 Hz GCS heartbeat to the vehicle link (autopilots use it for GCS failsafe)"""
+    global gcs_heartbeat_seq
+    frame = encode_frame(MESSAGE_IDS["HEARTBEAT"], [0, MAV_TYPE_GCS, 8, 0, 4, 3],
+                         sysid=GCS_SYSID, compid=GCS_COMPID, seq=gcs_heartbeat_seq)
+    if mavlink_ingest.send(frame):
+        gcs_heartbeat_seq = (gcs_heartbeat_seq + 1) & 0xFF
+
+def evict_vehicles():
+    """1 Hz: forget vehicles that stopped sending heartbeats, including their in-memory history"""
+    for vid in fleet.evict_stale():
+        database.remove_vehicle(vid)
+
+def log_stats():
+    dispatch = scheduler.jobs["telemetry_dispatch"]
+    logger.info(f"📊 {len(connection_mgr.hub)} clients, {len(fleet)} vehicles, "
+                f"dispatch jitter p99 {dispatch.jitter_percentile(0.99)} ms, missed ticks {dispatch.missed}")
+
+def register_jobs():
+    """Periodic work shared by one drift-free scheduler"""
+    scheduler.register("simulation", SAMPLE_INTERVAL, step_simulation)
+    scheduler.register("telemetry_sample", SAMPLE_INTERVAL, sample_telemetry)
+    scheduler.register("telemetry_dispatch", DISPATCH_INTERVAL, dispatch_telemetry)
+    scheduler.register("rtt_probes", RTT_PROBE_INTERVAL, send_rtt_probes)
+    scheduler.register("network_status", NETWORK_STATUS_INTERVAL, broadcast_network_status)
+    scheduler.register("gcs_heartbeat", GCS_HEARTBEAT_INTERVAL, send_gcs_heartbeat)
+    scheduler.register("fleet_eviction", 1.0, evict_vehicles)
+    scheduler.register("stats", STATS_INTERVAL, log_stats, delay=STATS_INTERVAL)
+    if webrtc_server:
+        scheduler.register("webrtc_peers", WEBRTC_SWEEP_INTERVAL, webrtc_server.governor.sweep)
+    if exporter:
+        scheduler.register("export_flush", exporter.flush_interval / 2, exporter.flush_due)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize all services on startup"""
-    asyncio.create_task(broadcast_telemetry())
+    if flight_log:
+        flight_log.start()
+    if exporter:
+        exporter.start()
+    if video_recorder:
+        video_recorder.start()
+    try:
+        await mavlink_ingest.start()
+    except Exception as e:
+        logger.warning(f"❌ MAVLink ingest unavailable: {e}, simulation only")
+    register_jobs()
+    scheduler.start()
     logger.info("✅ MAVLink telemetry broadcasting started")
     logger.info("🌐 Network management: ACTIVE")
     logger.info("📡 WebSocket server: READY")
-    logger.info("🎮 Simulation: Bangalore, India")
+    if SIM_ENABLED:
+        logger.info(f"🎮 Simulation: SITL-lite vehicle {SIM_VEHICLE_ID} at {SIM_SPEED:g}x (Bangalore, India)")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop periodic jobs, flush and fsync the flight log, flush pending export batches"""
+    scheduler.stop()
+    if flight_log:
+        flight_log.stop()
+    if video_recorder:
+        video_recorder.stop()
+    if exporter:
+        exporter.stop()
+    if webrtc_server:
+        await webrtc_server.cleanup()
 
 @app.get("/")
 async def root():
@@ -393,20 +1047,324 @@ async def root():
 async def health():
     return {
         "status": "healthy",
-        "clients_connected": len(connection_mgr.active_connections),
-        "telemetry_rate": "10Hz",
+        "clients_connected": len(connection_mgr.hub),
+        "fanout": connection_mgr.hub.get_statistics(),
+        "delta_streams": {vid: stream.get_statistics() for vid, stream in delta_streams.items()},
+        "vehicles": len(fleet),
+        "telemetry_rate": {
+            "sample_hz": round(1.0 / SAMPLE_INTERVAL, 1),
+            "dispatch_hz": round(1.0 / DISPATCH_INTERVAL, 1),
+            "default_hz": DEFAULT_RATE,
+            "max_hz": MAX_RATE,
+            "clients": connection_mgr.get_rates()
+        },
+        "rate_control": connection_mgr.get_rate_statistics(),
+        "scheduler": scheduler.get_statistics(),
+        "latency": metrics.summary(),
         "network_status": network_mgr.get_network_status()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text exposition: pipeline latency histograms and a few gauges"""
+    lines = [
+        "# TYPE gcs_websocket_clients gauge",
+        f"gcs_websocket_clients {len(connection_mgr.hub)}",
+        "# TYPE gcs_vehicles gauge",
+        f"gcs_vehicles {len(fleet)}",
+        "# TYPE gcs_scheduler_missed_ticks_total counter"
+    ]
+    for name, job in scheduler.jobs.items():
+        lines.append(f'gcs_scheduler_missed_ticks_total{{job="{name}"}} {job.missed}')
+    return PlainTextResponse("\n".join(lines) + "\n" + metrics.prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
 @app.get("/api/mavlink/telemetry")
-async def get_mavlink_telemetry():
-    """MAVLink telemetry endpoint"""
+async def get_mavlink_telemetry(vehicle: Optional[str] = None):
+    """MAVLink telemetry endpoint, optionally filtered with ?vehicle=1,2:1"""
+    vehicles = get_fleet_telemetry(parse_vehicle_filter(vehicle))
     return {
-        "telemetry": mavlink.get_telemetry(),
+        "telemetry": next(iter(vehicles.values()), None),
+        "vehicles": vehicles,
         "timestamp": time.time(),
         "protocol": "MAVLink"
     }
 
+@app.get("/api/telemetry/history")
+async def get_telemetry_history(vehicle: str = SIM_VEHICLE_ID, start: Optional[float] = None,
+                                end: Optional[float] = None, seconds: float = 300.0):
+    """Columnar telemetry history for one vehicle; defaults to the last `seconds`"""
+    if start is None:
+        start = time.time() - seconds
+    return {
+        "vehicle_id": vehicle,
+        "start": start,
+        "end": end,
+        "columns": database.get_telemetry_range(start, end, vehicle)
+    }
+
+@app.get("/api/telemetry/statistics")
+async def get_telemetry_statistics(vehicle: str = SIM_VEHICLE_ID, window: str = "1h",
+                                   start: Optional[float] = None, end: Optional[float] = None):
+    """Rolling statistics for a 1m/10m/1h window, or recomputed for a start/end range"""
+    if start is not None or end is not None:
+        statistics = database.get_range_statistics(start, end, vehicle)
+    else:
+        statistics = database.get_statistics(vehicle, window)
+    return {
+        "vehicle_id": vehicle,
+        "statistics": statistics,
+        "memory": database.get_memory_usage()
+    }
+
+@app.get("/api/flightlog/segments")
+async def get_flight_log_segments():
+    """Persisted flight log segments and writer counters"""
+    segments = await asyncio.get_event_loop().run_in_executor(None, flight_log_reader.query, "get_segments")
+    return {
+        "segments": segments,
+        "writer": flight_log.get_statistics() if flight_log else None
+    }
+
+@app.get("/api/flightlog/samples")
+async def get_flight_log_samples(vehicle: Optional[str] = None, start: Optional[float] = None,
+                                 end: Optional[float] = None, seconds: float = 300.0):
+    """Telemetry samples read back from the persisted log (survives restarts)"""
+    if start is None:
+        start = time.time() - seconds
+    # Indexing new records and decoding samples stay off the event loop
+    samples = await asyncio.get_event_loop().run_in_executor(
+        None, flight_log_reader.query, "samples", start, end, vehicle)
+    return {
+        "vehicle_id": vehicle,
+        "start": start,
+        "end": end,
+        "samples": samples
+    }
+
+@app.get("/api/export/status")
+async def get_export_status():
+    """Time-series export counters (EXPORT_SINK=influx|file)"""
+    return {
+        "enabled": exporter is not None,
+        "exporter": exporter.get_statistics() if exporter else None
+    }
+
+@app.get("/api/fleet")
+async def get_fleet():
+    """Vehicles currently tracked by the fleet registry"""
+    return {
+        "fleet": fleet.get_statistics(),
+        "ingest": mavlink_ingest.get_statistics(),
+        "missions": mission_mgr.get_statistics(),
+        "commands": command_mgr.get_statistics(),
+        "simulation": simulating()
+    }
+
+def located(vid: str, distance: Optional[float] = None) -> Dict[str, Any]:
+    """A vehicle's indexed position, and its distance in meters from the query point"""
+    lat, lon = fleet.geo.position(vid)
+    entry = {"vehicle_id": vid, "lat": lat, "lon": lon}
+    if distance is not None:
+        entry["distance"] = round(distance, 1)
+    return entry
+
+@app.get("/api/fleet/nearby")
+async def get_fleet_nearby(lat: float, lon: float, radius: float = 2000.0):
+    """Vehicles within `radius` meters of a point, nearest first"""
+    if radius <= 0:
+        raise HTTPException(status_code=400, detail="radius must be positive")
+    return {"vehicles": [located(vid, distance) for vid, distance in fleet.geo.within_radius(lat, lon, radius)]}
+
+@app.get("/api/fleet/nearest")
+async def get_fleet_nearest(lat: float, lon: float, k: int = 1, max_distance: Optional[float] = None):
+    """The `k` vehicles closest to a point, optionally no farther than `max_distance` meters"""
+    if k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1")
+    nearest = fleet.geo.nearest(lat, lon, k, max_distance)
+    return {"vehicles": [located(vid, distance) for vid, distance in nearest]}
+
+@app.post("/api/fleet/within")
+async def get_fleet_within(body: Dict[str, Any]):
+    """Vehicles inside {"polygon": [[lat, lon], ...]} or {"bbox": [south, west, north, east]}"""
+    try:
+        if "polygon" in body:
+            vehicles = fleet.geo.within_polygon(parse_polygon(body["polygon"]))
+        elif body.get("bbox") is not None:
+            vehicles = sorted(fleet.geo.within_bbox(*parse_bbox(body["bbox"])))
+        else:
+            raise ValueError("polygon or bbox is required")
+    except (ValueError, TypeError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"vehicles": [located(vid) for vid in vehicles]}
+
+async def start_mission_transfer(operation: str, vehicle: str, body: Optional[Dict[str, Any]] = None,
+                                 wait: bool = False) -> Dict[str, Any]:
+    try:
+        sysid, compid = parse_vehicle_id(vehicle)
+        items = mission_items(body or {}, sysid, compid) if operation == "upload" else None
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        transfer = mission_mgr.start(operation, sysid, compid, items)
+    except MissionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if wait:
+        await transfer.task
+    return transfer.get_status()
+
+@app.post("/api/vehicles/{vehicle}/command")
+async def post_vehicle_command(vehicle: str, body: Dict[str, Any]):
+    """Send {"command": "TAKEOFF", "params": {"altitude": 20}} and wait for the vehicle's ack"""
+    if "command" not in body:
+        raise HTTPException(status_code=400, detail="command is required")
+    return await send_vehicle_command(str(body["command"]), body.get("params") or {}, vehicle)
+
+@app.get("/api/missions/{vehicle}")
+async def get_mission(vehicle: str):
+    """Mission last uploaded to or downloaded from a vehicle, and its latest transfer"""
+    try:
+        sysid, compid = parse_vehicle_id(vehicle)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = mission_mgr.get_mission(sysid, compid)
+    transfer = mission_mgr.get_transfer(sysid, compid)
+    return {
+        "vehicle_id": vehicle,
+        "count": len(items) if items is not None else None,
+        "items": [item.to_dict() for item in items] if items is not None else None,
+        "transfer": transfer.get_status() if transfer else None
+    }
+
+@app.get("/api/missions/{vehicle}/transfer")
+async def get_mission_transfer(vehicle: str):
+    """Progress of the latest mission transfer with a vehicle"""
+    try:
+        transfer = mission_mgr.get_transfer(*parse_vehicle_id(vehicle))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"vehicle_id": vehicle, "transfer": transfer.get_status() if transfer else None}
+
+@app.post("/api/missions/{vehicle}")
+async def upload_mission(vehicle: str, body: Dict[str, Any], wait: bool = False):
+    """Upload {"items": [...]} or {"waypoints": [[lat, lon, alt], ...], "rtl": true}
+    
+    Runs in the background unless `?wait=true`; progress is on /transfer and
+    the mission_progress WebSocket message.
+    """
+    return await start_mission_transfer("upload", vehicle, body, wait)
+
+@app.post("/api/missions/{vehicle}/download")
+async def download_mission(vehicle: str, wait: bool = False):
+    """Read the vehicle's mission back; the items appear on GET /api/missions/{vehicle}"""
+    return await start_mission_transfer("download", vehicle, wait=wait)
+
+@app.delete("/api/missions/{vehicle}")
+async def clear_mission(vehicle: str, wait: bool = False):
+    """Clear the mission stored on the vehicle"""
+    return await start_mission_transfer("clear", vehicle, wait=wait)
+
+@app.get("/api/planner")
+async def get_planner_status():
+    """Mission planner cache counters"""
+    return {"planner": mission_planner.get_statistics()}
+
+@app.get("/api/planner/plans/{key}")
+async def get_plan(key: str):
+    """A previously generated plan by its parameter hash"""
+    plan = mission_planner.get(key)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="plan not cached")
+    return plan
+
+@app.post("/api/planner/{kind}")
+async def create_plan(kind: str, body: Dict[str, Any], vehicle: Optional[str] = None, rtl: bool = True):
+    """Generate a `survey` grid over {"polygon": [[lat, lon], ...]} or a `corridor` along
+    {"polyline": [[lat, lon], ...], "width": 50}
+    
+    Camera footprint and overlap set the line spacing and trigger distance
+    unless `spacing` is given. With `?vehicle=1:1` the plan is uploaded too.
+    """
+    try:
+        plan = mission_planner.plan(kind, body)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if vehicle is not None:
+        plan["transfer"] = await start_mission_transfer("upload", vehicle, {
+            "waypoints": plan["waypoints"],
+            "rtl": rtl,
+            "trigger_distance": plan["trigger_distance"]
+        })
+    return plan
+
+@app.post("/api/webrtc/offer")
+async def webrtc_offer(body: Dict[str, Any]):
+    """Answer a viewer's {"sdp", "type"} offer; optional `source` and `bitrate` (bps)
+    
+    Offers with "telemetry" and "control" data channels get telemetry over
+    WebRTC; `telemetry` options take the /ws query params (vehicle,
+    protocol, rate, groups, viewport, encoding). Answers 503 when the
+    peer governor is at its peer limit or encoder budget.
+    """
+    if webrtc_server is None:
+        raise HTTPException(status_code=503, detail="WebRTC video requires aiortc")
+    if "sdp" not in body or "type" not in body:
+        raise HTTPException(status_code=400, detail="sdp and type are required")
+    try:
+        return await webrtc_server.offer(body, body.get("source", "camera"), body.get("bitrate"))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except AdmissionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/api/webrtc/stats")
+async def webrtc_stats():
+    """Peers, render and shared-encoder counters"""
+    if webrtc_server is None:
+        raise HTTPException(status_code=503, detail="WebRTC video requires aiortc")
+    return {
+        **webrtc_server.get_statistics(),
+        "telemetry_peers": len(datachannel_peers)
+    }
+
+@app.get("/api/webrtc/peers")
+async def webrtc_peers():
+    """Each peer's connection state, video profile, send bitrate and encoder share"""
+    if webrtc_server is None:
+        raise HTTPException(status_code=503, detail="WebRTC video requires aiortc")
+    return {
+        "governor": webrtc_server.governor.get_statistics(),
+        "peers": webrtc_server.governor.get_peers()
+    }
+
+@app.get("/api/video/segments")
+async def get_video_segments(start: Optional[float] = None, end: Optional[float] = None):
+    """Recorded camera segments overlapping [start, end] (wall-clock, like telemetry history)"""
+    if video_index is None:
+        raise HTTPException(status_code=503, detail="Video recording requires aiortc")
+    return {
+        "segments": video_index.segments(start, end),
+        "recorder": video_recorder.get_statistics() if video_recorder else None
+    }
+
+@app.get("/api/video/locate")
+async def locate_video(timestamp: float):
+    """Segment recorded at `timestamp` and the offset to seek to within it"""
+    if video_index is None:
+        raise HTTPException(status_code=503, detail="Video recording requires aiortc")
+    segment = video_index.locate(timestamp)
+    if segment is None:
+        raise HTTPException(status_code=404, detail="No recording at that time")
+    return segment
+
+@app.get("/api/video/segments/{name}")
+async def get_video_segment(name: str):
+    """Download one recorded segment"""
+    path = video_index.path(name) if video_index else None
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Unknown segment")
+    return FileResponse(path, media_type="video/mp4" if name.endswith(".mp4") else "video/x-matroska")
+
 @app.get("/api/network/status")
 async def get_network_status():
     """Network status endpoint"""
@@ -21,14 +21,14 @@ async def main():
     websocket_server = WebSocketServer()
     
     # Connect to MAVLink
-    mavlink_handler.connect()
+    await mavlink_handler.connect()
     websocket_server.set_mavlink_handler(mavlink_handler)
     
     # Start WebSocket server
     server = await websocket_server.start_server()
     
     # Start telemetry broadcasting
-    asyncio.create_task(websocket_server.broadcast_telemetry())
+    websocket_server.start_broadcast()
     
     logger.info("✅ All services started successfully")
     logger.info("📡 WebSocket: ws://localhost:8765")
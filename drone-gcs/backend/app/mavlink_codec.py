@@ -0,0 +1,441 @@
+"""
+Built-in MAVLink v1/v2 frame codec
+Decodes telemetry frames from a memoryview with precompiled struct layouts
+and writes the fields straight into preallocated per-vehicle state slots
+"""
+import logging
+import math
+import struct
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAVLINK_STX_V1 = 0xFE
+MAVLINK_STX_V2 = 0xFD
+MAVLINK_IFLAG_SIGNED = 0x01
+MAVLINK_SIGNATURE_LEN = 13
+
+# ArduCopter custom modes
+MODE_NAMES = {
+    0: 'STABILIZE',
+    3: 'AUTO',
+    4: 'GUIDED',
+    5: 'LOITER',
+    6: 'RTL',
+    7: 'CIRCLE',
+    9: 'LAND',
+    11: 'DRIFT',
+    13: 'SPORT',
+    15: 'FLIP',
+    16: 'AUTOTUNE',
+    17: 'POSHOLD'
+}
+MODE_NUMBERS = {name: number for number, name in MODE_NAMES.items()}
+
+# MAV_STATE, as the dashboards show HEARTBEAT.system_status
+MAV_STATE_NAMES = {
+    0: 'UNINIT',
+    1: 'BOOT',
+    2: 'CALIBRATING',
+    3: 'STANDBY',
+    4: 'ACTIVE',
+    5: 'CRITICAL',
+    6: 'EMERGENCY',
+    7: 'POWEROFF',
+    8: 'FLIGHT_TERMINATION'
+}
+MAV_STATE_NUMBERS = {name: number for number, name in MAV_STATE_NAMES.items()}
+
+
+def _build_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _build_crc_table()
+
+
+def crc_x25(data, crc: int = 0xFFFF) -> int:
+    """MAVLink X.25 checksum over a bytes-like object"""
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def crc_accumulate(byte: int, crc: int) -> int:
+    """Fold a single byte (e.g. CRC_EXTRA) into a running checksum"""
+    return (crc >> 8) ^ _CRC_TABLE[(crc ^ byte) & 0xFF]
+
+
+class TelemetryState:
+    """Preallocated telemetry slots for one vehicle"""
+
+    __slots__ = (
+        'sysid', 'compid',
+        'lat', 'lon', 'alt', 'relative_alt',
+        'roll', 'pitch', 'yaw', 'rollspeed', 'pitchspeed', 'yawspeed', 'heading',
+        'groundspeed', 'airspeed', 'climb', 'vx', 'vy', 'vz', 'throttle',
+        'mode', 'custom_mode', 'base_mode', 'armed', 'system_status', 'vehicle_type', 'autopilot',
+        'battery_remaining', 'voltage_battery', 'current_battery',
+        'satellites', 'fix_type', 'eph', 'epv',
+        'mission_current', 'mission_total',
+        'rssi', 'timestamp', 'last_heartbeat', 'message_count'
+    )
+
+    # Slots included in to_dict(), in the order the dashboards expect
+    TELEMETRY_FIELDS = (
+        'lat', 'lon', 'alt', 'relative_alt',
+        'roll', 'pitch', 'yaw', 'heading',
+        'groundspeed', 'airspeed', 'climb', 'vx', 'vy', 'vz',
+        'mode', 'armed', 'system_status',
+        'battery_remaining', 'voltage_battery', 'current_battery',
+        'satellites', 'fix_type', 'eph', 'epv',
+        'mission_current', 'mission_total',
+        'rssi', 'timestamp'
+    )
+
+    def __init__(self, sysid: int = 1, compid: int = 1):
+        self.sysid = sysid
+        self.compid = compid
+        self.lat = 0.0
+        self.lon = 0.0
+        self.alt = 0.0
+        self.relative_alt = 0.0
+        self.roll = 0.0
+        self.pitch = 0.0
+        self.yaw = 0.0
+        self.rollspeed = 0.0
+        self.pitchspeed = 0.0
+        self.yawspeed = 0.0
+        self.heading = 0.0
+        self.groundspeed = 0.0
+        self.airspeed = 0.0
+        self.climb = 0.0
+        self.vx = 0.0
+        self.vy = 0.0
+        self.vz = 0.0
+        self.throttle = 0
+        self.mode = 'UNKNOWN'
+        self.custom_mode = 0
+        self.base_mode = 0
+        self.armed = False
+        self.system_status = 0
+        self.vehicle_type = 0
+        self.autopilot = 0
+        self.battery_remaining = 0.0
+        self.voltage_battery = 0.0
+        self.current_battery = 0.0
+        self.satellites = 0
+        self.fix_type = 0
+        self.eph = 0.0
+        self.epv = 0.0
+        self.mission_current = 0
+        self.mission_total = 0
+        self.rssi = 0
+        self.timestamp = 0.0
+        self.last_heartbeat = 0.0
+        self.message_count = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Telemetry snapshot in the same shape and units as the simulation dicts
+
+        ATTITUDE radians become degrees (yaw 0-360 like heading) and the
+        MAV_STATE number becomes its name.
+        """
+        data = {name: getattr(self, name) for name in self.TELEMETRY_FIELDS}
+        data['roll'] = math.degrees(self.roll)
+        data['pitch'] = math.degrees(self.pitch)
+        data['yaw'] = math.degrees(self.yaw) % 360.0
+        data['system_status'] = MAV_STATE_NAMES.get(self.system_status, 'UNKNOWN')
+        return data
+
+
+class MessageSpec:
+    """Wire layout and state writer for one MAVLink message id"""
+
+    __slots__ = ('msg_id', 'name', 'crc_extra', 'layout', 'apply', 'scratch', 'zeros')
+
+    def __init__(self, msg_id: int, name: str, crc_extra: int, fmt: str,
+                 apply: Optional[Callable[[TelemetryState, Tuple], None]] = None):
+        self.msg_id = msg_id
+        self.name = name
+        self.crc_extra = crc_extra
+        self.layout = struct.Struct(fmt)
+        self.apply = apply
+        # Zero-filled buffer for MAVLink v2 payloads with truncated trailing zeros
+        self.scratch = bytearray(self.layout.size)
+        self.zeros = memoryview(bytes(self.layout.size))
+
+
+MESSAGE_SPECS: Dict[int, MessageSpec] = {}
+MESSAGE_IDS: Dict[str, int] = {}
+
+
+def register_message(msg_id: int, name: str, crc_extra: int, fmt: str,
+                     apply: Optional[Callable[[TelemetryState, Tuple], None]] = None) -> MessageSpec:
+    """Register a message layout so the decoder and encoder understand it
+
+    `fmt` is the little-endian struct format of the base payload in wire
+    order (fields sorted by size as MAVLink serializes them). `apply`
+    receives the vehicle state and the unpacked field tuple.
+    """
+    spec = MessageSpec(msg_id, name, crc_extra, fmt, apply)
+    MESSAGE_SPECS[msg_id] = spec
+    MESSAGE_IDS[name] = msg_id
+    return spec
+
+
+def _apply_heartbeat(s: TelemetryState, v: Tuple):
+    custom_mode, vehicle_type, autopilot, base_mode, system_status, _ = v
+    s.custom_mode = custom_mode
+    s.vehicle_type = vehicle_type
+    s.autopilot = autopilot
+    s.base_mode = base_mode
+    s.system_status = system_status
+    s.armed = bool(base_mode & 0x80)
+    s.mode = MODE_NAMES.get(custom_mode, 'UNKNOWN')
+    s.last_heartbeat = s.timestamp
+
+
+def _apply_sys_status(s: TelemetryState, v: Tuple):
+    s.voltage_battery = v[4] / 1000.0
+    s.current_battery = v[5] / 100.0
+    s.battery_remaining = v[12]
+
+
+def _apply_gps_raw_int(s: TelemetryState, v: Tuple):
+    s.lat = v[1] / 1e7
+    s.lon = v[2] / 1e7
+    s.alt = v[3] / 1000.0
+    s.eph = v[4] / 100.0
+    s.epv = v[5] / 100.0
+    s.fix_type = v[8]
+    s.satellites = v[9]
+
+
+def _apply_attitude(s: TelemetryState, v: Tuple):
+    _, s.roll, s.pitch, s.yaw, s.rollspeed, s.pitchspeed, s.yawspeed = v
+
+
+def _apply_global_position_int(s: TelemetryState, v: Tuple):
+    s.lat = v[1] / 1e7
+    s.lon = v[2] / 1e7
+    s.alt = v[3] / 1000.0
+    s.relative_alt = v[4] / 1000.0
+    s.vx = v[5] / 100.0
+    s.vy = v[6] / 100.0
+    s.vz = v[7] / 100.0
+
+
+def _apply_vfr_hud(s: TelemetryState, v: Tuple):
+    s.airspeed, s.groundspeed, s.alt, s.climb, s.heading, s.throttle = v
+
+
+def _apply_mission_current(s: TelemetryState, v: Tuple):
+    s.mission_current = v[0]
+
+
+# Built-in telemetry messages
+register_message(0, 'HEARTBEAT', 50, '<IBBBBB', _apply_heartbeat)
+register_message(1, 'SYS_STATUS', 124, '<IIIHHhHHHHHHb', _apply_sys_status)
+register_message(24, 'GPS_RAW_INT', 24, '<QiiiHHHHBB', _apply_gps_raw_int)
+register_message(30, 'ATTITUDE', 39, '<Iffffff', _apply_attitude)
+register_message(33, 'GLOBAL_POSITION_INT', 104, '<IiiiihhhH', _apply_global_position_int)
+register_message(42, 'MISSION_CURRENT', 28, '<H', _apply_mission_current)
+register_message(74, 'VFR_HUD', 20, '<ffffhH', _apply_vfr_hud)
+
+
+def encode_frame(msg_id: int, values: Tuple, sysid: int = 1, compid: int = 1,
+                 seq: int = 0, v2: bool = True) -> bytes:
+    """Serialize a registered message into a MAVLink v1 or v2 frame"""
+    spec = MESSAGE_SPECS[msg_id]
+    payload = spec.layout.pack(*values)
+
+    if v2:
+        # v2 senders strip trailing zero bytes (at least one byte is kept)
+        end = len(payload)
+        while end > 1 and payload[end - 1] == 0:
+            end -= 1
+        payload = payload[:end]
+        header = struct.pack('<BBBBBBBHB', MAVLINK_STX_V2, len(payload), 0, 0, seq & 0xFF,
+                             sysid, compid, msg_id & 0xFFFF, msg_id >> 16)
+    else:
+        header = struct.pack('<BBBBBB', MAVLINK_STX_V1, len(payload), seq & 0xFF,
+                             sysid, compid, msg_id)
+
+    crc = crc_x25(payload, crc_x25(memoryview(header)[1:]))
+    crc = crc_accumulate(spec.crc_extra, crc)
+    return header + payload + struct.pack('<H', crc)
+
+
+class MAVLinkDecoder:
+    """Incremental MAVLink v1/v2 frame decoder
+
+    Frames are parsed in place from a memoryview; registered messages are
+    CRC-checked and applied to the state returned by `state_for(sysid,
+    compid)`. Frames with unregistered ids are skipped (or passed raw to
+    `on_unknown`) when the byte after them is a start byte or the end of
+    the input; otherwise the start byte is treated as noise. Each datagram
+    is decoded on its own and a truncated tail is discarded; with
+    `stream=True` (byte-stream transports) the tail is carried over to
+    the next feed.
+    `on_frame` sees every CRC-valid or unregistered frame as raw bytes
+    (for logging) before it is applied. `routes` maps message ids without
+    an `apply` (protocol traffic such as mission transfers) to handlers
+    called with the sender's state and the unpacked fields.
+    """
+
+    def __init__(self, state_for: Optional[Callable[[int, int, int], Optional[TelemetryState]]] = None,
+                 on_message: Optional[Callable[[MessageSpec, TelemetryState], None]] = None,
+                 on_unknown: Optional[Callable[[memoryview, int, int, int], None]] = None,
+                 on_frame: Optional[Callable[[memoryview, int, int, float], None]] = None,
+                 latency=None,
+                 routes: Optional[Dict[int, Callable[[TelemetryState, Tuple], None]]] = None,
+                 stream: bool = False):
+        self.state = TelemetryState()
+        self.state_for = state_for or (lambda sysid, compid, msg_id: self.state)
+        self.on_message = on_message
+        self.on_unknown = on_unknown
+        self.on_frame = on_frame
+        self.routes = routes if routes is not None else {}
+        # Optional LatencyRecorder: times apply + on_message per message
+        self._update_latency = latency.stage('state_update') if latency else None
+        self.stream = stream
+        # Unparsed tail carried to the next feed (stream transports only)
+        self._pending = b''
+
+        # Decoder counters
+        self.frames = 0
+        self.crc_errors = 0
+        self.unknown_frames = 0
+        self.dropped_frames = 0
+        self.skipped_bytes = 0
+
+    def feed(self, data, now: Optional[float] = None) -> int:
+        """Decode every complete frame in `data`; returns the number applied"""
+        if self._pending:
+            data = self._pending + bytes(data)
+            self._pending = b''
+        buf = memoryview(data)
+        n = len(buf)
+        if now is None:
+            now = time.time()
+
+        specs = MESSAGE_SPECS
+        state_for = self.state_for
+        applied = 0
+        i = 0
+
+        while i < n:
+            stx = buf[i]
+            if stx == MAVLINK_STX_V2:
+                if n - i < 12:
+                    break
+                plen = buf[i + 1]
+                header_len = 10
+                frame_len = 12 + plen
+                if buf[i + 2] & MAVLINK_IFLAG_SIGNED:
+                    frame_len += MAVLINK_SIGNATURE_LEN
+                sysid = buf[i + 5]
+                compid = buf[i + 6]
+                msg_id = buf[i + 7] | (buf[i + 8] << 8) | (buf[i + 9] << 16)
+            elif stx == MAVLINK_STX_V1:
+                if n - i < 8:
+                    break
+                plen = buf[i + 1]
+                header_len = 6
+                frame_len = 8 + plen
+                sysid = buf[i + 3]
+                compid = buf[i + 4]
+                msg_id = buf[i + 5]
+            else:
+                i += 1
+                self.skipped_bytes += 1
+                continue
+
+            if n - i < frame_len:
+                break
+
+            spec = specs.get(msg_id)
+            if spec is None:
+                end = i + frame_len
+                if end < n and buf[end] != MAVLINK_STX_V2 and buf[end] != MAVLINK_STX_V1:
+                    # No CRC to check, and nothing valid follows: noise that looked like a start byte
+                    i += 1
+                    self.skipped_bytes += 1
+                    continue
+                self.unknown_frames += 1
+                if self.on_frame:
+                    self.on_frame(buf[i:i + frame_len], sysid, compid, now)
+                if self.on_unknown:
+                    self.on_unknown(buf[i:i + frame_len], sysid, compid, msg_id)
+                i += frame_len
+                continue
+
+            payload_end = i + header_len + plen
+            crc = crc_accumulate(spec.crc_extra, crc_x25(buf[i + 1:payload_end]))
+            if crc != buf[payload_end] | (buf[payload_end + 1] << 8):
+                # Resynchronize on the next start byte
+                self.crc_errors += 1
+                i += 1
+                continue
+
+            self.frames += 1
+            if self.on_frame:
+                self.on_frame(buf[i:i + frame_len], sysid, compid, now)
+            state = state_for(sysid, compid, msg_id)
+            if state is None:
+                self.dropped_frames += 1
+                i += frame_len
+                continue
+
+            size = spec.layout.size
+            if plen >= size:
+                values = spec.layout.unpack_from(buf, i + header_len)
+            else:
+                scratch = spec.scratch
+                scratch[:plen] = buf[i + header_len:payload_end]
+                scratch[plen:] = spec.zeros[plen:]
+                values = spec.layout.unpack_from(scratch)
+
+            update_latency = self._update_latency
+            if update_latency is not None:
+                started = time.perf_counter()
+            state.timestamp = now
+            state.message_count += 1
+            if spec.apply:
+                spec.apply(state, values)
+            else:
+                route = self.routes.get(msg_id)
+                if route is not None:
+                    route(state, values)
+            if self.on_message:
+                self.on_message(spec, state)
+            if update_latency is not None:
+                update_latency.record(time.perf_counter() - started)
+            applied += 1
+            i += frame_len
+
+        if i < n:
+            if self.stream:
+                self._pending = bytes(buf[i:])
+            else:
+                self.skipped_bytes += n - i
+        return applied
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get decoder counters"""
+        return {
+            'frames': self.frames,
+            'crc_errors': self.crc_errors,
+            'unknown_frames': self.unknown_frames,
+            'dropped_frames': self.dropped_frames,
+            'skipped_bytes': self.skipped_bytes
+        }
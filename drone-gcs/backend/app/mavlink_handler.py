@@ -4,14 +4,20 @@ Simulates ArduPilot/PX4 SITL telemetry
 """
 import logging
 import time
-import random
 import json
-from typing import Dict, Any, Optional
+import asyncio
+from typing import Dict, Any, Optional, Set
+from commands import CommandManager
+from fleet import FleetRegistry, parse_vehicle_id
+from latency import metrics
+from mavlink_codec import MAVLinkDecoder, MessageSpec, TelemetryState, MODE_NAMES
+from mavlink_ingest import MAVLinkIngest
+from flight_model import FlightModel
 
 logger = logging.getLogger(__name__)
 
 class MAVLinkHandler:
-    def __init__(self, connection_string: str = 'udp:127.0.0.1:14550'):
+    def __init__(self, connection_string: str = 'udp:127.0.0.1:14550', seed: Optional[int] = None):
         self.connection_string = connection_string
         self.connected = False
         self.simulation_mode = True  # Fallback to simulation
@@ -27,6 +33,17 @@ class MAVLinkHandler:
         
         # Initialize simulation data (Bangalore coordinates)
         self.telemetry_data = self._get_initial_telemetry()
+        self.simulator = FlightModel(1, seed=seed)
+        self.last_simulation_step: Optional[float] = None
+        
+        # Asyncio ingest task decodes frames straight into per-vehicle state slots
+        self.fleet = FleetRegistry()
+        # COMMAND_LONG out, COMMAND_ACK correlated by the decoder
+        self.commands = CommandManager(lambda frame: self.ingest.send(frame), latency=metrics)
+        self.decoder = MAVLinkDecoder(state_for=self.fleet.state_for, on_message=self._on_message,
+                                      latency=metrics, routes=self.commands.routes())
+        self.ingest = MAVLinkIngest(connection_string, decoder=self.decoder, latency=metrics)
+        self.last_heartbeat = 0.0
         
     def _get_initial_telemetry(self) -> Dict[str, Any]:
         """Initialize telemetry with Bangalore, India coordinates"""
@@ -78,92 +95,54 @@ class MAVLinkHandler:
             'message_id': f"SIM_{int(time.time())}"
         }
     
-    def connect(self) -> bool:
-        """Connect to MAVLink source (real or simulated)"""
+    async def connect(self) -> bool:
+        """Start the MAVLink ingest endpoint without blocking on a heartbeat
+        
+        Simulation stays active until the first real heartbeat arrives.
+        """
+        self.simulation_mode = True
+        self.connected = True
+        
         try:
-            # Try to import and use real pymavlink
-            from pymavlink import mavutil
-            
             logger.info(f"🔗 Connecting to MAVLink: {self.connection_string}")
-            self.mav_connection = mavutil.mavlink_connection(self.connection_string)
-            
-            # Wait for heartbeat
-            msg = self.mav_connection.recv_match(type='HEARTBEAT', blocking=True, timeout=5)
-            if msg:
-                self.connected = True
-                self.simulation_mode = False
-                logger.info("✅ MAVLink connected successfully (Real connection)")
-                return True
-            else:
-                raise Exception("No heartbeat received")
-                
-        except ImportError:
-            logger.warning("❌ pymavlink not available, using simulation mode")
-            self.simulation_mode = True
-            self.connected = True
-            return True
+            await self.ingest.start()
+            asyncio.create_task(self.fleet.run_eviction())
         except Exception as e:
             logger.warning(f"❌ MAVLink connection failed: {e}, using simulation mode")
-            self.simulation_mode = True
-            self.connected = True
-            return True
-    
-    def update_simulation(self) -> Dict[str, Any]:
-        """Update simulation data with realistic MAVLink-like behavior"""
-        # Simulate GPS movement around Bangalore
-        self.telemetry_data['lat'] = 12.9716 + random.uniform(-0.01, 0.01)
-        self.telemetry_data['lon'] = 77.5946 + random.uniform(-0.01, 0.01)
         
-        # Simulate flight dynamics if armed
-        if self.telemetry_data['armed']:
-            self.telemetry_data['groundspeed'] = random.uniform(8.0, 15.0)
-            self.telemetry_data['alt'] += random.uniform(-2.0, 2.0)
-            self.telemetry_data['relative_alt'] = self.telemetry_data['alt']
-            self.telemetry_data['battery_remaining'] -= 0.02
-            self.telemetry_data['voltage_battery'] = 12.0 + (self.telemetry_data['battery_remaining'] / 100) * 0.6
-            
-            # Simulate attitude changes during flight
-            self.telemetry_data['roll'] = random.uniform(-10.0, 10.0)
-            self.telemetry_data['pitch'] = random.uniform(-5.0, 5.0)
-            self.telemetry_data['yaw'] = (self.telemetry_data['yaw'] + random.uniform(-8.0, 8.0)) % 360
-        else:
-            self.telemetry_data['groundspeed'] = 0.0
-            self.telemetry_data['roll'] = 0.0
-            self.telemetry_data['pitch'] = 0.0
-        
-        self.telemetry_data['heading'] = self.telemetry_data['yaw']
-        self.telemetry_data['timestamp'] = time.time()
-        
-        # Simulate GPS satellite changes
-        self.telemetry_data['satellites'] = random.randint(12, 18)
-        
-        # Simulate RSSI changes
-        self.telemetry_data['rssi'] = random.uniform(-75, -45)
+        return True
+    
+    def _on_message(self, spec: MessageSpec, state: TelemetryState):
+        """Count decoded messages and leave simulation on the first real heartbeat"""
+        self.fleet.on_message(spec, state)
+        self.msg_counters[spec.name] = self.msg_counters.get(spec.name, 0) + 1
         
+        if spec.name == 'HEARTBEAT':
+            self.last_heartbeat = state.last_heartbeat
+            if self.simulation_mode:
+                self.simulation_mode = False
+                logger.info("✅ MAVLink connected successfully (Real connection)")
+    
+    def update_simulation(self) -> Dict[str, Any]:
+        """Advance the simulated vehicle's flight model by the time since the last update"""
+        now = time.monotonic()
+        if self.last_simulation_step is not None:
+            self.simulator.advance(min(now - self.last_simulation_step, 1.0))
+        self.last_simulation_step = now
+        self.telemetry_data.update(self.simulator.telemetry(0))
         return self.telemetry_data.copy()
     
-    def get_telemetry(self) -> Optional[Dict[str, Any]]:
-        """Get latest telemetry data (real or simulated)"""
+    def get_telemetry(self, vehicle_filter: Optional[Set[str]] = None) -> Optional[Dict[str, Any]]:
+        """Get latest telemetry data (real or simulated) for the first matching vehicle"""
         try:
             if self.simulation_mode:
                 return self.update_simulation()
                 
-            elif self.connected and hasattr(self, 'mav_connection'):
-                # Read real MAVLink messages
-                telemetry = {}
-                
-                # Read multiple messages to get comprehensive data
-                for _ in range(10):  # Read up to 10 messages
-                    msg = self.mav_connection.recv_match(blocking=False)
-                    if msg is None:
-                        break
-                        
-                    parsed = self.parse_mavlink_message(msg)
-                    if parsed:
-                        telemetry.update(parsed)
-                        self.msg_counters[msg.get_type()] += 1
-                
-                return telemetry if telemetry else None
+            elif self.connected:
+                # The ingest task keeps the decoded state current
+                for _, state in self.fleet.select(vehicle_filter):
+                    return state.to_dict()
+                return None
                 
             else:
                 return None
@@ -173,6 +152,12 @@ class MAVLinkHandler:
             # Fallback to simulation
             return self.update_simulation()
     
+    def get_fleet_telemetry(self, vehicle_filter: Optional[Set[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Get latest telemetry for every matching vehicle keyed by 'sysid:compid'"""
+        if self.simulation_mode:
+            return {'1:1': self.update_simulation()}
+        return self.fleet.snapshot(vehicle_filter)
+    
     def parse_mavlink_message(self, msg) -> Optional[Dict[str, Any]]:
         """Parse MAVLink message to JSON format"""
         try:
@@ -236,55 +221,38 @@ class MAVLinkHandler:
     
     def _get_mode_name(self, custom_mode: int) -> str:
         """Convert MAVLink custom mode to mode name"""
-        mode_mapping = {
-            0: 'STABILIZE',
-            4: 'GUIDED',
-            5: 'LOITER',
-            6: 'RTL',
-            7: 'CIRCLE',
-            9: 'LAND',
-            11: 'DRIFT',
-            13: 'SPORT',
-            15: 'FLIP',
-            16: 'AUTOTUNE',
-            17: 'POSHOLD'
-        }
-        return mode_mapping.get(custom_mode, 'UNKNOWN')
+        return MODE_NAMES.get(custom_mode, 'UNKNOWN')
+    
+    async def execute_command(self, command: str, params: Dict = None,
+                              vehicle_id: str = '1:1') -> Dict[str, Any]:
+        """Send a command and wait for the vehicle's COMMAND_ACK (or timeout)"""
+        logger.info(f"📡 Sending MAVLink command: {command} {params} -> {vehicle_id}")
+        if self.simulation_mode:
+            # TAKEOFF, GUIDED goto, RTL, LAND, AUTO fly the simulated vehicle
+            success = self.simulator.command(0, command, params)
+            return {'command': command, 'vehicle_id': vehicle_id, 'result': 'ACCEPTED' if success else 'FAILED',
+                    'success': success, 'attempts': 1, 'latency_ms': None}
+        sysid, compid = parse_vehicle_id(vehicle_id)
+        return await self.commands.send_command(sysid, compid, command, params)
     
-    def send_command(self, command: str, params: Dict = None) -> bool:
-        """Send MAVLink command to drone"""
+    def send_command(self, command: str, params: Dict = None, vehicle_id: str = '1:1') -> bool:
+        """Send MAVLink command to drone without waiting for the ack
+        
+        In real mode this only says the command was queued on a live link;
+        use execute_command() for the vehicle's verdict.
+        """
         try:
             logger.info(f"📡 Sending MAVLink command: {command} {params}")
             
-            if command == 'ARM':
-                if self.simulation_mode:
-                    self.telemetry_data['armed'] = True
-                    self.telemetry_data['system_status'] = 'ACTIVE'
-                return True
-                
-            elif command == 'DISARM':
-                if self.simulation_mode:
-                    self.telemetry_data['armed'] = False
-                    self.telemetry_data['system_status'] = 'STANDBY'
-                return True
-                
-            elif command == 'SET_MODE':
-                if params and 'mode' in params:
-                    if self.simulation_mode:
-                        self.telemetry_data['mode'] = params['mode']
-                    return True
-                    
-            elif command == 'TAKEOFF':
-                if self.simulation_mode and self.telemetry_data['armed']:
-                    self.telemetry_data['mode'] = 'TAKEOFF'
-                    return True
-                    
-            elif command == 'RTL':  # Return to Launch
-                if self.simulation_mode:
-                    self.telemetry_data['mode'] = 'RTL'
-                    return True
+            if self.simulation_mode:
+                # TAKEOFF, GUIDED goto, RTL, LAND, AUTO fly the simulated vehicle
+                return self.simulator.command(0, command, params)
             
-            return False
+            if self.ingest.remote_addr is None:
+                return False
+            sysid, compid = parse_vehicle_id(vehicle_id)
+            self.commands.submit(sysid, compid, command, params)
+            return True
             
         except Exception as e:
             logger.error(f"❌ Error sending command: {e}")
@@ -296,5 +264,10 @@ class MAVLinkHandler:
             'connected': self.connected,
             'simulation_mode': self.simulation_mode,
             'message_counters': self.msg_counters,
-            'total_messages': sum(self.msg_counters.values())
+            'total_messages': sum(self.msg_counters.values()),
+            'last_heartbeat': self.last_heartbeat,
+            'fleet': self.fleet.get_statistics(),
+            'ingest': self.ingest.get_statistics(),
+            'commands': self.commands.get_statistics(),
+            'latency': {stage: metrics.stage(stage).summary() for stage in ('ingest', 'state_update', 'command_ack')}
         }
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Asyncio MAVLink ingest engine
+Drains the UDP endpoint as datagrams arrive so the broadcaster never touches the socket
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+from latency import LatencyRecorder
+from mavlink_codec import MAVLinkDecoder
+
+logger = logging.getLogger(__name__)
+
+
+def parse_connection_string(connection_string: str) -> Tuple[str, str, int]:
+    """Split a pymavlink-style 'udp:host:port' string into (mode, host, port)
+
+    'udp' and 'udpin' listen on the given address, 'udpout' sends to it.
+    """
+    parts = connection_string.split(':')
+    if len(parts) != 3 or parts[0] not in ('udp', 'udpin', 'udpout'):
+        raise ValueError(f"Unsupported MAVLink connection string: {connection_string}")
+    mode = 'udpout' if parts[0] == 'udpout' else 'udpin'
+    return mode, parts[1], int(parts[2])
+
+
+class MAVLinkIngestProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol that hands every packet to the ingest engine"""
+
+    def __init__(self, engine: 'MAVLinkIngest'):
+        self.engine = engine
+
+    def connection_made(self, transport):
+        self.engine.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        self.engine.feed(data, addr)
+
+    def error_received(self, exc):
+        self.engine.errors += 1
+        logger.warning(f"⚠️ MAVLink socket error: {exc}")
+
+
+class MAVLinkIngest:
+    """Receive, decode and dispatch MAVLink packets on the event loop"""
+
+    def __init__(self, connection_string: str = 'udp:127.0.0.1:14550',
+                 decoder: Optional[MAVLinkDecoder] = None, latency: Optional[LatencyRecorder] = None):
+        self.connection_string = connection_string
+        self.decoder = decoder or MAVLinkDecoder()
+        # Datagram received -> every frame in it decoded and applied
+        self._ingest_latency = latency.stage('ingest') if latency else None
+        self.transport = None
+        self.remote_addr = None
+
+        # Ingest counters
+        self.packets = 0
+        self.bytes = 0
+        self.messages = 0
+        self.errors = 0
+        self.last_packet_time = 0.0
+
+    async def start(self):
+        """Open the UDP endpoint; returns immediately without waiting for a heartbeat"""
+        mode, host, port = parse_connection_string(self.connection_string)
+        loop = asyncio.get_running_loop()
+
+        if mode == 'udpin':
+            await loop.create_datagram_endpoint(
+                lambda: MAVLinkIngestProtocol(self), local_addr=(host, port))
+        else:
+            self.remote_addr = (host, port)
+            await loop.create_datagram_endpoint(
+                lambda: MAVLinkIngestProtocol(self), remote_addr=(host, port))
+
+        logger.info(f"🔗 MAVLink ingest listening: {self.connection_string}")
+
+    def feed(self, data: bytes, addr=None):
+        """Decode one datagram and dispatch every complete message in it"""
+        self.packets += 1
+        self.bytes += len(data)
+        self.last_packet_time = time.time()
+
+        started = time.perf_counter()
+        try:
+            applied = self.decoder.feed(data, self.last_packet_time)
+            self.messages += applied
+            # Reply to whoever sends valid MAVLink, not to junk or port scans
+            if applied and addr is not None:
+                self.remote_addr = addr
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Error decoding MAVLink packet: {e}")
+        if self._ingest_latency is not None:
+            self._ingest_latency.record(time.perf_counter() - started)
+
+    def send(self, data: bytes) -> bool:
+        """Send raw bytes to the last known vehicle address"""
+        if self.transport is None or self.remote_addr is None:
+            return False
+        self.transport.sendto(data, self.remote_addr)
+        return True
+
+    def stop(self):
+        """Close the UDP endpoint"""
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get ingest counters"""
+        return {
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'messages': self.messages,
+            'errors': self.errors,
+            'last_packet_time': self.last_packet_time,
+            'decoder': self.decoder.get_statistics()
+        }
@@ -0,0 +1,610 @@
+"""
+MAVLink mission protocol engine
+Uploads, downloads and clears waypoint missions with the MISSION_COUNT /
+MISSION_REQUEST_INT / MISSION_ITEM_INT / MISSION_ACK handshake, one async
+state machine per vehicle with per-step timeouts and retries. Downloads keep
+a window of item requests in flight for autopilots that answer them in any
+order (ArduPilot); uploads are paced by the vehicle's own item requests
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fleet import VehicleKey, vehicle_id
+from mavlink_codec import TelemetryState, encode_frame, register_message
+from simulator import MAV_AUTOPILOT_ARDUPILOTMEGA
+
+logger = logging.getLogger(__name__)
+
+Waypoint = Tuple[float, float, float]
+
+MISSION_REQUEST = 40
+MISSION_REQUEST_LIST = 43
+MISSION_COUNT = 44
+MISSION_CLEAR_ALL = 45
+MISSION_ITEM_REACHED = 46
+MISSION_ACK = 47
+MISSION_REQUEST_INT = 51
+MISSION_ITEM_INT = 73
+
+register_message(MISSION_REQUEST, 'MISSION_REQUEST', 230, '<HBBB')
+register_message(MISSION_REQUEST_LIST, 'MISSION_REQUEST_LIST', 132, '<BBB')
+register_message(MISSION_COUNT, 'MISSION_COUNT', 221, '<HBBB')
+register_message(MISSION_CLEAR_ALL, 'MISSION_CLEAR_ALL', 232, '<BBB')
+register_message(MISSION_ITEM_REACHED, 'MISSION_ITEM_REACHED', 11, '<H')
+register_message(MISSION_ACK, 'MISSION_ACK', 153, '<BBBB')
+register_message(MISSION_REQUEST_INT, 'MISSION_REQUEST_INT', 196, '<HBBB')
+# param1-4, x, y, z, seq, command, target system/component, frame, current, autocontinue, mission_type
+register_message(MISSION_ITEM_INT, 'MISSION_ITEM_INT', 38, '<ffffiifHHBBBBBB')
+
+# MAV_MISSION_RESULT
+MAV_MISSION_ACCEPTED = 0
+MAV_MISSION_ERROR = 1
+MAV_MISSION_NO_SPACE = 4
+MAV_MISSION_INVALID_SEQUENCE = 13
+MAV_MISSION_DENIED = 14
+MAV_MISSION_OPERATION_CANCELLED = 15
+MISSION_RESULT_NAMES = {
+    0: 'ACCEPTED', 1: 'ERROR', 2: 'UNSUPPORTED_FRAME', 3: 'UNSUPPORTED', 4: 'NO_SPACE',
+    5: 'INVALID', 6: 'INVALID_PARAM1', 7: 'INVALID_PARAM2', 8: 'INVALID_PARAM3',
+    9: 'INVALID_PARAM4', 10: 'INVALID_PARAM5_X', 11: 'INVALID_PARAM6_Y', 12: 'INVALID_PARAM7',
+    13: 'INVALID_SEQUENCE', 14: 'DENIED', 15: 'OPERATION_CANCELLED'
+}
+
+MAV_MISSION_TYPE_MISSION = 0
+
+# Frames whose x/y are latitude/longitude in degrees * 1e7 (local frames use metres * 1e4)
+MAV_FRAME_GLOBAL_INT = 5
+MAV_FRAME_GLOBAL_RELATIVE_ALT_INT = 6
+GLOBAL_FRAMES = {0, 3, 5, 6, 10, 11}
+
+MAV_CMD_NAV_WAYPOINT = 16
+MAV_CMD_NAV_LOITER_UNLIM = 17
+MAV_CMD_NAV_LOITER_TURNS = 18
+MAV_CMD_NAV_LOITER_TIME = 19
+MAV_CMD_NAV_RETURN_TO_LAUNCH = 20
+MAV_CMD_NAV_LAND = 21
+MAV_CMD_NAV_TAKEOFF = 22
+MAV_CMD_NAV_SPLINE_WAYPOINT = 82
+MAV_CMD_DO_SET_CAM_TRIGG_DIST = 206
+POSITION_COMMANDS = {MAV_CMD_NAV_WAYPOINT, MAV_CMD_NAV_LOITER_UNLIM, MAV_CMD_NAV_LOITER_TURNS,
+                     MAV_CMD_NAV_LOITER_TIME, MAV_CMD_NAV_TAKEOFF, MAV_CMD_NAV_SPLINE_WAYPOINT}
+
+# Autopilots that answer a window of outstanding item requests during downloads
+PIPELINED_AUTOPILOTS = {MAV_AUTOPILOT_ARDUPILOTMEGA}
+
+MISSION_FIELDS = ('seq', 'command', 'frame', 'lat', 'lon', 'alt', 'param1', 'param2', 'param3', 'param4',
+                  'current', 'autocontinue')
+
+
+class MissionError(Exception):
+    """Transfer failed: timed out, rejected by the vehicle or another transfer is running"""
+
+
+class MissionItem:
+    """One mission item; lat/lon in degrees for global frames, alt in metres"""
+    __slots__ = MISSION_FIELDS
+
+    def __init__(self, seq: int = 0, command: int = MAV_CMD_NAV_WAYPOINT,
+                 frame: int = MAV_FRAME_GLOBAL_RELATIVE_ALT_INT, lat: float = 0.0, lon: float = 0.0,
+                 alt: float = 0.0, param1: float = 0.0, param2: float = 0.0, param3: float = 0.0,
+                 param4: float = 0.0, current: int = 0, autocontinue: int = 1):
+        self.seq = seq
+        self.command = command
+        self.frame = frame
+        self.lat = lat
+        self.lon = lon
+        self.alt = alt
+        self.param1 = param1
+        self.param2 = param2
+        self.param3 = param3
+        self.param4 = param4
+        self.current = current
+        self.autocontinue = autocontinue
+
+    @classmethod
+    def from_values(cls, v: Tuple) -> 'MissionItem':
+        """From unpacked MISSION_ITEM_INT fields"""
+        param1, param2, param3, param4, x, y, z, seq, command, _, _, frame, current, autocontinue, _ = v
+        scale = 1e7 if frame in GLOBAL_FRAMES else 1e4
+        return cls(seq, command, frame, x / scale, y / scale, z, param1, param2, param3, param4,
+                   current, autocontinue)
+
+    def values(self, target_system: int, target_component: int) -> Tuple:
+        """MISSION_ITEM_INT fields addressed to a vehicle (or back to the GCS)"""
+        scale = 1e7 if self.frame in GLOBAL_FRAMES else 1e4
+        return (self.param1, self.param2, self.param3, self.param4,
+                int(round(self.lat * scale)), int(round(self.lon * scale)), self.alt,
+                self.seq, self.command, target_system, target_component, self.frame,
+                self.current, self.autocontinue, MAV_MISSION_TYPE_MISSION)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], seq: int) -> 'MissionItem':
+        """From the REST/WebSocket JSON form; `seq` is assigned by position"""
+        return cls(seq, int(data.get('command', MAV_CMD_NAV_WAYPOINT)),
+                   int(data.get('frame', MAV_FRAME_GLOBAL_RELATIVE_ALT_INT)),
+                   float(data.get('lat', 0.0)), float(data.get('lon', 0.0)), float(data.get('alt', 0.0)),
+                   float(data.get('param1', 0.0)), float(data.get('param2', 0.0)),
+                   float(data.get('param3', 0.0)), float(data.get('param4', 0.0)),
+                   int(data.get('current', 0)), int(data.get('autocontinue', 1)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in MISSION_FIELDS}
+
+
+def waypoint_items(waypoints: Sequence[Waypoint], home: Optional[Waypoint] = None,
+                   rtl: bool = False, trigger_distance: Optional[float] = None) -> List[MissionItem]:
+    """NAV_WAYPOINT items for (lat, lon, relative alt) tuples, after an ArduPilot home item if given
+
+    With `trigger_distance` the camera is triggered every that many metres
+    from the first waypoint and stopped after the last one.
+    """
+    items = []
+    if home is not None:
+        items.append(MissionItem(0, frame=MAV_FRAME_GLOBAL_INT, lat=home[0], lon=home[1], alt=home[2]))
+    if trigger_distance:
+        items.append(MissionItem(len(items), MAV_CMD_DO_SET_CAM_TRIGG_DIST, frame=MAV_FRAME_GLOBAL_INT,
+                                 param1=float(trigger_distance)))
+    items.extend(MissionItem(seq, lat=lat, lon=lon, alt=alt)
+                 for seq, (lat, lon, alt) in enumerate(waypoints, len(items)))
+    if trigger_distance:
+        items.append(MissionItem(len(items), MAV_CMD_DO_SET_CAM_TRIGG_DIST, frame=MAV_FRAME_GLOBAL_INT))
+    if rtl:
+        items.append(MissionItem(len(items), MAV_CMD_NAV_RETURN_TO_LAUNCH, frame=MAV_FRAME_GLOBAL_INT))
+    return items
+
+
+def flight_plan(items: Sequence[MissionItem]) -> Tuple[List[Waypoint], bool, bool, int]:
+    """What the flight model can fly from ArduPilot-style items (item 0 is home)
+
+    Returns (waypoints, rtl, land, seq of the first waypoint). Position
+    items without a location (a takeoff in place) reuse the previous
+    position; the mission ends at the first RTL or LAND item.
+    """
+    waypoints: List[Waypoint] = []
+    rtl = land = False
+    seq_base = 1
+    lat, lon = (items[0].lat, items[0].lon) if items else (0.0, 0.0)
+    for item in items[1:]:
+        if item.command in POSITION_COMMANDS or item.command == MAV_CMD_NAV_LAND:
+            if item.lat or item.lon:
+                lat, lon = item.lat, item.lon
+            if not waypoints:
+                seq_base = item.seq
+            if item.command == MAV_CMD_NAV_LAND:
+                if item.lat or item.lon:
+                    waypoints.append((lat, lon, waypoints[-1][2] if waypoints else 10.0))
+                land = True
+                break
+            waypoints.append((lat, lon, item.alt))
+        elif item.command == MAV_CMD_NAV_RETURN_TO_LAUNCH:
+            rtl = True
+            break
+    return waypoints, rtl, land, seq_base
+
+
+class MissionTransfer:
+    """Progress of one upload, download or clear with a vehicle"""
+
+    def __init__(self, operation: str, key: VehicleKey, items: Optional[Sequence[MissionItem]] = None):
+        self.operation = operation
+        self.key = key
+        self.items: List[Optional[MissionItem]] = list(items) if items is not None else []
+        self.count: Optional[int] = len(self.items) if items is not None else None
+        self.state = 'running'
+        self.error: Optional[str] = None
+        self.done = 0
+        self.retries = 0
+        self.stalls = 0
+        self.window = 1
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.last_report = 0.0
+        # Uploads: seqs sent to the vehicle; downloads: requests awaiting an item
+        self.requested: Dict[int, float] = {}
+        self.next_seq = 0
+        self.last_seq: Optional[int] = None
+        self.wake = asyncio.Event()
+        self.task: Optional[asyncio.Future] = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'operation': self.operation,
+            'vehicle_id': vehicle_id(self.key),
+            'state': self.state,
+            'error': self.error,
+            'done': self.done,
+            'count': self.count,
+            'retries': self.retries,
+            'window': self.window,
+            'started': self.started,
+            'elapsed': round((self.finished or time.time()) - self.started, 3)
+        }
+
+
+class MissionManager:
+    """GCS side of the mission protocol for every vehicle
+
+    `send` writes a MAVLink frame towards the vehicles. The handlers from
+    routes() go to the decoder so vehicle replies drive the transfers;
+    each step times out after `timeout` seconds and is retried up to
+    `retries` times in a row before the transfer fails. `on_progress`
+    sees a transfer at most every `progress_interval` seconds and once
+    when it finishes.
+    """
+
+    def __init__(self, send: Callable[[bytes], Any], sysid: int = 255, compid: int = 190,
+                 timeout: float = 1.5, retries: int = 5, window: int = 16,
+                 autopilot_for: Optional[Callable[[int, int], Optional[int]]] = None,
+                 on_progress: Optional[Callable[[MissionTransfer], None]] = None,
+                 progress_interval: float = 0.25):
+        self.send = send
+        self.sysid = sysid
+        self.compid = compid
+        self.timeout = timeout
+        self.retries = retries
+        self.window = window
+        self.autopilot_for = autopilot_for
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.missions: Dict[VehicleKey, List[MissionItem]] = {}
+        self.transfers: Dict[VehicleKey, MissionTransfer] = {}
+        self._seq = 0
+
+        # Counters
+        self.completed = 0
+        self.failed = 0
+        self.resends = 0
+        self.items_sent = 0
+        self.items_received = 0
+
+    def routes(self) -> Dict[int, Callable[[TelemetryState, Tuple], None]]:
+        """Decoder routes for the vehicle side of the handshake"""
+        return {
+            MISSION_REQUEST_INT: self._on_request,
+            MISSION_REQUEST: self._on_request,
+            MISSION_ITEM_INT: self._on_item,
+            MISSION_COUNT: self._on_count,
+            MISSION_ACK: self._on_ack
+        }
+
+    # ------------------------------------------------------------ public API
+
+    def start(self, operation: str, sysid: int, compid: int,
+              items: Optional[Sequence[MissionItem]] = None) -> MissionTransfer:
+        """Begin an 'upload', 'download' or 'clear' in the background"""
+        key = (sysid, compid)
+        running = self.transfers.get(key)
+        if running is not None and running.state == 'running':
+            raise MissionError(f"{running.operation} already in progress for {sysid}:{compid}")
+        if operation == 'upload':
+            if items is None:
+                raise MissionError("upload needs items")
+            for seq, item in enumerate(items):
+                item.seq = seq
+        elif operation not in ('download', 'clear'):
+            raise MissionError(f"unknown mission operation {operation}")
+        transfer = MissionTransfer(operation, key, items if operation == 'upload' else None)
+        if operation == 'download':
+            autopilot = self.autopilot_for(sysid, compid) if self.autopilot_for else None
+            transfer.window = self.window if autopilot in PIPELINED_AUTOPILOTS else 1
+        self.transfers[key] = transfer
+        transfer.task = asyncio.ensure_future(self._run(transfer))
+        return transfer
+
+    async def upload(self, sysid: int, compid: int, items: Sequence[MissionItem]) -> MissionTransfer:
+        return await self._wait(self.start('upload', sysid, compid, items))
+
+    async def download(self, sysid: int, compid: int) -> List[MissionItem]:
+        await self._wait(self.start('download', sysid, compid))
+        return self.missions[(sysid, compid)]
+
+    async def clear(self, sysid: int, compid: int) -> MissionTransfer:
+        return await self._wait(self.start('clear', sysid, compid))
+
+    def get_mission(self, sysid: int, compid: int) -> Optional[List[MissionItem]]:
+        """Last mission uploaded to or downloaded from the vehicle"""
+        return self.missions.get((sysid, compid))
+
+    def get_transfer(self, sysid: int, compid: int) -> Optional[MissionTransfer]:
+        return self.transfers.get((sysid, compid))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            'running': sum(1 for transfer in self.transfers.values() if transfer.state == 'running'),
+            'completed': self.completed,
+            'failed': self.failed,
+            'resends': self.resends,
+            'items_sent': self.items_sent,
+            'items_received': self.items_received,
+            'missions': len(self.missions)
+        }
+
+    # ------------------------------------------------------------ state machine
+
+    async def _wait(self, transfer: MissionTransfer) -> MissionTransfer:
+        await transfer.task
+        if transfer.state != 'done':
+            raise MissionError(transfer.error)
+        return transfer
+
+    async def _run(self, transfer: MissionTransfer) -> MissionTransfer:
+        try:
+            self._kick(transfer)
+            while transfer.state == 'running':
+                transfer.wake.clear()
+                try:
+                    await asyncio.wait_for(transfer.wake.wait(), self.timeout)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+                if transfer.state != 'running':
+                    break
+                transfer.stalls += 1
+                if transfer.stalls > self.retries:
+                    self._fail(transfer, f"{transfer.operation} timed out after {transfer.done}/"
+                                         f"{transfer.count if transfer.count is not None else '?'} items")
+                    break
+                transfer.retries += 1
+                self.resends += 1
+                self._resend(transfer)
+        except asyncio.CancelledError:
+            self._fail(transfer, f"{transfer.operation} cancelled")
+            raise
+        except Exception as e:
+            self._fail(transfer, str(e))
+        return transfer
+
+    def _kick(self, transfer: MissionTransfer):
+        sysid, compid = transfer.key
+        if transfer.operation == 'upload':
+            self._send(MISSION_COUNT, (transfer.count, sysid, compid, MAV_MISSION_TYPE_MISSION))
+        elif transfer.operation == 'download':
+            self._send(MISSION_REQUEST_LIST, (sysid, compid, MAV_MISSION_TYPE_MISSION))
+        else:
+            self._send(MISSION_CLEAR_ALL, (sysid, compid, MAV_MISSION_TYPE_MISSION))
+
+    def _resend(self, transfer: MissionTransfer):
+        """Repeat whatever the vehicle has not answered"""
+        if transfer.operation == 'upload' and transfer.last_seq is not None:
+            # Our item may have been lost; the vehicle will ask again otherwise
+            self._send_item(transfer, transfer.last_seq)
+        elif transfer.operation == 'download' and transfer.count is not None:
+            sysid, compid = transfer.key
+            now = time.time()
+            for seq in transfer.requested:
+                transfer.requested[seq] = now
+                self._send(MISSION_REQUEST_INT, (seq, sysid, compid, MAV_MISSION_TYPE_MISSION))
+        else:
+            self._kick(transfer)
+
+    def _send(self, msg_id: int, values: Tuple):
+        self.send(encode_frame(msg_id, values, sysid=self.sysid, compid=self.compid, seq=self._seq))
+        self._seq = (self._seq + 1) & 0xFF
+
+    def _send_item(self, transfer: MissionTransfer, seq: int):
+        self._send(MISSION_ITEM_INT, transfer.items[seq].values(*transfer.key))
+        self.items_sent += 1
+
+    def _fill_window(self, transfer: MissionTransfer):
+        """Keep `window` item requests outstanding during a download"""
+        sysid, compid = transfer.key
+        now = time.time()
+        while len(transfer.requested) < transfer.window and transfer.next_seq < transfer.count:
+            seq = transfer.next_seq
+            transfer.next_seq += 1
+            if transfer.items[seq] is not None:
+                continue
+            transfer.requested[seq] = now
+            self._send(MISSION_REQUEST_INT, (seq, sysid, compid, MAV_MISSION_TYPE_MISSION))
+
+    def _active(self, state: TelemetryState, target_system: int, mission_type: int,
+                operation: str) -> Optional[MissionTransfer]:
+        if target_system not in (0, self.sysid) or mission_type != MAV_MISSION_TYPE_MISSION:
+            return None
+        transfer = self.transfers.get((state.sysid, state.compid))
+        if transfer is None or transfer.state != 'running' or transfer.operation != operation:
+            return None
+        return transfer
+
+    def _progress(self, transfer: MissionTransfer):
+        transfer.stalls = 0
+        transfer.wake.set()
+        if self.on_progress:
+            now = time.time()
+            if now - transfer.last_report >= self.progress_interval:
+                transfer.last_report = now
+                self.on_progress(transfer)
+
+    def _finish(self, transfer: MissionTransfer):
+        transfer.state = 'done'
+        transfer.finished = time.time()
+        transfer.wake.set()
+        self.completed += 1
+        logger.info(f"🗺️ Mission {transfer.operation} {vehicle_id(transfer.key)} done: "
+                    f"{transfer.count} items in {transfer.finished - transfer.started:.2f}s, "
+                    f"{transfer.retries} retries")
+        if self.on_progress:
+            self.on_progress(transfer)
+
+    def _fail(self, transfer: MissionTransfer, error: str):
+        if transfer.state != 'running':
+            return
+        transfer.state = 'failed'
+        transfer.error = error
+        transfer.finished = time.time()
+        transfer.wake.set()
+        self.failed += 1
+        logger.warning(f"❌ Mission {transfer.operation} {vehicle_id(transfer.key)} failed: {error}")
+        if self.on_progress:
+            self.on_progress(transfer)
+
+    # ------------------------------------------------------------ vehicle messages
+
+    def _on_request(self, state: TelemetryState, v: Tuple):
+        """Upload: the vehicle asks for the next item (MISSION_REQUEST_INT or legacy MISSION_REQUEST)"""
+        seq, target_system, _, mission_type = v
+        transfer = self._active(state, target_system, mission_type, 'upload')
+        if transfer is None or seq >= transfer.count:
+            return
+        self._send_item(transfer, seq)
+        if seq not in transfer.requested:
+            transfer.requested[seq] = time.time()
+            transfer.done += 1
+        transfer.last_seq = seq
+        self._progress(transfer)
+
+    def _on_ack(self, state: TelemetryState, v: Tuple):
+        target_system, _, result, mission_type = v
+        key = (state.sysid, state.compid)
+        transfer = self.transfers.get(key)
+        if transfer is None or transfer.operation == 'download':
+            return
+        if self._active(state, target_system, mission_type, transfer.operation) is None:
+            return
+        if result == MAV_MISSION_INVALID_SEQUENCE:
+            # ArduPilot reports out-of-order items and asks again
+            return
+        if result != MAV_MISSION_ACCEPTED:
+            self._fail(transfer, f"vehicle rejected {transfer.operation}: "
+                                 f"{MISSION_RESULT_NAMES.get(result, result)}")
+            return
+        if transfer.operation == 'upload':
+            if transfer.done < transfer.count:
+                return
+            self.missions[key] = transfer.items
+            state.mission_total = transfer.count
+        else:
+            self.missions[key] = []
+            state.mission_total = 0
+        self._finish(transfer)
+
+    def _on_count(self, state: TelemetryState, v: Tuple):
+        """Download: the vehicle announced how many items it holds"""
+        count, target_system, _, mission_type = v
+        transfer = self._active(state, target_system, mission_type, 'download')
+        if transfer is None or transfer.count is not None:
+            return
+        transfer.count = count
+        transfer.items = [None] * count
+        state.mission_total = count
+        if count:
+            self._fill_window(transfer)
+            self._progress(transfer)
+        else:
+            self._complete_download(transfer)
+
+    def _on_item(self, state: TelemetryState, v: Tuple):
+        transfer = self._active(state, v[9], v[14], 'download')
+        seq = v[7]
+        if transfer is None or transfer.count is None or seq >= transfer.count or transfer.items[seq] is not None:
+            return
+        transfer.items[seq] = MissionItem.from_values(v)
+        transfer.requested.pop(seq, None)
+        transfer.done += 1
+        self.items_received += 1
+        if transfer.done == transfer.count:
+            self._complete_download(transfer)
+        else:
+            self._fill_window(transfer)
+            self._progress(transfer)
+
+    def _complete_download(self, transfer: MissionTransfer):
+        sysid, compid = transfer.key
+        self._send(MISSION_ACK, (sysid, compid, MAV_MISSION_ACCEPTED, MAV_MISSION_TYPE_MISSION))
+        self.missions[transfer.key] = transfer.items
+        self._finish(transfer)
+
+
+class VehicleMissionEndpoint:
+    """Autopilot side of the mission protocol for a simulated vehicle
+
+    Behaves like ArduPilot: uploads are requested one item at a time with
+    MISSION_REQUEST_INT, item 0 is home, downloads are served in any order.
+    Accepted missions (and clears, as an empty list) go to `on_mission`,
+    which returns False to reject them. routes() go to the vehicle's
+    decoder, whose state is the sending GCS.
+    """
+
+    def __init__(self, send: Callable[[bytes], Any], sysid: int = 1, compid: int = 1,
+                 on_mission: Optional[Callable[[List[MissionItem]], bool]] = None):
+        self.send = send
+        self.sysid = sysid
+        self.compid = compid
+        self.on_mission = on_mission
+        self.items: List[MissionItem] = []
+        self._receiving: Optional[List[MissionItem]] = None
+        self._expected = 0
+        self._seq = 0
+
+    def routes(self) -> Dict[int, Callable[[TelemetryState, Tuple], None]]:
+        return {
+            MISSION_COUNT: self._on_count,
+            MISSION_ITEM_INT: self._on_item,
+            MISSION_REQUEST_LIST: self._on_request_list,
+            MISSION_REQUEST_INT: self._on_request,
+            MISSION_REQUEST: self._on_request,
+            MISSION_CLEAR_ALL: self._on_clear
+        }
+
+    def _for_us(self, target_system: int, mission_type: int) -> bool:
+        return target_system in (0, self.sysid) and mission_type == MAV_MISSION_TYPE_MISSION
+
+    def _send(self, msg_id: int, values: Tuple):
+        self.send(encode_frame(msg_id, values, sysid=self.sysid, compid=self.compid, seq=self._seq))
+        self._seq = (self._seq + 1) & 0xFF
+
+    def _ack(self, peer: TelemetryState, result: int):
+        self._send(MISSION_ACK, (peer.sysid, peer.compid, result, MAV_MISSION_TYPE_MISSION))
+
+    def _on_count(self, peer: TelemetryState, v: Tuple):
+        count, target_system, _, mission_type = v
+        if not self._for_us(target_system, mission_type):
+            return
+        if count == 0:
+            self._accept(peer, [])
+            return
+        self._receiving = []
+        self._expected = count
+        self._send(MISSION_REQUEST_INT, (0, peer.sysid, peer.compid, MAV_MISSION_TYPE_MISSION))
+
+    def _on_item(self, peer: TelemetryState, v: Tuple):
+        if not self._for_us(v[9], v[14]):
+            return
+        if self._receiving is None:
+            # Our final ACK was lost and the GCS repeated the last item
+            if self.items and v[7] == len(self.items) - 1:
+                self._ack(peer, MAV_MISSION_ACCEPTED)
+            return
+        item = MissionItem.from_values(v)
+        if item.seq != len(self._receiving):
+            self._ack(peer, MAV_MISSION_INVALID_SEQUENCE)
+        else:
+            self._receiving.append(item)
+            if len(self._receiving) == self._expected:
+                items, self._receiving = self._receiving, None
+                self._accept(peer, items)
+                return
+        self._send(MISSION_REQUEST_INT, (len(self._receiving), peer.sysid, peer.compid, MAV_MISSION_TYPE_MISSION))
+
+    def _accept(self, peer: TelemetryState, items: List[MissionItem]):
+        if self.on_mission is not None and not self.on_mission(items):
+            self._ack(peer, MAV_MISSION_ERROR)
+            return
+        self.items = items
+        self._ack(peer, MAV_MISSION_ACCEPTED)
+
+    def _on_request_list(self, peer: TelemetryState, v: Tuple):
+        if self._for_us(v[0], v[2]):
+            self._send(MISSION_COUNT, (len(self.items), peer.sysid, peer.compid, MAV_MISSION_TYPE_MISSION))
+
+    def _on_request(self, peer: TelemetryState, v: Tuple):
+        seq, target_system, _, mission_type = v
+        if self._for_us(target_system, mission_type) and seq < len(self.items):
+            self._send(MISSION_ITEM_INT, self.items[seq].values(peer.sysid, peer.compid))
+
+    def _on_clear(self, peer: TelemetryState, v: Tuple):
+        if self._for_us(v[0], v[2]):
+            self._receiving = None
+            self._accept(peer, [])
@@ -0,0 +1,358 @@
+"""
+Survey grid and corridor mission planner
+Lawnmower grids over a polygon and parallel passes along a polyline, with
+line spacing and camera trigger distance taken from the camera footprint
+and overlap. Projection to a local tangent plane, scanline clipping and
+corridor offsets are vectorized with NumPy; plans are cached by a hash of
+their parameters
+
+Usage:
+    python app/mission_planner.py [--area 50] [--spacing 5]
+"""
+import argparse
+import hashlib
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+MAX_WAYPOINTS = 65000       # MISSION_COUNT is a uint16
+MITER_LIMIT = 4.0           # corridor corners: longest vertex offset as a multiple of the pass offset
+
+# 1" 20 MP mapping camera (13.2 x 8.8 mm sensor, 8.8 mm lens, 5472 x 3648 px)
+DEFAULT_CAMERA = {
+    'sensor_width': 13.2,
+    'sensor_height': 8.8,
+    'focal_length': 8.8,
+    'image_width': 5472,
+    'image_height': 3648
+}
+
+SURVEY_DEFAULTS = {
+    'polygon': None,
+    'altitude': 50.0,
+    'angle': 0.0,
+    'side_overlap': 0.7,
+    'front_overlap': 0.8,
+    'spacing': None,
+    'turnaround': 0.0,
+    'speed': 10.0,
+    'camera': None
+}
+
+CORRIDOR_DEFAULTS = {
+    'polyline': None,
+    'width': 50.0,
+    'altitude': 50.0,
+    'side_overlap': 0.7,
+    'front_overlap': 0.8,
+    'spacing': None,
+    'speed': 10.0,
+    'camera': None
+}
+
+
+class LocalFrame:
+    """East/north metres around an origin, using the WGS84 radii of curvature there
+
+    Errors stay well under a metre across the few-kilometre areas a
+    multicopter survey covers.
+    """
+
+    def __init__(self, lat0: float, lon0: float):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        phi = math.radians(lat0)
+        w = 1.0 - WGS84_E2 * math.sin(phi) ** 2
+        # Metres per radian of latitude (meridional) and of longitude at this latitude
+        self.m_lat = WGS84_A * (1.0 - WGS84_E2) / w ** 1.5
+        self.m_lon = WGS84_A / math.sqrt(w) * math.cos(phi)
+
+    def to_local(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return (np.radians(lon - self.lon0) * self.m_lon, np.radians(lat - self.lat0) * self.m_lat)
+
+    def to_geo(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return (self.lat0 + np.degrees(y / self.m_lat), self.lon0 + np.degrees(x / self.m_lon))
+
+
+def camera_footprint(altitude: float, camera: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Ground footprint (m) and ground sample distance (cm/px) of a nadir image"""
+    camera = {**DEFAULT_CAMERA, **(camera or {})}
+    width = altitude * camera['sensor_width'] / camera['focal_length']
+    height = altitude * camera['sensor_height'] / camera['focal_length']
+    return {
+        'width': width,
+        'height': height,
+        'gsd': 100.0 * width / camera['image_width']
+    }
+
+
+def line_spacing(altitude: float, side_overlap: float, front_overlap: float, spacing: Optional[float],
+                 camera: Optional[Dict[str, float]]) -> Tuple[float, float, Dict[str, float]]:
+    """(distance between passes, camera trigger distance, footprint)"""
+    if not 0.0 <= side_overlap < 1.0 or not 0.0 <= front_overlap < 1.0:
+        raise ValueError("overlap must be in [0, 1)")
+    footprint = camera_footprint(altitude, camera)
+    if spacing is None:
+        spacing = footprint['width'] * (1.0 - side_overlap)
+    if spacing <= 0:
+        raise ValueError("spacing must be positive")
+    return spacing, footprint['height'] * (1.0 - front_overlap), footprint
+
+
+def polygon_area(x: np.ndarray, y: np.ndarray) -> float:
+    """Shoelace area of a closed polygon (m²)"""
+    return 0.5 * abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))))
+
+
+def clip_scanlines(px: np.ndarray, py: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Inside segments of the horizontal lines y = ys through a closed polygon
+
+    Every line is intersected with every edge at once; crossings are
+    paired with the even-odd rule, so concave polygons give several
+    segments per line. Returns (line index, x entering, x leaving).
+    """
+    x0, y0 = px, py
+    x1, y1 = np.roll(px, -1), np.roll(py, -1)
+    lines = ys[:, None]
+    # Half-open test so a vertex on a line is counted once
+    crosses = (y0 <= lines) != (y1 <= lines)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xs = np.where(crosses, x0 + (lines - y0) * (x1 - x0) / (y1 - y0), np.inf)
+    xs.sort(axis=1)
+    pairs = int(crosses.sum(axis=1).max(initial=0)) // 2
+    x_in = xs[:, 0:2 * pairs:2]
+    x_out = xs[:, 1:2 * pairs:2]
+    inside = np.isfinite(x_out) & (x_out > x_in)
+    line = np.broadcast_to(np.arange(len(ys))[:, None], inside.shape)[inside]
+    return line, x_in[inside], x_out[inside]
+
+
+def offset_polyline(x: np.ndarray, y: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Parallel copies of a polyline, one row per offset (metres, positive to the left)
+
+    Corners use mitred vertex normals so each copy stays `offset` from
+    both adjoining segments; the miter is capped at MITER_LIMIT.
+    """
+    dx, dy = np.diff(x), np.diff(y)
+    length = np.hypot(dx, dy)
+    if np.any(length == 0):
+        raise ValueError("polyline has repeated points")
+    nx, ny = -dy / length, dx / length
+    # Interior vertices: n_prev + n_next projects 1 + cos(turn) onto both normals, so dividing
+    # by that gives the miter (length 1 / cos(turn / 2)); a reversal falls back to n_next
+    sx, sy = nx[:-1] + nx[1:], ny[:-1] + ny[1:]
+    size = np.hypot(sx, sy)
+    dot = np.maximum(sx * nx[1:] + sy * ny[1:], size / MITER_LIMIT)
+    reverse = size < 1e-9
+    dot = np.where(reverse, 1.0, dot)
+    vx = np.concatenate([nx[:1], np.where(reverse, nx[1:], sx / dot), nx[-1:]])
+    vy = np.concatenate([ny[:1], np.where(reverse, ny[1:], sy / dot), ny[-1:]])
+    return (x[None, :] + offsets[:, None] * vx[None, :], y[None, :] + offsets[:, None] * vy[None, :])
+
+
+def _points(value, name: str, minimum: int) -> np.ndarray:
+    points = np.asarray(value, dtype=float)
+    if points.ndim != 2 or points.shape[1] < 2 or len(points) < minimum:
+        raise ValueError(f"{name} needs at least {minimum} [lat, lon] points")
+    if not (np.all(np.abs(points[:, 0]) <= 90.0) and np.all(np.abs(points[:, 1]) <= 180.0)):
+        raise ValueError(f"{name} has points outside lat/lon range")
+    return points[:, :2]
+
+
+def _summary(frame: LocalFrame, x: np.ndarray, y: np.ndarray, altitude: float, speed: float,
+             spacing: float, trigger_distance: float, footprint: Dict[str, float],
+             passes: int) -> Dict[str, Any]:
+    """Waypoints back in lat/lon plus distance, time and photo estimates"""
+    if len(x) > MAX_WAYPOINTS:
+        raise ValueError(f"plan has {len(x)} waypoints, more than a mission can hold ({MAX_WAYPOINTS})")
+    lat, lon = frame.to_geo(x, y)
+    length = float(np.hypot(np.diff(x), np.diff(y)).sum())
+    waypoints = np.column_stack([np.round(lat, 7), np.round(lon, 7), np.full(len(x), float(altitude))])
+    return {
+        'waypoints': waypoints.tolist(),
+        'altitude': altitude,
+        'spacing': round(spacing, 3),
+        'trigger_distance': round(trigger_distance, 3),
+        'footprint': {name: round(value, 3) for name, value in footprint.items()},
+        'passes': passes,
+        'length': round(length, 1),
+        'flight_time': round(length / speed, 1) if speed > 0 else None,
+        'photos': int(length // trigger_distance) + passes if trigger_distance > 0 else None
+    }
+
+
+def survey_grid(polygon: Sequence[Sequence[float]], altitude: float = 50.0, angle: float = 0.0,
+                side_overlap: float = 0.7, front_overlap: float = 0.8, spacing: Optional[float] = None,
+                turnaround: float = 0.0, speed: float = 10.0,
+                camera: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Lawnmower pattern over `polygon` ([lat, lon] vertices) with passes along `angle`
+
+    `angle` is the pass heading in degrees from north. Passes alternate
+    direction, start half a spacing inside the polygon and are extended
+    by `turnaround` metres at both ends.
+    """
+    points = _points(polygon, 'polygon', 3)
+    spacing, trigger_distance, footprint = line_spacing(altitude, side_overlap, front_overlap, spacing, camera)
+    frame = LocalFrame(float(points[:, 0].mean()), float(points[:, 1].mean()))
+    x, y = frame.to_local(points[:, 0], points[:, 1])
+
+    # Rotate so the passes run along the local u axis, stacked along v
+    heading = math.radians(angle)
+    ux, uy = math.sin(heading), math.cos(heading)
+    u = x * ux + y * uy
+    v = -x * uy + y * ux
+    lines = np.arange(v.min() + spacing / 2.0, v.max(), spacing)
+    if len(lines) * 2 > MAX_WAYPOINTS:
+        raise ValueError(f"{len(lines)} passes is more than a mission can hold")
+    line, u_in, u_out = clip_scanlines(u, v, lines)
+
+    # Boustrophedon: every other pass (and its segments) runs backwards
+    rank = np.unique(line, return_inverse=True)[1]
+    backwards = rank % 2 == 1
+    order = np.lexsort((np.where(backwards, -u_in, u_in), line))
+    line, u_in, u_out, backwards = line[order], u_in[order], u_out[order], backwards[order]
+    start = np.where(backwards, u_out + turnaround, u_in - turnaround)
+    end = np.where(backwards, u_in - turnaround, u_out + turnaround)
+    pass_v = lines[line]
+
+    su = np.column_stack([start, end]).ravel()
+    sv = np.repeat(pass_v, 2)
+    plan = _summary(frame, su * ux - sv * uy, su * uy + sv * ux, altitude, speed, spacing,
+                    trigger_distance, footprint, int(len(np.unique(line))))
+    plan['area'] = round(polygon_area(x, y), 1)
+    plan['segments'] = int(len(line))
+    return plan
+
+
+def corridor(polyline: Sequence[Sequence[float]], width: float = 50.0, altitude: float = 50.0,
+             side_overlap: float = 0.7, front_overlap: float = 0.8, spacing: Optional[float] = None,
+             speed: float = 10.0, camera: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Parallel passes along `polyline` ([lat, lon] points) covering a corridor `width` metres wide
+
+    Enough passes are flown that their footprints cover the full width;
+    they alternate direction and are centred on the polyline.
+    """
+    points = _points(polyline, 'polyline', 2)
+    if width <= 0:
+        raise ValueError("width must be positive")
+    spacing, trigger_distance, footprint = line_spacing(altitude, side_overlap, front_overlap, spacing, camera)
+    frame = LocalFrame(float(points[:, 0].mean()), float(points[:, 1].mean()))
+    x, y = frame.to_local(points[:, 0], points[:, 1])
+
+    passes = max(1, math.ceil(max(0.0, width - footprint['width']) / spacing) + 1)
+    offsets = (np.arange(passes) - (passes - 1) / 2.0) * spacing
+    px, py = offset_polyline(x, y, offsets)
+    px[1::2] = px[1::2, ::-1]
+    py[1::2] = py[1::2, ::-1]
+    plan = _summary(frame, px.ravel(), py.ravel(), altitude, speed, spacing, trigger_distance,
+                    footprint, passes)
+    plan['width'] = width
+    return plan
+
+
+PLANNERS = {
+    'survey': (survey_grid, SURVEY_DEFAULTS),
+    'corridor': (corridor, CORRIDOR_DEFAULTS)
+}
+
+
+class MissionPlanner:
+    """Plans keyed by a hash of their normalized parameters, kept in an LRU cache"""
+
+    def __init__(self, cache_size: int = 64):
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.plan_time = 0.0
+
+    @staticmethod
+    def normalize(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Defaults filled in so equivalent requests share a cache entry"""
+        if kind not in PLANNERS:
+            raise ValueError(f"unknown plan type {kind}")
+        defaults = PLANNERS[kind][1]
+        unknown = set(params) - set(defaults)
+        if unknown:
+            raise ValueError(f"unknown parameters: {', '.join(sorted(unknown))}")
+        return {**defaults, **params}
+
+    @staticmethod
+    def key(kind: str, params: Dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()
+
+    def plan(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate (or fetch) a plan; the result carries its `key` and whether it was `cached`"""
+        params = self.normalize(kind, params)
+        key = self.key(kind, params)
+        plan = self._cache.get(key)
+        if plan is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return {**plan, 'cached': True}
+
+        started = time.perf_counter()
+        plan = PLANNERS[kind][0](**params)
+        elapsed = time.perf_counter() - started
+        self.plan_time += elapsed
+        self.misses += 1
+        plan.update({'type': kind, 'key': key, 'planning_ms': round(elapsed * 1000.0, 3)})
+        self._cache[key] = plan
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return {**plan, 'cached': False}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(key)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            'cached_plans': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'avg_planning_ms': round(self.plan_time / self.misses * 1000.0, 3) if self.misses else None
+        }
+
+
+def square(lat: float, lon: float, area_km2: float):
+    """Square polygon of `area_km2` centred on (lat, lon)"""
+    frame = LocalFrame(lat, lon)
+    half = math.sqrt(area_km2) * 500.0
+    x = np.array([-half, half, half, -half])
+    y = np.array([-half, -half, half, half])
+    plat, plon = frame.to_geo(x, y)
+    return np.column_stack([plat, plon]).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time survey grid and corridor generation')
+    parser.add_argument('--area', type=float, default=50.0, help='survey area in km²')
+    parser.add_argument('--spacing', type=float, default=5.0, help='line spacing in metres')
+    parser.add_argument('--angle', type=float, default=30.0, help='pass heading in degrees')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    polygon = square(12.9716, 77.5946, args.area)
+    for kind, params in (('survey', {'polygon': polygon, 'spacing': args.spacing, 'angle': args.angle}),
+                         ('corridor', {'polyline': polygon, 'width': 200.0, 'spacing': args.spacing})):
+        planner = MissionPlanner()
+        timings = []
+        for _ in range(args.repeat):
+            planner._cache.clear()
+            timings.append(planner.plan(kind, params)['planning_ms'])
+        plan = planner.plan(kind, params)
+        print(f"{kind}: {len(plan['waypoints'])} waypoints, {plan['passes']} passes, "
+              f"{plan['length'] / 1000.0:.1f} km, median {sorted(timings)[len(timings) // 2]:.2f} ms, "
+              f"cached={plan['cached']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+WebRTC peer governor
+Owns every peer connection from offer to close: its connection state, video
+profile, send bitrate and share of encoder time. New viewers are admitted
+against a peer limit and an encoder CPU budget (downgraded or rejected when
+over it), and peers that closed, failed or stopped making progress are
+evicted and closed concurrently
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from video import PROFILES, EncodedStream, VideoDistributor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PEERS = 32
+# Peers that never finish ICE/DTLS, or stay disconnected, are closed after these many seconds
+CONNECT_TIMEOUT = 30.0
+DISCONNECT_GRACE = 10.0
+CONNECTING_STATES = ('new', 'connecting')
+DONE_STATES = ('failed', 'closed')
+# Encoder time per full-size frame (seconds) until an encoder of that codec has been measured
+DEFAULT_ENCODE_TIME = {'VP8': 0.003, 'H264': 0.006}
+# Codec assumed for viewers whose own RTCRtpSender encodes (no shared codec negotiated)
+RELAY_CODEC = 'VP8'
+
+
+class AdmissionError(Exception):
+    """A new peer would exceed the node's peer or encoder limits"""
+
+
+class Peer:
+    """One peer connection and what it costs the node"""
+
+    def __init__(self, pc: Any, source: str):
+        self.pc = pc
+        self.source = source
+        self.label = f"peer-{id(pc):x}"
+        self.created = time.monotonic()
+        self.state = 'new'
+        self.state_since = self.created
+        self.track = None
+        self.stream: Optional[EncodedStream] = None
+        self.profile: Optional[str] = None
+        self.bytes_sent = 0
+        self.kbps: Optional[float] = None
+        self.sampled: Optional[float] = None
+
+    @property
+    def kind(self) -> str:
+        if self.track is None:
+            return 'data'
+        return 'packet' if self.stream is not None else 'frame'
+
+    def get_statistics(self, load: Optional[float]) -> Dict[str, Any]:
+        """Get this peer's state, profile and costs"""
+        now = time.monotonic()
+        return {
+            'label': self.label,
+            'state': self.state,
+            'state_seconds': round(now - self.state_since, 1),
+            'age_seconds': round(now - self.created, 1),
+            'source': self.source,
+            'kind': self.kind,
+            'codec': self.stream.codec_name if self.stream else None,
+            'bitrate': self.stream.bitrate if self.stream else None,
+            'profile': self.profile,
+            'kbps': self.kbps,
+            'bytes_sent': self.bytes_sent,
+            'encode_load': round(load, 4) if load is not None else None
+        }
+
+
+class PeerGovernor:
+    """Admission, state tracking and eviction for WebRTC peers
+
+    The encoder budget is in CPU cores: the measured encode time per second
+    of every running shared encoder, plus an estimate for each viewer whose
+    own sender encodes. A viewer that would push it over the budget is
+    moved onto an encoder that is already running, or given the degraded
+    profile (half size, half frame rate), or refused.
+    """
+
+    def __init__(self, video: VideoDistributor, max_peers: int = DEFAULT_MAX_PEERS,
+                 encode_budget: Optional[float] = None, connect_timeout: float = CONNECT_TIMEOUT,
+                 disconnect_grace: float = DISCONNECT_GRACE):
+        self.video = video
+        self.max_peers = max_peers
+        self.encode_budget = encode_budget
+        self.connect_timeout = connect_timeout
+        self.disconnect_grace = disconnect_grace
+        self.peers: Dict[Any, Peer] = {}
+
+        # Governor counters
+        self.admitted = 0
+        self.downgraded = 0
+        self.rejected = 0
+        self.evicted: Dict[str, int] = {}
+        self.pruned = 0
+
+    def _frame_time(self, codec: str) -> float:
+        """Encoder seconds per full-size frame, from the running encoders when there are any"""
+        measured = [stream.frame_time / stream.scale ** 2
+                    for stream in self.video.streams.values()
+                    if stream.codec_name == codec and stream.load is not None]
+        if measured:
+            return sum(measured) / len(measured)
+        return DEFAULT_ENCODE_TIME.get(codec, DEFAULT_ENCODE_TIME[RELAY_CODEC])
+
+    def estimate(self, source: str, codec: str, profile: str) -> float:
+        """Expected CPU cores for one more encoder of `source` at this codec and profile"""
+        scale, stride = PROFILES[profile]
+        return self._frame_time(codec) * scale ** 2 * self.video.sources[source].fps / stride
+
+    def _peer_load(self, peer: Peer) -> Optional[float]:
+        if peer.kind == 'frame':
+            return self.estimate(peer.source, RELAY_CODEC, peer.profile)
+        if peer.kind == 'packet' and peer.stream.load is not None:
+            return peer.stream.load / max(1, peer.stream.subscribers)
+        return None
+
+    def load(self) -> float:
+        """CPU cores in use (or expected) by video encoding"""
+        total = 0.0
+        for stream in self.video.streams.values():
+            if stream.task is None:
+                continue
+            load = stream.load
+            total += load if load is not None else self.estimate(stream.source.name, stream.codec_name,
+                                                                 stream.profile)
+        for peer in self.peers.values():
+            if peer.kind == 'frame':
+                total += self._peer_load(peer)
+        return total
+
+    def _fits(self, cost: float) -> bool:
+        return not self.encode_budget or self.load() + cost <= self.encode_budget
+
+    def _running(self, source: str, codec: str, profile: str, tier: int) -> Optional[EncodedStream]:
+        """A running encoder of `source` in this codec and profile, the nearest bitrate tier first"""
+        running = [stream for (name, stream_codec, _, stream_profile), stream in self.video.streams.items()
+                   if name == source and stream_codec == codec and stream_profile == profile
+                   and stream.task is not None]
+        return min(running, key=lambda stream: abs(stream.bitrate - tier), default=None)
+
+    def admit(self, source: str, codec: Optional[str], tier: Optional[int]) -> Tuple[Optional[str], Optional[int]]:
+        """(profile, bitrate tier) for a new peer, or AdmissionError
+
+        `tier` is None for a peer without video; `codec` is None when the
+        viewer's own sender will encode.
+        """
+        if len(self.peers) >= self.max_peers:
+            self._reject(f"peer limit ({self.max_peers}) reached")
+        if tier is None:
+            self.admitted += 1
+            return None, None
+
+        if codec is None:
+            for profile in PROFILES:
+                if self._fits(self.estimate(source, RELAY_CODEC, profile)):
+                    return self._admit(profile, tier, profile != 'full')
+            self._reject("encoder budget exhausted")
+
+        stream = self.video.streams.get((source, codec, tier, 'full'))
+        if stream is not None and stream.task is not None:
+            # Another viewer of an encoder that is already running costs nothing
+            return self._admit('full', tier, False)
+        for profile in PROFILES:
+            if self._fits(self.estimate(source, codec, profile)):
+                return self._admit(profile, tier, profile != 'full')
+            # Over budget for a new encoder: join one that is already running
+            stream = self._running(source, codec, profile, tier)
+            if stream is not None:
+                return self._admit(profile, stream.bitrate, True)
+        self._reject("encoder budget exhausted")
+
+    def _admit(self, profile: str, tier: int, downgraded: bool) -> Tuple[str, int]:
+        self.admitted += 1
+        if downgraded:
+            self.downgraded += 1
+            logger.info(f"🎥 WebRTC viewer downgraded to {profile} at {tier // 1000} kbps")
+        return profile, tier
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        logger.warning(f"⚠️ WebRTC peer rejected: {reason}")
+        raise AdmissionError(reason)
+
+    def add(self, pc: Any, source: str) -> Peer:
+        peer = self.peers[pc] = Peer(pc, source)
+        return peer
+
+    def set_state(self, pc: Any, state: str):
+        peer = self.peers.get(pc)
+        if peer is not None and peer.state != state:
+            peer.state = state
+            peer.state_since = time.monotonic()
+
+    async def close(self, pc: Any, reason: str):
+        """Forget a peer, stop its track and close its connection (idempotent)"""
+        peer = self.peers.pop(pc, None)
+        if peer is None:
+            return
+        self.evicted[reason] = self.evicted.get(reason, 0) + 1
+        if peer.track is not None:
+            peer.track.stop()
+        try:
+            await pc.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Error closing {peer.label}: {e}")
+
+    async def close_all(self, reason: str = 'shutdown'):
+        await asyncio.gather(*(self.close(pc, reason) for pc in list(self.peers)))
+
+    async def sweep(self):
+        """Evict peers that are done or stuck, sample send bitrates, drop idle encoders"""
+        now = time.monotonic()
+        stale = []
+        for pc, peer in self.peers.items():
+            waited = now - peer.state_since
+            if peer.state in DONE_STATES:
+                stale.append((pc, peer.state))
+            elif peer.state in CONNECTING_STATES and waited >= self.connect_timeout:
+                stale.append((pc, 'connect_timeout'))
+            elif peer.state == 'disconnected' and waited >= self.disconnect_grace:
+                stale.append((pc, 'disconnected'))
+        if stale:
+            logger.info(f"🧹 Closing {len(stale)} stale WebRTC peer(s)")
+            await asyncio.gather(*(self.close(pc, reason) for pc, reason in stale))
+
+        connected = [peer for peer in self.peers.values() if peer.state == 'connected' and peer.track is not None]
+        await asyncio.gather(*(self._sample(peer) for peer in connected))
+        self.pruned += self.video.prune()
+
+    async def _sample(self, peer: Peer):
+        try:
+            report = await peer.pc.getStats()
+        except Exception:
+            return
+        sent = sum(getattr(stats, 'bytesSent', 0) for stats in report.values() if stats.type == 'outbound-rtp')
+        now = time.monotonic()
+        if peer.sampled is not None and now > peer.sampled:
+            peer.kbps = round((sent - peer.bytes_sent) * 8 / (now - peer.sampled) / 1000, 1)
+        peer.bytes_sent = sent
+        peer.sampled = now
+
+    def get_peers(self) -> List[Dict[str, Any]]:
+        """Per-peer state, profile, bitrate and encoder share"""
+        return [peer.get_statistics(self._peer_load(peer)) for peer in self.peers.values()]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get admission and eviction counters"""
+        states: Dict[str, int] = {}
+        for peer in self.peers.values():
+            states[peer.state] = states.get(peer.state, 0) + 1
+        return {
+            'peers': len(self.peers),
+            'max_peers': self.max_peers,
+            'states': states,
+            'encode_load': round(self.load(), 4),
+            'encode_budget': self.encode_budget,
+            'admitted': self.admitted,
+            'downgraded': self.downgraded,
+            'rejected': self.rejected,
+            'evicted': dict(self.evicted),
+            'pruned_encoders': self.pruned
+        }
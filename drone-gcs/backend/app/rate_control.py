@@ -0,0 +1,160 @@
+"""
+Adaptive per-client telemetry rate control
+Each WebSocket client subscribes at a requested rate (1-50 Hz), optionally
+per field group; an AIMD controller steps the client down when its send
+queue, send lag or RTT grows and back up as the link recovers
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+MIN_RATE = 1.0
+MAX_RATE = 50.0
+DEFAULT_RATE = 10.0
+
+# Whole telemetry frame; the default subscription and the only one for struct clients
+FULL_FRAME = 'all'
+
+FIELD_GROUPS: Dict[str, Tuple[str, ...]] = {
+    'attitude': ('roll', 'pitch', 'yaw', 'rollspeed', 'pitchspeed', 'yawspeed', 'heading'),
+    'gps': ('lat', 'lon', 'alt', 'relative_alt', 'satellites', 'fix_type', 'eph', 'epv'),
+    'velocity': ('groundspeed', 'airspeed', 'climb', 'vx', 'vy', 'vz', 'throttle'),
+    'battery': ('battery_remaining', 'voltage_battery', 'current_battery'),
+    # Everything else: mode, armed, system_status, rssi, mission progress, ...
+    'status': (),
+}
+DEFAULT_GROUP_RATES = {'attitude': 30.0, 'gps': 5.0, 'velocity': 10.0, 'battery': 1.0, 'status': 2.0}
+GROUP_OF = {field: group for group, fields in FIELD_GROUPS.items() for field in fields}
+
+# Rate ceiling from the vehicle link quality (NetworkManager.get_connection_quality); main.py
+# only applies it with LINK_QUALITY_CEILING=on, since those figures are simulated
+LINK_CEILINGS = {'excellent': 1.0, 'good': 1.0, 'fair': 0.5, 'poor': 0.25}
+
+
+def clamp_rate(rate: Any) -> float:
+    return max(MIN_RATE, min(MAX_RATE, float(rate)))
+
+
+def parse_groups(value: Union[None, str, Iterable, Dict[str, Any]]) -> Optional[Dict[str, float]]:
+    """Group subscription from "attitude:30,gps", a list of names or a {group: hz} dict
+
+    Groups without an explicit rate use DEFAULT_GROUP_RATES; unknown names are ignored.
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = [item for item in value.split(',') if item]
+    if not isinstance(value, dict):
+        pairs = {}
+        for item in value:
+            name, _, rate = str(item).partition(':')
+            pairs[name.strip()] = rate or None
+        value = pairs
+    groups = {}
+    for name, rate in value.items():
+        if name in FIELD_GROUPS:
+            groups[name] = clamp_rate(rate if rate else DEFAULT_GROUP_RATES[name])
+    return groups or None
+
+
+def select_fields(telemetry: Dict[str, Any], group: str) -> Dict[str, Any]:
+    """Fields of one group (plus the timestamp) from a telemetry dict"""
+    if group == FULL_FRAME:
+        return telemetry
+    selected = {key: value for key, value in telemetry.items() if GROUP_OF.get(key, 'status') == group}
+    if 'timestamp' in telemetry:
+        selected['timestamp'] = telemetry['timestamp']
+    return selected
+
+
+def group_filter(group: str):
+    """Field predicate for a group, for DeltaStream.since()"""
+    if group == FULL_FRAME:
+        return None
+    return lambda key: key == 'timestamp' or GROUP_OF.get(key, 'status') == group
+
+
+class RateController:
+    """Per-client send schedule with additive-increase / multiplicative-decrease
+
+    `scale` multiplies every group rate. A congestion signal (frames
+    conflated away since the last check, reliable backlog, send lag or RTT
+    above their limits) halves it at most once per `decrease_holdoff`;
+    otherwise it grows by `increase_per_second`. Rates never fall below
+    MIN_RATE, so a degraded client keeps receiving every group.
+    """
+
+    def __init__(self, rate: Optional[float] = None, groups: Optional[Dict[str, float]] = None,
+                 depth_limit: int = 4, lag_limit: float = 0.25, rtt_limit: float = 0.5,
+                 increase_per_second: float = 0.1, decrease_holdoff: float = 1.0):
+        self.depth_limit = depth_limit
+        self.lag_limit = lag_limit
+        self.rtt_limit = rtt_limit
+        self.increase_per_second = increase_per_second
+        self.decrease_holdoff = decrease_holdoff
+        self.scale = 1.0
+        self.ceiling = 1.0
+        self.rtt: Optional[float] = None
+        self.last_observe: Optional[float] = None
+        self.last_decrease = float('-inf')
+        self.last_dropped = 0
+        self.decreases = 0
+        self.subscribe(rate, groups)
+
+    def subscribe(self, rate: Optional[float] = None, groups: Optional[Dict[str, float]] = None):
+        """Change the requested rate (an overall cap) and group rates
+
+        Without an explicit rate the cap is the fastest group, or DEFAULT_RATE.
+        """
+        if rate is None:
+            rate = max(groups.values()) if groups else DEFAULT_RATE
+        self.requested = clamp_rate(rate)
+        self.groups = dict(groups) if groups else {FULL_FRAME: self.requested}
+        self.next_due = {group: 0.0 for group in self.groups}
+
+    def rate_for(self, group: str) -> float:
+        """Current effective rate of a group in Hz"""
+        return max(MIN_RATE, min(self.groups[group], self.requested) * min(self.scale, self.ceiling))
+
+    def due(self, now: float, slack: float = 0.0) -> List[str]:
+        """Groups whose next send time has come (`slack` absorbs tick jitter)"""
+        return [group for group, deadline in self.next_due.items() if now + slack >= deadline]
+
+    def consume(self, group: str, now: float):
+        """A group was sent: schedule the next one without bursting to catch up"""
+        interval = 1.0 / self.rate_for(group)
+        deadline = self.next_due[group] + interval
+        self.next_due[group] = deadline if deadline > now else now + interval
+
+    def observe(self, now: float, dropped: int, reliable_depth: int, send_lag: float):
+        """Feed the channel's delivery counters; adjusts `scale`"""
+        elapsed = 0.0 if self.last_observe is None else now - self.last_observe
+        self.last_observe = now
+        conflated = dropped > self.last_dropped
+        self.last_dropped = dropped
+
+        congested = (conflated or reliable_depth > self.depth_limit or send_lag > self.lag_limit
+                     or (self.rtt is not None and self.rtt > self.rtt_limit))
+        if congested:
+            if now - self.last_decrease >= self.decrease_holdoff:
+                self.scale = max(MIN_RATE / MAX_RATE, self.scale * 0.5)
+                self.last_decrease = now
+                self.decreases += 1
+        else:
+            self.scale = min(1.0, self.scale + self.increase_per_second * elapsed)
+
+    def record_rtt(self, rtt: float):
+        """Smoothed round-trip time from rtt_probe / rtt_ack"""
+        self.rtt = rtt if self.rtt is None else self.rtt * 0.8 + rtt * 0.2
+
+    def set_link_quality(self, quality: str):
+        self.ceiling = LINK_CEILINGS.get(quality, 1.0)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Requested vs effective rates and the controller state"""
+        return {
+            'requested': self.requested,
+            'rates': {group: round(self.rate_for(group), 2) for group in self.groups},
+            'scale': round(self.scale, 3),
+            'ceiling': self.ceiling,
+            'rtt': self.rtt,
+            'decreases': self.decreases
+        }
@@ -0,0 +1,229 @@
+"""
+Drift-free periodic job scheduler
+Jobs run on absolute loop.time() deadlines (start + n * interval), so
+their rate does not depend on how long each run takes; missed ticks and
+start-time jitter are counted per job
+
+Any module can register a job on the shared `scheduler`:
+
+    from scheduler import scheduler
+    scheduler.register('fleet_eviction', 1.0, fleet.evict_stale)
+"""
+import asyncio
+import heapq
+import inspect
+import logging
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Jitter histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+JITTER_BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0)
+
+
+class Job:
+    """One periodic job and its timing counters"""
+
+    def __init__(self, name: str, interval: float, callback: Callable[[], Any], order: int):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.is_async = inspect.iscoroutinefunction(callback)
+        self.order = order
+        self.start = 0.0
+        self.tick = 0
+        self.deadline = 0.0
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+
+        # Timing counters
+        self.runs = 0
+        self.missed = 0
+        self.overruns = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.max_jitter = 0.0
+        self.jitter_counts = [0] * (len(JITTER_BUCKETS_MS) + 1)
+
+    def record_jitter(self, jitter: float):
+        ms = jitter * 1000.0
+        self.jitter_counts[bisect_left(JITTER_BUCKETS_MS, ms)] += 1
+        if jitter > self.max_jitter:
+            self.max_jitter = jitter
+
+    def jitter_percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound (ms) of the bucket holding the given fraction of runs"""
+        total = sum(self.jitter_counts)
+        if not total:
+            return None
+        target = fraction * total
+        seen = 0
+        for bound, count in zip(JITTER_BUCKETS_MS + (None,), self.jitter_counts):
+            seen += count
+            if seen >= target:
+                return bound if bound is not None else round(self.max_jitter * 1000.0, 3)
+        return None
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Runs, missed ticks, durations and the start-jitter histogram"""
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'missed': self.missed,
+            'overruns': self.overruns,
+            'errors': self.errors,
+            'last_duration_ms': round(self.last_duration * 1000.0, 3),
+            'max_duration_ms': round(self.max_duration * 1000.0, 3),
+            'jitter_p50_ms': self.jitter_percentile(0.5),
+            'jitter_p99_ms': self.jitter_percentile(0.99),
+            'max_jitter_ms': round(self.max_jitter * 1000.0, 3),
+            'jitter_histogram_ms': {
+                (f"le_{bound}" if bound is not None else 'inf'): count
+                for bound, count in zip(JITTER_BUCKETS_MS + (None,), self.jitter_counts)
+            }
+        }
+
+
+class Scheduler:
+    """Runs periodic jobs at exact rates from one task
+
+    Sync callbacks run inline and should be short. Async callbacks run as
+    their own task; if the previous run is still going when the next tick
+    comes, that tick is skipped and counted as an overrun. When the loop
+    falls behind by whole intervals, those ticks are counted as missed and
+    skipped rather than run in a burst.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._heap: List = []
+        self._order = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, interval: float, callback: Callable[[], Any],
+                 delay: float = 0.0) -> Job:
+        """Add (or replace) a job running every `interval` seconds, first after `delay`"""
+        self.unregister(name)
+        self._order += 1
+        job = Job(name, interval, callback, self._order)
+        self.jobs[name] = job
+        if self._task is not None:
+            self._schedule(job, asyncio.get_running_loop().time() + delay)
+        else:
+            job.start = delay  # relative until run() starts
+        return job
+
+    def every(self, interval: float, name: Optional[str] = None):
+        """Decorator form of register()"""
+        def decorator(callback):
+            self.register(name or callback.__name__, interval, callback)
+            return callback
+        return decorator
+
+    def unregister(self, name: str):
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            job.cancelled = True
+
+    def _schedule(self, job: Job, start: float):
+        job.start = start
+        job.tick = 0
+        job.deadline = start
+        heapq.heappush(self._heap, (job.deadline, job.order, job))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> asyncio.Task:
+        """Start the scheduler task on the running loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        now = loop.time()
+        for job in self.jobs.values():
+            self._schedule(job, now + job.start)
+
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            deadline, _, job = self._heap[0]
+            delay = deadline - loop.time()
+            if delay > 0:
+                # Wake early if a job with an earlier deadline is registered meanwhile
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+            self._run_job(job, loop.time())
+
+            # Next deadline is computed from the start time, never from "now"
+            job.tick += 1
+            next_deadline = job.start + job.tick * job.interval
+            now = loop.time()
+            if next_deadline <= now:
+                behind = int((now - next_deadline) // job.interval) + 1
+                job.missed += behind
+                job.tick += behind
+                next_deadline = job.start + job.tick * job.interval
+            job.deadline = next_deadline
+            heapq.heappush(self._heap, (next_deadline, job.order, job))
+
+    def _run_job(self, job: Job, now: float):
+        job.record_jitter(now - job.deadline)
+        if job.is_async:
+            if job.task is not None and not job.task.done():
+                job.overruns += 1
+                return
+            job.task = asyncio.create_task(self._run_async(job, now))
+            return
+        try:
+            job.callback()
+        except Exception as e:
+            job.errors += 1
+            logger.error(f"❌ Scheduled job {job.name} failed: {e}")
+        self._finish(job, now)
+
+    async def _run_async(self, job: Job, started: float):
+        try:
+            await job.callback()
+        except Exception as e:
+            job.errors += 1
+            logger.error(f"❌ Scheduled job {job.name} failed: {e}")
+        self._finish(job, started)
+
+    def _finish(self, job: Job, started: float):
+        job.runs += 1
+        job.last_duration = asyncio.get_running_loop().time() - started
+        if job.last_duration > job.max_duration:
+            job.max_duration = job.last_duration
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+
+    def get_statistics(self) -> Dict[str, Dict[str, Any]]:
+        """Timing counters per job"""
+        return {name: job.get_statistics() for name, job in self.jobs.items()}
+
+
+# Shared scheduler for the application
+scheduler = Scheduler()
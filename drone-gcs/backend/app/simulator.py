@@ -0,0 +1,438 @@
+"""
+Vectorized multi-vehicle simulator
+Holds the state of a whole fleet in NumPy arrays, advances every vehicle in
+one step (kinematics from heading and groundspeed, battery drain, attitude
+noise) and encodes real MAVLink v2 frames for all vehicles at once, so
+thousands of vehicles can be flown against the GCS over UDP
+
+Usage: python app/simulator.py [--vehicles 1000] [--rate 10] [--target 127.0.0.1:14550] [--seed 1]
+"""
+import argparse
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from mavlink_codec import MAVLINK_STX_V2, MESSAGE_IDS, MESSAGE_SPECS, MODE_NAMES, MODE_NUMBERS, crc_accumulate
+
+logger = logging.getLogger(__name__)
+
+# Bangalore, India
+DEFAULT_ORIGIN = (12.9716, 77.5946)
+
+M_PER_DEG_LAT = 111320.0
+GRAVITY = 9.80665
+
+# Flight envelope
+MAX_TURN_RATE = 30.0        # deg/s
+TURN_TAU = 8.0              # s, turn-rate random walk time constant
+TURN_SIGMA = 6.0            # deg/s per sqrt(s)
+SPEED_TAU = 3.0             # s, groundspeed response
+MAX_CLIMB = 3.0             # m/s
+ALTITUDE_GAIN = 0.5         # 1/s, climb rate per metre of altitude error
+
+# 3S LiPo battery
+CELLS = 3
+CELL_FULL = 4.2
+CELL_EMPTY = 3.5
+CAPACITY_AH = 5.0
+INTERNAL_RESISTANCE = 0.02  # ohm
+HOVER_CURRENT = 8.0         # A
+IDLE_CURRENT = 0.5          # A
+
+# MAV_TYPE_QUADROTOR, MAV_AUTOPILOT_ARDUPILOTMEGA, MAV_STATE_STANDBY / MAV_STATE_ACTIVE
+MAV_TYPE_QUADROTOR = 2
+MAV_AUTOPILOT_ARDUPILOTMEGA = 3
+MAV_STATE_STANDBY = 3
+MAV_STATE_ACTIVE = 4
+MAV_MODE_FLAG_SAFETY_ARMED = 0x80
+MAV_MODE_FLAG_CUSTOM_MODE_ENABLED = 0x01
+
+# struct format character -> little-endian NumPy type
+_NUMPY_TYPES = {'B': 'u1', 'b': 'i1', 'H': '<u2', 'h': '<i2', 'I': '<u4', 'i': '<i4',
+                'Q': '<u8', 'q': '<i8', 'f': '<f4', 'd': '<f8'}
+
+# Field names of the messages the simulator sends, in wire order
+FIELD_NAMES = {
+    'HEARTBEAT': ('custom_mode', 'type', 'autopilot', 'base_mode', 'system_status', 'mavlink_version'),
+    'SYS_STATUS': ('sensors_present', 'sensors_enabled', 'sensors_health', 'load', 'voltage_battery',
+                   'current_battery', 'drop_rate_comm', 'errors_comm', 'errors_count1', 'errors_count2',
+                   'errors_count3', 'errors_count4', 'battery_remaining'),
+    'GPS_RAW_INT': ('time_usec', 'lat', 'lon', 'alt', 'eph', 'epv', 'vel', 'cog', 'fix_type',
+                    'satellites_visible'),
+    'ATTITUDE': ('time_boot_ms', 'roll', 'pitch', 'yaw', 'rollspeed', 'pitchspeed', 'yawspeed'),
+    'GLOBAL_POSITION_INT': ('time_boot_ms', 'lat', 'lon', 'alt', 'relative_alt', 'vx', 'vy', 'vz', 'hdg'),
+    'VFR_HUD': ('airspeed', 'groundspeed', 'alt', 'climb', 'heading', 'throttle'),
+    'MISSION_CURRENT': ('seq',),
+}
+
+TELEMETRY_MESSAGES = ('ATTITUDE', 'GLOBAL_POSITION_INT', 'VFR_HUD')
+STATUS_MESSAGES = ('HEARTBEAT', 'SYS_STATUS', 'GPS_RAW_INT')
+
+_CRC_TABLE = np.array([crc_accumulate(byte, 0) for byte in range(256)], dtype=np.uint16)
+
+
+def vehicle_address(index: int) -> Tuple[int, int]:
+    """(sysid, compid) of simulated vehicle `index`; compid spreads fleets beyond 250 vehicles"""
+    return 1 + index % 250, 1 + index // 250
+
+
+def crc_x25_rows(data: np.ndarray, crc_extra: int) -> np.ndarray:
+    """MAVLink checksum of every row of a (frames, bytes) uint8 array, one column at a time"""
+    crc = np.full(data.shape[0], 0xFFFF, dtype=np.uint16)
+    for column in data.T:
+        crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ column) & 0xFF]
+    return (crc >> 8) ^ _CRC_TABLE[(crc ^ crc_extra) & 0xFF]
+
+
+class FrameBatch:
+    """One MAVLink v2 message for many vehicles, laid out as a structured array
+
+    Payloads are sent untruncated (trailing zeros kept), which every v2
+    receiver accepts, so all frames of a message have the same length.
+    """
+
+    def __init__(self, name: str, sysids: np.ndarray, compids: np.ndarray):
+        msg_id = MESSAGE_IDS[name]
+        spec = MESSAGE_SPECS[msg_id]
+        fmt = spec.layout.format
+        fmt = fmt.decode() if isinstance(fmt, bytes) else fmt
+        names = FIELD_NAMES.get(name) or tuple(f'f{i}' for i in range(len(fmt) - 1))
+        payload = np.dtype([(field, _NUMPY_TYPES[code]) for field, code in zip(names, fmt.lstrip('<'))])
+        self.crc_extra = spec.crc_extra
+        self.frames = np.zeros(len(sysids), dtype=[
+            ('stx', 'u1'), ('len', 'u1'), ('incompat_flags', 'u1'), ('compat_flags', 'u1'), ('seq', 'u1'),
+            ('sysid', 'u1'), ('compid', 'u1'), ('msgid', '<u2'), ('msgid_high', 'u1'),
+            ('payload', payload), ('crc', '<u2')
+        ])
+        self.frames['stx'] = MAVLINK_STX_V2
+        self.frames['len'] = payload.itemsize
+        self.frames['sysid'] = sysids
+        self.frames['compid'] = compids
+        self.frames['msgid'] = msg_id & 0xFFFF
+        self.frames['msgid_high'] = msg_id >> 16
+        self.payload = self.frames['payload']
+        self.raw = self.frames.view(np.uint8).reshape(len(sysids), -1)
+
+    def finish(self, seq: int) -> np.ndarray:
+        """Stamp the sequence number and checksums; returns the (vehicles, frame bytes) array"""
+        self.frames['seq'] = seq & 0xFF
+        self.frames['crc'] = crc_x25_rows(self.raw[:, 1:-2], self.crc_extra)
+        return self.raw
+
+
+def split_rows(rows: np.ndarray) -> List[bytes]:
+    """One bytes object per row of a (vehicles, bytes) array"""
+    data = rows.tobytes()
+    size = rows.shape[1]
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+
+class FleetSimulator:
+    """State of `count` vehicles in NumPy arrays, advanced together by step()
+
+    Vehicles start spread over a disc of `radius` metres around `origin`
+    and wander with a random-walk turn rate, turning back towards the
+    centre when they leave the disc. The same seed gives the same flight
+    for the same sequence of step() calls.
+    """
+
+    def __init__(self, count: int = 1, seed: Optional[int] = None,
+                 origin: Tuple[float, float] = DEFAULT_ORIGIN, radius: float = 2000.0,
+                 cruise_alt: float = 100.0, home_alt: float = 0.0, armed: bool = True,
+                 first_vehicle: int = 0):
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+        self.origin = origin
+        self.radius = radius
+        self.home_alt = home_alt
+        rng = self.rng
+
+        indices = range(first_vehicle, first_vehicle + count)
+        self.sysids = np.array([vehicle_address(i)[0] for i in indices], dtype=np.uint8)
+        self.compids = np.array([vehicle_address(i)[1] for i in indices], dtype=np.uint8)
+
+        distance = radius * np.sqrt(rng.random(count))
+        bearing = rng.random(count) * 2.0 * math.pi
+        self.lat = origin[0] + distance * np.cos(bearing) / M_PER_DEG_LAT
+        self.lon = origin[1] + distance * np.sin(bearing) / (M_PER_DEG_LAT * math.cos(math.radians(origin[0])))
+        self.relative_alt = np.full(count, cruise_alt)
+        self.target_alt = cruise_alt + rng.uniform(-20.0, 20.0, count)
+        self.heading = rng.uniform(0.0, 360.0, count)        # degrees
+        self.turn_rate = np.zeros(count)                      # deg/s
+        self.groundspeed = np.zeros(count)
+        self.target_speed = rng.uniform(8.0, 15.0, count)
+        self.climb = np.zeros(count)
+        self.roll = np.zeros(count)                           # radians
+        self.pitch = np.zeros(count)
+        self.battery = rng.uniform(85.0, 100.0, count)        # percent
+        self.current = np.zeros(count)
+        self.voltage = np.zeros(count)
+        self.armed = np.full(count, armed)
+        self.custom_mode = np.full(count, MODE_NUMBERS['GUIDED'], dtype=np.uint32)
+        self.satellites = rng.integers(12, 19, count)
+        self.eph = rng.uniform(0.5, 2.0, count)
+        self.rssi = rng.uniform(-75.0, -45.0, count)
+        self.time = 0.0
+        self.seq = 0
+        self._update_battery()
+
+        self._batches = {name: FrameBatch(name, self.sysids, self.compids)
+                         for name in TELEMETRY_MESSAGES + STATUS_MESSAGES}
+
+    def step(self, dt: float):
+        """Advance every vehicle by `dt` seconds"""
+        n = self.count
+        noise = self.rng.standard_normal((5, n))
+        root_dt = math.sqrt(dt)
+        armed = self.armed
+
+        # Turn rate: mean-reverting random walk, steering home outside the radius
+        self.turn_rate += -self.turn_rate * dt / TURN_TAU + TURN_SIGMA * root_dt * noise[0]
+        north = (self.lat - self.origin[0]) * M_PER_DEG_LAT
+        east = (self.lon - self.origin[1]) * M_PER_DEG_LAT * np.cos(np.radians(self.lat))
+        homeward = np.degrees(np.arctan2(-east, -north))
+        error = (homeward - self.heading + 540.0) % 360.0 - 180.0
+        outside = north * north + east * east > self.radius * self.radius
+        self.turn_rate = np.where(outside, 0.5 * error, self.turn_rate)
+        np.clip(self.turn_rate, -MAX_TURN_RATE, MAX_TURN_RATE, out=self.turn_rate)
+        turn = np.where(armed, self.turn_rate, 0.0)
+        self.heading = (self.heading + turn * dt) % 360.0
+
+        # Groundspeed and climb: first-order response towards the targets
+        target_speed = np.where(armed, self.target_speed, 0.0)
+        self.groundspeed += (target_speed - self.groundspeed) * min(1.0, dt / SPEED_TAU)
+        self.groundspeed += 0.2 * root_dt * noise[1] * armed
+        np.maximum(self.groundspeed, 0.0, out=self.groundspeed)
+        climb = np.clip(ALTITUDE_GAIN * (self.target_alt - self.relative_alt) + 0.3 * noise[2],
+                        -MAX_CLIMB, MAX_CLIMB)
+        self.climb = np.where(armed, climb, 0.0)
+        self.relative_alt = np.maximum(0.0, self.relative_alt + self.climb * dt)
+
+        # Position from heading and groundspeed
+        heading = np.radians(self.heading)
+        self.lat += self.groundspeed * np.cos(heading) * dt / M_PER_DEG_LAT
+        self.lon += self.groundspeed * np.sin(heading) * dt / (M_PER_DEG_LAT * np.cos(np.radians(self.lat)))
+
+        # Coordinated-turn bank, nose down in forward flight, plus sensor noise
+        self.roll = np.arctan(self.groundspeed * np.radians(turn) / GRAVITY) + 0.01 * noise[3]
+        self.pitch = -0.01 * self.groundspeed + 0.01 * noise[4]
+
+        # Battery: current grows with speed and climb
+        self.current = np.where(armed, HOVER_CURRENT + 0.08 * self.groundspeed ** 2 + 2.0 * np.abs(self.climb),
+                                IDLE_CURRENT)
+        self.battery = np.maximum(0.0, self.battery - self.current * dt / 3600.0 / CAPACITY_AH * 100.0)
+        self._update_battery()
+        self.time += dt
+
+    def _update_battery(self):
+        cell = CELL_EMPTY + (CELL_FULL - CELL_EMPTY) * self.battery / 100.0
+        self.voltage = CELLS * cell - self.current * INTERNAL_RESISTANCE
+
+    def set_armed(self, index: int, armed: bool):
+        self.armed[index] = armed
+
+    def set_mode(self, index: int, mode: str) -> bool:
+        number = MODE_NUMBERS.get(mode)
+        if number is None:
+            return False
+        self.custom_mode[index] = number
+        return True
+
+    # ------------------------------------------------------------ MAVLink frames
+
+    def _next_seq(self) -> int:
+        seq = self.seq
+        self.seq = (seq + 1) & 0xFF
+        return seq
+
+    def telemetry_frames(self) -> np.ndarray:
+        """ATTITUDE, GLOBAL_POSITION_INT and VFR_HUD for every vehicle, one row per vehicle"""
+        boot_ms = int(self.time * 1000) & 0xFFFFFFFF
+        yaw = np.radians(self.heading)
+        alt = self.home_alt + self.relative_alt
+        vx = self.groundspeed * np.cos(yaw)
+        vy = self.groundspeed * np.sin(yaw)
+
+        attitude = self._batches['ATTITUDE'].payload
+        attitude['time_boot_ms'] = boot_ms
+        attitude['roll'] = self.roll
+        attitude['pitch'] = self.pitch
+        attitude['yaw'] = np.where(yaw > math.pi, yaw - 2.0 * math.pi, yaw)
+        attitude['yawspeed'] = np.radians(np.where(self.armed, self.turn_rate, 0.0))
+
+        position = self._batches['GLOBAL_POSITION_INT'].payload
+        position['time_boot_ms'] = boot_ms
+        position['lat'] = np.round(self.lat * 1e7)
+        position['lon'] = np.round(self.lon * 1e7)
+        position['alt'] = np.round(alt * 1000.0)
+        position['relative_alt'] = np.round(self.relative_alt * 1000.0)
+        position['vx'] = np.round(vx * 100.0)
+        position['vy'] = np.round(vy * 100.0)
+        position['vz'] = np.round(-self.climb * 100.0)
+        position['hdg'] = np.round(self.heading * 100.0) % 36000
+
+        hud = self._batches['VFR_HUD'].payload
+        hud['airspeed'] = self.groundspeed
+        hud['groundspeed'] = self.groundspeed
+        hud['alt'] = alt
+        hud['climb'] = self.climb
+        hud['heading'] = self.heading.astype(np.int16)
+        hud['throttle'] = np.where(self.armed, np.clip(40.0 + 2.0 * self.groundspeed, 0, 100), 0)
+
+        return np.concatenate([self._batches[name].finish(self._next_seq()) for name in TELEMETRY_MESSAGES],
+                              axis=1)
+
+    def status_frames(self) -> np.ndarray:
+        """HEARTBEAT, SYS_STATUS and GPS_RAW_INT for every vehicle, one row per vehicle"""
+        n = self.count
+        self.satellites = np.clip(self.satellites + self.rng.integers(-1, 2, n), 8, 20)
+        self.eph = np.clip(self.eph + 0.05 * self.rng.standard_normal(n), 0.5, 3.0)
+        self.rssi = np.clip(self.rssi + self.rng.standard_normal(n), -90.0, -40.0)
+
+        heartbeat = self._batches['HEARTBEAT'].payload
+        heartbeat['custom_mode'] = self.custom_mode
+        heartbeat['type'] = MAV_TYPE_QUADROTOR
+        heartbeat['autopilot'] = MAV_AUTOPILOT_ARDUPILOTMEGA
+        heartbeat['base_mode'] = MAV_MODE_FLAG_CUSTOM_MODE_ENABLED | np.where(
+            self.armed, MAV_MODE_FLAG_SAFETY_ARMED, 0)
+        heartbeat['system_status'] = np.where(self.armed, MAV_STATE_ACTIVE, MAV_STATE_STANDBY)
+        heartbeat['mavlink_version'] = 3
+
+        status = self._batches['SYS_STATUS'].payload
+        status['voltage_battery'] = np.round(self.voltage * 1000.0)
+        status['current_battery'] = np.round(self.current * 100.0)
+        status['battery_remaining'] = np.round(self.battery)
+        status['load'] = 500
+
+        gps = self._batches['GPS_RAW_INT'].payload
+        gps['time_usec'] = int(self.time * 1e6)
+        gps['lat'] = np.round(self.lat * 1e7)
+        gps['lon'] = np.round(self.lon * 1e7)
+        gps['alt'] = np.round((self.home_alt + self.relative_alt) * 1000.0)
+        gps['eph'] = np.round(self.eph * 100.0)
+        gps['epv'] = np.round(self.eph * 150.0)
+        gps['vel'] = np.round(self.groundspeed * 100.0)
+        gps['cog'] = np.round(self.heading * 100.0) % 36000
+        gps['fix_type'] = 3
+        gps['satellites_visible'] = self.satellites
+
+        return np.concatenate([self._batches[name].finish(self._next_seq()) for name in STATUS_MESSAGES],
+                              axis=1)
+
+    def datagrams(self, status: bool = False) -> List[bytes]:
+        """One datagram per vehicle with its telemetry (and status) frames"""
+        rows = self.telemetry_frames()
+        if status:
+            rows = np.concatenate([self.status_frames(), rows], axis=1)
+        return split_rows(rows)
+
+    # ------------------------------------------------------------ in-process telemetry
+
+    def telemetry(self, index: int = 0) -> Dict[str, Any]:
+        """One vehicle in the simulation telemetry dict shape (roll/pitch in degrees)"""
+        armed = bool(self.armed[index])
+        heading = float(self.heading[index])
+        return {
+            'lat': float(self.lat[index]),
+            'lon': float(self.lon[index]),
+            'alt': float(self.home_alt + self.relative_alt[index]),
+            'relative_alt': float(self.relative_alt[index]),
+            'groundspeed': float(self.groundspeed[index]),
+            'airspeed': float(self.groundspeed[index]),
+            'climb': float(self.climb[index]),
+            'heading': heading,
+            'armed': armed,
+            'mode': MODE_NAMES.get(int(self.custom_mode[index]), 'UNKNOWN'),
+            'system_status': 'ACTIVE' if armed else 'STANDBY',
+            'battery_remaining': float(self.battery[index]),
+            'voltage_battery': float(self.voltage[index]),
+            'current_battery': float(self.current[index]),
+            'satellites': int(self.satellites[index]),
+            'fix_type': 3,
+            'eph': float(self.eph[index]),
+            'epv': float(self.eph[index] * 1.5),
+            'rssi': float(self.rssi[index]),
+            'roll': math.degrees(self.roll[index]),
+            'pitch': math.degrees(self.pitch[index]),
+            'yaw': heading,
+            'timestamp': time.time()
+        }
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            'vehicles': self.count,
+            'sim_time': round(self.time, 3),
+            'armed': int(self.armed.sum()),
+            'mean_battery': round(float(self.battery.mean()), 2) if self.count else None,
+            'mean_groundspeed': round(float(self.groundspeed.mean()), 2) if self.count else None
+        }
+
+
+async def run(simulator: FleetSimulator, target: Tuple[str, int], rate: float = 10.0,
+              status_rate: float = 1.0, speed: float = 1.0, duration: Optional[float] = None,
+              counters: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """Fly the fleet and send its frames to `target` over UDP on drift-free deadlines
+
+    Each tick advances the simulation by speed / rate seconds, so runs with
+    the same seed, rate and speed are reproducible.
+    """
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=target)
+    counters = counters if counters is not None else {}
+    counters.setdefault('datagrams', 0)
+    counters.setdefault('frames', 0)
+    interval = 1.0 / rate
+    status_every = max(1, round(rate / status_rate))
+    frames_per_tick = len(TELEMETRY_MESSAGES) * simulator.count
+    start = loop.time()
+    tick = 0
+    try:
+        while duration is None or tick * interval < duration:
+            status = tick % status_every == 0
+            for datagram in simulator.datagrams(status):
+                transport.sendto(datagram)
+            counters['datagrams'] += simulator.count
+            counters['frames'] += frames_per_tick * (2 if status else 1)
+            simulator.step(interval * speed)
+            tick += 1
+            delay = start + tick * interval - loop.time()
+            await asyncio.sleep(delay if delay > 0 else 0)
+    finally:
+        transport.close()
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vehicles', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=10.0, help='telemetry ticks per second')
+    parser.add_argument('--status-rate', type=float, default=1.0, help='heartbeat/status ticks per second')
+    parser.add_argument('--speed', type=float, default=1.0, help='simulated seconds per real second')
+    parser.add_argument('--target', default='127.0.0.1:14550', help='GCS MAVLink UDP host:port')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--radius', type=float, default=2000.0, help='fleet area radius in metres')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    host, _, port = args.target.rpartition(':')
+    simulator = FleetSimulator(args.vehicles, seed=args.seed, radius=args.radius)
+    counters: Dict[str, int] = {}
+    print(f"🛩️  {args.vehicles} vehicles at {args.rate:g} Hz -> {host}:{port} (seed {args.seed})")
+    started = time.time()
+    try:
+        asyncio.run(run(simulator, (host, int(port)), args.rate, args.status_rate, args.speed,
+                        args.duration, counters))
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.time() - started
+    print(f"📤 {counters.get('frames', 0)} frames in {counters.get('datagrams', 0)} datagrams "
+          f"({counters.get('frames', 0) / elapsed:,.0f} frames/s), {simulator.get_statistics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Delta-encoded telemetry stream with periodic keyframes
+Clients in delta mode get a full keyframe on connect and every few seconds,
+and only the changed fields in between
+"""
+import time
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_KEYFRAME_INTERVAL = 5.0
+_MISSING = object()
+
+
+class DeltaStream:
+    """Keyframe/delta encoder for one vehicle, shared by every delta-mode client
+
+    Each update bumps `seq`. A client that sees a gap in seq (for example
+    because a slow link dropped a delta) sends a resync request and gets
+    `keyframe_message()` for the current state. Clients that skip ticks on
+    purpose (rate control) get `since(base_seq)`: every field changed after
+    the seq they last saw, merged into one delta.
+    """
+
+    def __init__(self, vehicle_id: str, keyframe_interval: float = DEFAULT_KEYFRAME_INTERVAL):
+        self.vehicle_id = vehicle_id
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.state: Dict[str, Any] = {}
+        self.changed_at: Dict[str, int] = {}
+        self.keyframe_seq = 0
+        self.last_keyframe = 0.0
+
+        # Encoder counters
+        self.keyframes = 0
+        self.deltas = 0
+        self.fields_sent = 0
+        self.fields_total = 0
+
+    def update(self, telemetry: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+        """Advance the stream and return the keyframe or delta message for this tick"""
+        if now is None:
+            now = time.time()
+        self.seq += 1
+        self.fields_total += len(telemetry)
+
+        if not self.state or now - self.last_keyframe >= self.keyframe_interval:
+            self.state = dict(telemetry)
+            self.changed_at = dict.fromkeys(self.state, self.seq)
+            self.keyframe_seq = self.seq
+            self.last_keyframe = now
+            self.keyframes += 1
+            self.fields_sent += len(telemetry)
+            return self._message('keyframe', dict(self.state), now)
+
+        state = self.state
+        changed = {}
+        for key, value in telemetry.items():
+            if state.get(key, _MISSING) != value:
+                changed[key] = value
+        state.update(changed)
+        seq = self.seq
+        changed_at = self.changed_at
+        for key in changed:
+            changed_at[key] = seq
+        self.deltas += 1
+        self.fields_sent += len(changed)
+        return self._message('delta', changed, now)
+
+    def keyframe_message(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Full state at the current seq, for a client joining or resyncing"""
+        return self._message('keyframe', dict(self.state), now or time.time())
+
+    def since(self, base_seq: int, fields: Optional[Callable[[str], bool]] = None,
+              now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Merged delta from `base_seq` to the current seq, limited to `fields` if given
+
+        Returns a keyframe (of the selected fields) when the client has no
+        usable base, and None when nothing changed since `base_seq`.
+        """
+        if base_seq >= self.seq:
+            return None
+        now = now or time.time()
+        state = self.state
+        if base_seq < self.keyframe_seq:
+            data = {key: value for key, value in state.items() if fields is None or fields(key)}
+            message = self._message('keyframe', data, now)
+        else:
+            data = {key: state[key] for key, seq in self.changed_at.items()
+                    if seq > base_seq and (fields is None or fields(key))}
+            message = self._message('delta', data, now)
+            message['base_seq'] = base_seq
+        return message
+
+    def _message(self, frame: str, data: Dict[str, Any], now: float) -> Dict[str, Any]:
+        return {
+            'type': 'telemetry',
+            'vehicle_id': self.vehicle_id,
+            'frame': frame,
+            'seq': self.seq,
+            'data': data,
+            'timestamp': now
+        }
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Share of fields actually sent compared to full frames"""
+        return {
+            'seq': self.seq,
+            'keyframes': self.keyframes,
+            'deltas': self.deltas,
+            'field_ratio': self.fields_sent / self.fields_total if self.fields_total else 1.0
+        }
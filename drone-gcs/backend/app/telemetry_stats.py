@@ -0,0 +1,158 @@
+"""
+Incremental rolling telemetry statistics
+O(1) updates per sample into time-bucketed aggregates per field and window;
+queries combine a fixed number of buckets and never touch the history
+"""
+import math
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+# Rolling windows in seconds
+WINDOWS = {'1m': 60.0, '10m': 600.0, '1h': 3600.0}
+STAT_FIELDS = (
+    'alt', 'groundspeed', 'airspeed', 'climb',
+    'voltage_battery', 'current_battery', 'battery_remaining'
+)
+
+INF = float('inf')
+
+
+class WindowedAggregate:
+    """Count/sum/sum of squares/min/max of one field over a sliding time window
+
+    The window is split into `buckets` slots indexed by absolute bucket
+    number; a slot is reset when time moves past it, so expiry costs
+    nothing and the window is accurate to one bucket width.
+    """
+
+    __slots__ = ('window', 'buckets', 'width', 'ids', 'counts', 'sums', 'sumsqs', 'mins', 'maxs')
+
+    def __init__(self, window: float, buckets: int = 60):
+        self.window = window
+        self.buckets = buckets
+        self.width = window / buckets
+        self.ids = [-1] * buckets
+        self.counts = [0] * buckets
+        self.sums = [0.0] * buckets
+        self.sumsqs = [0.0] * buckets
+        self.mins = [INF] * buckets
+        self.maxs = [-INF] * buckets
+
+    def add(self, timestamp: float, value: float):
+        bucket = int(timestamp // self.width)
+        slot = bucket % self.buckets
+        if self.ids[slot] != bucket:
+            self.ids[slot] = bucket
+            self.counts[slot] = 1
+            self.sums[slot] = value
+            self.sumsqs[slot] = value * value
+            self.mins[slot] = value
+            self.maxs[slot] = value
+            return
+        self.counts[slot] += 1
+        self.sums[slot] += value
+        self.sumsqs[slot] += value * value
+        if value < self.mins[slot]:
+            self.mins[slot] = value
+        if value > self.maxs[slot]:
+            self.maxs[slot] = value
+
+    def query(self, now: float) -> Dict[str, Any]:
+        """Combine the buckets that are still inside the window"""
+        oldest = int(now // self.width) - self.buckets + 1
+        count = 0
+        total = 0.0
+        sumsq = 0.0
+        low = INF
+        high = -INF
+        for slot in range(self.buckets):
+            if self.ids[slot] >= oldest:
+                count += self.counts[slot]
+                total += self.sums[slot]
+                sumsq += self.sumsqs[slot]
+                if self.mins[slot] < low:
+                    low = self.mins[slot]
+                if self.maxs[slot] > high:
+                    high = self.maxs[slot]
+        return summarize(count, total, sumsq, low, high)
+
+
+def summarize(count: int, total: float, sumsq: float, low: float, high: float) -> Dict[str, Any]:
+    """Aggregate dict shared by the incremental and batch paths"""
+    if not count:
+        return {'count': 0, 'mean': None, 'min': None, 'max': None, 'std': None}
+    mean = total / count
+    variance = max(0.0, sumsq / count - mean * mean)
+    return {'count': count, 'mean': mean, 'min': low, 'max': high, 'std': math.sqrt(variance)}
+
+
+class TelemetryStatistics:
+    """Rolling statistics per field and per window for one vehicle"""
+
+    def __init__(self, fields: Sequence[str] = STAT_FIELDS, windows: Optional[Dict[str, float]] = None):
+        self.fields = tuple(fields)
+        self.windows = dict(windows or WINDOWS)
+        self.aggregates = {
+            name: {field: WindowedAggregate(seconds) for field in self.fields}
+            for name, seconds in self.windows.items()
+        }
+        self._updates = tuple(
+            (field, tuple(self.aggregates[name][field] for name in self.windows))
+            for field in self.fields
+        )
+        self.last: Dict[str, float] = {}
+        self.count = 0
+        self.last_timestamp = 0.0
+
+    def add(self, timestamp: float, sample: Dict[str, Any]):
+        """Fold one sample into every window: O(fields x windows)"""
+        get = sample.get
+        for field, aggregates in self._updates:
+            value = get(field)
+            if value is None or value.__class__ is str or value != value:
+                continue
+            self.last[field] = value
+            for aggregate in aggregates:
+                aggregate.add(timestamp, value)
+        self.count += 1
+        self.last_timestamp = timestamp
+
+    def query(self, window: str = '1h', now: Optional[float] = None,
+              fields: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Per-field count/mean/min/max/std/last for a named window"""
+        if now is None:
+            now = self.last_timestamp
+        aggregates = self.aggregates[window]
+        result = {}
+        for field in fields or self.fields:
+            stats = aggregates[field].query(now)
+            stats['last'] = self.last.get(field)
+            result[field] = stats
+        return result
+
+
+def batch_statistics(columns: Dict[str, Any], fields: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Vectorized statistics over stored columns (from TelemetryRing.numpy_columns)
+
+    Used for arbitrary time ranges that do not match a rolling window.
+    """
+    import numpy as np
+
+    result = {}
+    for field in fields or [name for name in columns if name != 'timestamp']:
+        values = columns.get(field)
+        if values is None:
+            continue
+        values = values[~np.isnan(values)].astype(np.float64)
+        if not values.size:
+            result[field] = summarize(0, 0.0, 0.0, INF, -INF)
+            result[field]['last'] = None
+            continue
+        result[field] = {
+            'count': int(values.size),
+            'mean': float(values.mean()),
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'std': float(values.std()),
+            'last': float(values[-1])
+        }
+    return result
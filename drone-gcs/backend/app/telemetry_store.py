@@ -0,0 +1,208 @@
+"""
+Columnar ring-buffer telemetry store
+One array column per numeric field plus a timestamp column, grown on demand
+up to a fixed capacity: amortized O(1) append, no per-sample dicts, O(log n)
+time-range lookup
+"""
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Numeric telemetry fields kept in history: lat/lon need float64, the rest fit float32
+DOUBLE_FIELDS = ('lat', 'lon')
+FLOAT_FIELDS = (
+    'alt', 'relative_alt',
+    'roll', 'pitch', 'yaw', 'heading',
+    'groundspeed', 'airspeed', 'climb', 'vx', 'vy', 'vz',
+    'battery_remaining', 'voltage_battery', 'current_battery',
+    'satellites', 'fix_type', 'eph', 'epv', 'rssi', 'armed'
+)
+HISTORY_FIELDS = DOUBLE_FIELDS + FLOAT_FIELDS
+
+NAN = float('nan')
+
+
+class TelemetryRing:
+    """Fixed-capacity ring of telemetry samples stored column by column
+
+    Timestamps are kept non-decreasing (a sample older than the newest one
+    is clamped to it) so time ranges can be found by binary search. Columns
+    start at `initial` slots and double until they reach `capacity`; the
+    ring only wraps once it is fully allocated.
+    """
+
+    def __init__(self, capacity: int = 36000, fields: Sequence[str] = HISTORY_FIELDS, initial: int = 600):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.allocated = min(initial, capacity)
+        self.timestamps = array('d', bytes(8 * self.allocated))
+        self.columns: Dict[str, array] = {}
+        for name in self.fields:
+            typecode = 'd' if name in DOUBLE_FIELDS else 'f'
+            self.columns[name] = array(typecode, bytes(array(typecode).itemsize * self.allocated))
+        self._column_items = tuple(self.columns.items())
+        self.head = 0
+        self.size = 0
+        self.appended = 0
+
+    def append(self, timestamp: float, sample: Dict[str, Any]):
+        """Write one sample into the next slot, overwriting the oldest when full"""
+        idx = self.head
+        if idx == self.allocated and idx < self.capacity:
+            self._grow()
+        if self.size and timestamp < self.last_timestamp:
+            timestamp = self.last_timestamp
+        self.timestamps[idx] = timestamp
+
+        get = sample.get
+        for name, column in self._column_items:
+            value = get(name)
+            if value is None or value.__class__ is str:
+                column[idx] = NAN
+            else:
+                column[idx] = value
+
+        self.head = idx + 1 if idx + 1 < self.capacity else 0
+        if self.size < self.capacity:
+            self.size += 1
+        self.appended += 1
+
+    def _grow(self):
+        """Double the allocated slots (up to capacity)
+
+        Columns are copied rather than resized in place, so NumPy views
+        handed out by numpy_columns() stay valid.
+        """
+        extra = min(self.allocated, self.capacity - self.allocated)
+        self.timestamps = self._extended(self.timestamps, extra)
+        for name, column in self._column_items:
+            self.columns[name] = self._extended(column, extra)
+        self._column_items = tuple(self.columns.items())
+        self.allocated += extra
+
+    @staticmethod
+    def _extended(column: array, extra: int) -> array:
+        grown = array(column.typecode, column)
+        grown.frombytes(bytes(column.itemsize * extra))
+        return grown
+
+    @property
+    def last_timestamp(self) -> float:
+        return self.timestamps[self.head - 1]
+
+    @property
+    def first_timestamp(self) -> float:
+        return self.timestamps[self._physical(0)]
+
+    def _physical(self, i: int) -> int:
+        """Map a logical index (0 = oldest) to a slot"""
+        start = self.head - self.size
+        return (start + i) % self.capacity
+
+    def _bisect_left(self, timestamp: float) -> int:
+        """First logical index whose timestamp is >= `timestamp`"""
+        timestamps = self.timestamps
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamps[self._physical(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _bisect_right(self, timestamp: float) -> int:
+        """First logical index whose timestamp is > `timestamp`"""
+        timestamps = self.timestamps
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamps[self._physical(mid)] <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def index_range(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[int, int]:
+        """Logical [lo, hi) covering samples with start <= timestamp <= end"""
+        lo = 0 if start is None else self._bisect_left(start)
+        hi = self.size if end is None else self._bisect_right(end)
+        return lo, max(lo, hi)
+
+    def _segments(self, lo: int, hi: int) -> List[Tuple[int, int]]:
+        """Physical slices for a logical range: one, or two when it wraps"""
+        if lo >= hi:
+            return []
+        first = self._physical(lo)
+        last = first + (hi - lo)
+        if last <= self.capacity:
+            return [(first, last)]
+        return [(first, self.capacity), (0, last - self.capacity)]
+
+    def _slice(self, column: array, segments: List[Tuple[int, int]]) -> array:
+        if len(segments) == 1:
+            a, b = segments[0]
+            return column[a:b]
+        result = array(column.typecode)
+        for a, b in segments:
+            result.extend(column[a:b])
+        return result
+
+    def column(self, name: str, start: Optional[float] = None, end: Optional[float] = None) -> array:
+        """Copy of one column (or 'timestamp') for a time range"""
+        source = self.timestamps if name == 'timestamp' else self.columns[name]
+        return self._slice(source, self._segments(*self.index_range(start, end)))
+
+    def columns_for(self, start: Optional[float] = None, end: Optional[float] = None,
+                    fields: Optional[Iterable[str]] = None) -> Dict[str, array]:
+        """Columnar slice of a time range: {'timestamp': ..., field: ...}"""
+        segments = self._segments(*self.index_range(start, end))
+        result = {'timestamp': self._slice(self.timestamps, segments)}
+        for name in fields or self.fields:
+            if name in self.columns:
+                result[name] = self._slice(self.columns[name], segments)
+        return result
+
+    def numpy_columns(self, start: Optional[float] = None, end: Optional[float] = None,
+                      fields: Optional[Iterable[str]] = None):
+        """Same as columns_for() but as NumPy arrays (zero-copy when the range does not wrap)"""
+        import numpy as np
+
+        segments = self._segments(*self.index_range(start, end))
+        names = ['timestamp'] + [name for name in (fields or self.fields) if name in self.columns]
+        result = {}
+        for name in names:
+            source = np.frombuffer(self.timestamps if name == 'timestamp' else self.columns[name],
+                                   dtype=np.float64 if name == 'timestamp' or name in DOUBLE_FIELDS else np.float32)
+            parts = [source[a:b] for a, b in segments]
+            if not parts:
+                result[name] = source[:0]
+            elif len(parts) == 1:
+                result[name] = parts[0]
+            else:
+                result[name] = np.concatenate(parts)
+        return result
+
+    def rows(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Samples of a time range as dicts (for JSON consumers of the old list API)"""
+        data = self.columns_for(start, end)
+        names = list(data)
+        return [
+            {name: (None if value != value else value) for name, value in zip(names, values)}
+            for values in zip(*data.values())
+        ]
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Most recent sample as a dict"""
+        if not self.size:
+            return None
+        idx = self.head - 1
+        sample = {name: column[idx] for name, column in self._column_items}
+        sample['timestamp'] = self.timestamps[idx]
+        return sample
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the allocated columns"""
+        return (self.timestamps.itemsize + sum(c.itemsize for c in self.columns.values())) * self.allocated
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,466 @@
+"""
+Encode-once video distribution for WebRTC viewers
+One render task per source fills a frame ring; every viewer gets its own
+relay track over the shared ring, or over the packet cache of one encoder
+shared by all viewers of that source at the same codec and bitrate
+"""
+import asyncio
+import fractions
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import av
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+logger = logging.getLogger(__name__)
+
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+
+# Codecs whose pre-encoded packets aiortc can packetize (RTCRtpSender -> encoder.pack)
+SHARED_CODECS = ('VP8', 'H264')
+# Viewers are grouped onto these encoder bitrates so similar links share one encode
+BITRATE_TIERS = (300_000, 600_000, 1_000_000, 2_000_000, 4_000_000)
+DEFAULT_BITRATE = 1_000_000
+KEYFRAME_INTERVAL = 2.0
+# Smoothing of the per-frame encode time behind an encoder's reported load
+ENCODE_TIME_ALPHA = 0.05
+# Video profiles as (scale, frame stride): degraded viewers get half the size at half the rate
+PROFILES = {'full': (1.0, 1), 'degraded': (0.5, 2)}
+
+
+def bitrate_tier(bitrate: Optional[float]) -> int:
+    """Highest tier not above the requested bitrate (the lowest tier at minimum)"""
+    if not bitrate:
+        return DEFAULT_BITRATE
+    fitting = [tier for tier in BITRATE_TIERS if tier <= bitrate]
+    return fitting[-1] if fitting else BITRATE_TIERS[0]
+
+
+def scaled_size(width: int, height: int, scale: float) -> Tuple[int, int]:
+    """Frame size at `scale`, rounded down to even numbers for 4:2:0"""
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def copy_frame(frame: av.VideoFrame) -> av.VideoFrame:
+    """Plane-by-plane copy into a new frame of the same size and format"""
+    copy = av.VideoFrame(frame.width, frame.height, frame.format.name)
+    for source, target in zip(frame.planes, copy.planes):
+        target.update(source)
+    return copy
+
+
+class FrameRing:
+    """Fixed-size ring of the latest items (frames or packets) with a sequence number
+
+    Writers never block; readers await the next sequence number and get the
+    stored object itself, so any number of readers cost no copies.
+    """
+
+    def __init__(self, size: int = 4):
+        self.size = size
+        self.slots: List[Any] = [None] * size
+        self.seq = 0
+        self._next: Optional[asyncio.Future] = None
+
+    def put(self, item: Any) -> int:
+        self.seq += 1
+        self.slots[self.seq % self.size] = item
+        if self._next is not None and not self._next.done():
+            self._next.set_result(self.seq)
+        self._next = None
+        return self.seq
+
+    def get(self, seq: int) -> Any:
+        """The item at `seq`, or None if it has not arrived or was overwritten"""
+        if seq <= 0 or seq > self.seq or seq <= self.seq - self.size:
+            return None
+        return self.slots[seq % self.size]
+
+    def latest(self) -> Tuple[int, Any]:
+        return self.seq, self.get(self.seq)
+
+    async def wait(self, after: int) -> Tuple[int, Any]:
+        """The newest item once the sequence is past `after` (older ones are skipped)"""
+        while self.seq <= after:
+            if self._next is None:
+                self._next = asyncio.get_event_loop().create_future()
+            await asyncio.shield(self._next)
+        return self.latest()
+
+
+class VideoSource:
+    """One render (or capture) task per camera writing into a frame ring
+
+    The task runs only while something is subscribed, whatever the number
+    of viewers. `render()` returns an av.VideoFrame; the source paces it
+    and stamps its pts on the 90 kHz RTP clock.
+    """
+
+    def __init__(self, name: str, render: Callable[[], av.VideoFrame], fps: int = 30, ring_size: int = 4):
+        self.name = name
+        self.render = render
+        self.fps = fps
+        self.ring = FrameRing(ring_size)
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        # Wall-clock time of pts 0 for the current run
+        self.epoch = 0.0
+
+        # Render counters
+        self.frames = 0
+        self.dropped = 0
+        self.render_time = 0.0
+
+    def acquire(self):
+        self.subscribers += 1
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+            logger.info(f"🎥 Video source started: {self.name}")
+
+    def release(self):
+        self.subscribers = max(0, self.subscribers - 1)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+            logger.info(f"🎥 Video source stopped: {self.name}")
+
+    async def _run(self):
+        """Render on the ticks of a monotonic clock; pts count 90 kHz ticks from the start
+
+        A late frame drops the ticks it missed instead of bursting to catch
+        up, so the pts spacing always matches wall-clock time.
+        """
+        start = time.monotonic()
+        self.epoch = time.time()
+        tick = 0
+        while True:
+            started = time.perf_counter()
+            frame = self.render()
+            frame.pts = tick * VIDEO_CLOCK_RATE // self.fps
+            frame.time_base = VIDEO_TIME_BASE
+            self.ring.put(frame)
+            self.frames += 1
+            self.render_time += time.perf_counter() - started
+            tick += 1
+            delay = start + tick / self.fps - time.monotonic()
+            if delay < 0:
+                missed = int(-delay * self.fps)
+                self.dropped += missed
+                tick += missed
+                delay = max(0.0, start + tick / self.fps - time.monotonic())
+            await asyncio.sleep(delay)
+
+    def get_statistics(self) -> Dict:
+        """Get render counters"""
+        stats = {
+            'fps': self.fps,
+            'subscribers': self.subscribers,
+            'running': self.task is not None,
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'render_ms_avg': round(self.render_time * 1000 / self.frames, 3) if self.frames else None
+        }
+        if hasattr(self.render, 'get_statistics'):
+            stats['renderer'] = self.render.get_statistics()
+        return stats
+
+
+class EncodedStream:
+    """One encoder for every viewer of a source at a codec, bitrate tier and profile
+
+    Encoded packets go into a cache ring that each viewer's packet relay
+    reads in order. Keyframes come every `keyframe_interval` seconds and
+    whenever a viewer joins or falls too far behind.
+    """
+
+    def __init__(self, source: VideoSource, codec: str, bitrate: int, profile: str = 'full',
+                 keyframe_interval: float = KEYFRAME_INTERVAL, cache_size: int = 64):
+        self.source = source
+        self.codec_name = codec
+        self.bitrate = bitrate
+        self.profile = profile
+        self.scale, self.stride = PROFILES[profile]
+        self.keyframe_interval = keyframe_interval
+        self.packets = FrameRing(cache_size)
+        self.keyframe_seq = 0
+        self.force_keyframe = False
+        self.last_keyframe = 0.0
+        self.context: Optional[av.CodecContext] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+        # Encoder counters
+        self.frames = 0
+        self.keyframes = 0
+        self.bytes = 0
+        self.encode_time = 0.0
+        self.frame_time: Optional[float] = None
+        self.started = 0.0
+
+    @property
+    def key(self) -> Tuple[str, str, int, str]:
+        return self.source.name, self.codec_name, self.bitrate, self.profile
+
+    @property
+    def fps(self) -> float:
+        return self.source.fps / self.stride
+
+    @property
+    def load(self) -> Optional[float]:
+        """Recent encoder time per second of video (CPU cores), after a second of warm-up"""
+        if self.frame_time is None or self.frames < self.fps:
+            return None
+        return self.frame_time * self.fps
+
+    def acquire(self):
+        self.subscribers += 1
+        if self.task is None:
+            self.started = time.monotonic()
+            self.task = asyncio.ensure_future(self._run())
+
+    def release(self):
+        self.subscribers = max(0, self.subscribers - 1)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def request_keyframe(self):
+        self.force_keyframe = True
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        self.source.acquire()
+        try:
+            seq = self.source.ring.seq
+            received = 0
+            while True:
+                seq, frame = await self.source.ring.wait(seq)
+                received += 1
+                if received % self.stride:
+                    continue
+                for packet in await loop.run_in_executor(None, self._encode, frame):
+                    packet_seq = self.packets.put(packet)
+                    if packet.is_keyframe:
+                        self.keyframe_seq = packet_seq
+        finally:
+            self.source.release()
+            self.context = None
+
+    def _open(self, frame: av.VideoFrame) -> av.CodecContext:
+        """Encoder settings mirror aiortc's own real-time VP8/H264 encoders"""
+        if self.codec_name == 'H264':
+            context = av.CodecContext.create('libx264', 'w')
+            context.options = {'level': '31', 'tune': 'zerolatency'}
+            context.profile = 'Baseline'
+        else:
+            context = av.CodecContext.create('libvpx', 'w')
+            context.qmin = 2
+            context.qmax = 56
+            context.options = {
+                'bufsize': str(self.bitrate),
+                'cpu-used': '-6',
+                'deadline': 'realtime',
+                'lag-in-frames': '0',
+                'minrate': str(self.bitrate),
+                'maxrate': str(self.bitrate),
+                'static-thresh': '1',
+                'undershoot-pct': '100',
+            }
+        context.width = frame.width
+        context.height = frame.height
+        context.bit_rate = self.bitrate
+        context.pix_fmt = 'yuv420p'
+        context.framerate = fractions.Fraction(self.source.fps, self.stride)
+        context.time_base = VIDEO_TIME_BASE
+        # Keyframes are forced on our own schedule
+        context.gop_size = 3000
+        return context
+
+    def _encode(self, frame: av.VideoFrame) -> List[av.Packet]:
+        """Runs in the executor: one encode serves every subscribed viewer"""
+        started = time.perf_counter()
+        context = self.context
+        # Encode a converted copy: relay viewers hold the shared frame
+        shared = frame
+        if self.scale != 1.0:
+            width, height = scaled_size(frame.width, frame.height, self.scale)
+            frame = frame.reformat(width=width, height=height, format='yuv420p')
+        elif frame.format.name != 'yuv420p':
+            frame = frame.reformat(format='yuv420p')
+        else:
+            frame = copy_frame(frame)
+        if context is None or frame.width != context.width or frame.height != context.height:
+            context = self.context = self._open(frame)
+        keyframe = (self.force_keyframe or self.frames == 0
+                    or time.monotonic() - self.last_keyframe >= self.keyframe_interval)
+        frame.pts = shared.pts
+        frame.time_base = shared.time_base
+        frame.pict_type = av.video.frame.PictureType.I if keyframe else av.video.frame.PictureType.NONE
+        packets = context.encode(frame)
+        for packet in packets:
+            packet.time_base = VIDEO_TIME_BASE
+            self.bytes += packet.size
+            if packet.is_keyframe:
+                self.keyframes += 1
+                self.last_keyframe = time.monotonic()
+        if keyframe:
+            self.force_keyframe = False
+        elapsed = time.perf_counter() - started
+        self.frames += 1
+        self.encode_time += elapsed
+        self.frame_time = elapsed if self.frame_time is None else \
+            self.frame_time + ENCODE_TIME_ALPHA * (elapsed - self.frame_time)
+        return packets
+
+    def get_statistics(self) -> Dict:
+        """Get encoder counters"""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        return {
+            'source': self.source.name,
+            'codec': self.codec_name,
+            'bitrate': self.bitrate,
+            'profile': self.profile,
+            'subscribers': self.subscribers,
+            'frames': self.frames,
+            'keyframes': self.keyframes,
+            'kbps': round(self.bytes * 8 / elapsed / 1000, 1) if elapsed else None,
+            'encode_ms_avg': round(self.encode_time * 1000 / self.frames, 3) if self.frames else None,
+            'load': round(self.load, 4) if self.load is not None else None
+        }
+
+
+class FrameRelayTrack(MediaStreamTrack):
+    """Per-viewer track over a source's frame ring: always the latest frame, never a copy
+
+    The viewer's RTCRtpSender still encodes; used when no shared codec was
+    negotiated. A degraded profile hands over every `stride`-th frame,
+    scaled down, so that encoder has less to do.
+    """
+
+    kind = 'video'
+
+    def __init__(self, source: VideoSource, profile: str = 'full'):
+        super().__init__()
+        self.source = source
+        self.profile = profile
+        self.scale, self.stride = PROFILES[profile]
+        self.seq = source.ring.seq
+        self.skipped = 0
+        source.acquire()
+
+    async def recv(self) -> av.VideoFrame:
+        if self.readyState != 'live':
+            raise MediaStreamError
+        seq, frame = await self.source.ring.wait(self.seq + self.stride - 1)
+        self.skipped += max(0, seq - self.seq - self.stride)
+        self.seq = seq
+        if self.scale != 1.0:
+            width, height = scaled_size(frame.width, frame.height, self.scale)
+            frame = frame.reformat(width=width, height=height)
+        return frame
+
+    def stop(self):
+        if self.readyState == 'live':
+            self.source.release()
+        super().stop()
+
+
+class PacketRelayTrack(MediaStreamTrack):
+    """Per-viewer track over a shared encoder's packet cache
+
+    aiortc packetizes the cached av.Packet for this viewer's RTP session
+    without encoding again. A viewer starts on a fresh keyframe and
+    resynchronizes on the next one if it falls out of the cache.
+    """
+
+    kind = 'video'
+
+    def __init__(self, stream: EncodedStream):
+        super().__init__()
+        self.stream = stream
+        self.next_seq: Optional[int] = None
+        self.resyncs = 0
+        stream.acquire()
+
+    async def _resync(self):
+        stream = self.stream
+        mark = stream.packets.seq
+        stream.request_keyframe()
+        while stream.keyframe_seq <= mark:
+            await stream.packets.wait(stream.packets.seq)
+        self.next_seq = stream.keyframe_seq
+
+    async def recv(self) -> av.Packet:
+        packets = self.stream.packets
+        while True:
+            if self.readyState != 'live':
+                raise MediaStreamError
+            if self.next_seq is None:
+                await self._resync()
+            packet = packets.get(self.next_seq)
+            if packet is not None:
+                self.next_seq += 1
+                return packet
+            if self.next_seq > packets.seq:
+                await packets.wait(self.next_seq - 1)
+            else:
+                # Fell out of the cache: skip to the next keyframe
+                self.resyncs += 1
+                self.next_seq = None
+
+    def stop(self):
+        if self.readyState == 'live':
+            self.stream.release()
+        super().stop()
+
+
+class VideoDistributor:
+    """Sources and the shared encoders that fan them out to WebRTC viewers"""
+
+    def __init__(self):
+        self.sources: Dict[str, VideoSource] = {}
+        self.streams: Dict[Tuple[str, str, int, str], EncodedStream] = {}
+
+    def add_source(self, source: VideoSource) -> VideoSource:
+        self.sources[source.name] = source
+        return source
+
+    def _source(self, name: str) -> VideoSource:
+        source = self.sources.get(name)
+        if source is None:
+            raise KeyError(f"unknown video source {name}")
+        return source
+
+    def frame_track(self, name: str, profile: str = 'full') -> FrameRelayTrack:
+        return FrameRelayTrack(self._source(name), profile)
+
+    def stream(self, name: str, codec: str, bitrate: Optional[float] = None,
+               profile: str = 'full') -> EncodedStream:
+        """The shared encode for this source, codec, bitrate tier and profile"""
+        source = self._source(name)
+        key = (name, codec, bitrate_tier(bitrate), profile)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = EncodedStream(source, codec, key[2], profile)
+        return stream
+
+    def packet_track(self, name: str, codec: str, bitrate: Optional[float] = None,
+                     profile: str = 'full') -> PacketRelayTrack:
+        """Relay of the shared encode for this source, codec, bitrate tier and profile"""
+        return PacketRelayTrack(self.stream(name, codec, bitrate, profile))
+
+    def prune(self) -> int:
+        """Forget encoders nobody has subscribed to since they stopped"""
+        idle = [key for key, stream in self.streams.items() if not stream.subscribers and stream.task is None]
+        for key in idle:
+            del self.streams[key]
+        return len(idle)
+
+    def get_statistics(self) -> Dict:
+        """Get per-source and per-encoder counters"""
+        return {
+            'sources': {name: source.get_statistics() for name, source in self.sources.items()},
+            'encoders': [stream.get_statistics() for stream in self.streams.values()]
+        }
@@ -0,0 +1,279 @@
+"""
+Zero-transcode video recording
+Taps the packet cache of a shared WebRTC encoder and muxes the packets as
+they are into rolling MKV/MP4 segments on a background thread, with an
+index of each segment's wall-clock span for lining video up with the
+telemetry history
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import av
+
+from video import VIDEO_TIME_BASE, EncodedStream
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'index.jsonl'
+# Container -> (FFmpeg muxer, codecs it can hold without re-encoding)
+RECORD_FORMATS = {
+    'mkv': ('matroska', ('VP8', 'H264')),
+    'mp4': ('mp4', ('H264',)),
+}
+STREAM_CODECS = {'VP8': 'vp8', 'H264': 'h264'}
+
+
+class VideoIndex:
+    """Finished segments by wall-clock span, kept in memory and appended to index.jsonl"""
+
+    def __init__(self, directory: str = 'video_segments'):
+        self.directory = directory
+        self.entries: List[Dict[str, Any]] = []
+        self._load()
+
+    def _load(self):
+        path = os.path.join(self.directory, INDEX_NAME)
+        if not os.path.isfile(path):
+            return
+        with open(path) as handle:
+            for line in handle:
+                try:
+                    self.entries.append(json.loads(line))
+                except ValueError:
+                    break  # torn tail from a crash
+        self.entries.sort(key=lambda entry: entry['start'])
+
+    def add(self, entry: Dict[str, Any]):
+        """Record a closed segment (called from the writer thread)"""
+        with open(os.path.join(self.directory, INDEX_NAME), 'a') as handle:
+            handle.write(json.dumps(entry) + '\n')
+        self.entries.append(entry)
+
+    def segments(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Segments overlapping [start, end]"""
+        return [entry for entry in list(self.entries)
+                if (start is None or entry['end'] >= start) and (end is None or entry['start'] <= end)]
+
+    def locate(self, timestamp: float) -> Optional[Dict[str, Any]]:
+        """The segment holding `timestamp` and the seek offset into it, in seconds"""
+        for entry in self.segments(timestamp, timestamp):
+            return {**entry, 'offset': round(timestamp - entry['start'], 3)}
+        return None
+
+    def path(self, name: str) -> Optional[str]:
+        """File path of an indexed segment (only indexed names resolve)"""
+        for entry in list(self.entries):
+            if entry['name'] == name:
+                return os.path.join(self.directory, name)
+        return None
+
+
+class VideoRecorder:
+    """Records one shared encode into rolling segments
+
+    The tap is one more reader of the encoder's packet cache, like a
+    viewer's relay track: the encoder never waits on it and nothing is
+    encoded twice. Packets go to the writer thread through a bounded
+    queue; if the disk falls behind, packets are dropped and recording
+    resumes at the next keyframe. Segments start on a keyframe once
+    `segment_seconds` have passed. MKV (the default) stays playable up to
+    the last written cluster if the process dies; MP4 needs its index
+    written on close and only carries H264.
+    """
+
+    def __init__(self, stream: EncodedStream, index: VideoIndex, container: str = 'mkv',
+                 segment_seconds: float = 60.0, max_queue: int = 300):
+        if container not in RECORD_FORMATS:
+            raise ValueError(f"unknown container {container}")
+        if stream.codec_name not in RECORD_FORMATS[container][1]:
+            raise ValueError(f"{container} cannot hold {stream.codec_name}")
+        self.stream = stream
+        self.index = index
+        self.directory = index.directory
+        self.container_name = container
+        self.segment_seconds = segment_seconds
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Writer thread state
+        self._output = None
+        self._output_stream = None
+        self._segment: Optional[Dict[str, Any]] = None
+        self._first_pts = 0
+        self._last_pts = -1
+
+        # Recorder counters
+        self.packets = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.segments = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the writer thread and the packet tap (call from the event loop)"""
+        if self._task is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='video-recorder', daemon=True)
+        self._thread.start()
+        self.stream.acquire()
+        self._task = asyncio.ensure_future(self._tap())
+        logger.info(f"🎬 Recording {self.stream.source.name} ({self.stream.codec_name}) "
+                    f"to {os.path.abspath(self.directory)}")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop tapping, then finish and index the open segment"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self.stream.release()
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    async def _next_keyframe(self, request: bool = False) -> int:
+        """Sequence number of the next keyframe in the cache
+
+        Only the first one is requested; after a gap the recorder waits for
+        the encoder's regular keyframe instead of forcing one on the viewers.
+        """
+        stream = self.stream
+        mark = stream.packets.seq
+        if request:
+            stream.request_keyframe()
+        while stream.keyframe_seq <= mark:
+            await stream.packets.wait(stream.packets.seq)
+        return stream.keyframe_seq
+
+    async def _tap(self):
+        stream = self.stream
+        packets = stream.packets
+        next_seq = await self._next_keyframe(request=True)
+        while True:
+            packet = packets.get(next_seq)
+            if packet is None:
+                if next_seq > packets.seq:
+                    await packets.wait(next_seq - 1)
+                else:
+                    # Fell out of the cache
+                    self.dropped += 1
+                    next_seq = await self._next_keyframe()
+                continue
+            next_seq += 1
+            context = stream.context
+            size = (context.width, context.height) if context is not None else (0, 0)
+            try:
+                self._queue.put_nowait((packet, stream.source.epoch, size))
+            except queue.Full:
+                self.dropped += 1
+                next_seq = await self._next_keyframe()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._close_segment()
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                logger.error(f"❌ Video recording error: {e}")
+                self.errors += 1
+                self._close_segment()
+
+    def _write(self, packet: av.Packet, epoch: float, size: Tuple[int, int]):
+        pts = packet.pts
+        wall = epoch + float(pts * VIDEO_TIME_BASE)
+        segment = self._segment
+        if segment is not None and (
+                pts <= self._last_pts or size != (segment['width'], segment['height'])
+                or (packet.is_keyframe and wall - segment['start'] >= self.segment_seconds)):
+            # Due for rotation, or the source restarted or changed size
+            self._close_segment()
+            segment = None
+        if segment is None:
+            if not packet.is_keyframe:
+                self.skipped += 1
+                return
+            segment = self._open_segment(wall, size)
+            self._first_pts = pts
+
+        data = bytes(packet)
+        # A copy: the cached packet is shared with live viewers
+        copy = av.Packet(data)
+        copy.pts = copy.dts = pts - self._first_pts
+        copy.time_base = VIDEO_TIME_BASE
+        copy.is_keyframe = packet.is_keyframe
+        copy.stream = self._output_stream
+        self._output.mux(copy)
+        self._last_pts = pts
+
+        segment['end'] = wall + 1.0 / self.stream.source.fps
+        segment['frames'] += 1
+        segment['bytes'] += len(data)
+        self.packets += 1
+        self.bytes_written += len(data)
+
+    def _open_segment(self, wall: float, size: Tuple[int, int]) -> Dict[str, Any]:
+        name = f"video-{int(wall * 1000):013d}-{self.segments:04d}.{self.container_name}"
+        output = av.open(os.path.join(self.directory, name), 'w', format=RECORD_FORMATS[self.container_name][0])
+        output_stream = output.add_stream(STREAM_CODECS[self.stream.codec_name], rate=self.stream.source.fps)
+        output_stream.width, output_stream.height = size
+        output_stream.time_base = VIDEO_TIME_BASE
+        self._output = output
+        self._output_stream = output_stream
+        self._segment = {
+            'name': name,
+            'source': self.stream.source.name,
+            'codec': self.stream.codec_name,
+            'width': size[0],
+            'height': size[1],
+            'start': wall,
+            'end': wall,
+            'frames': 0,
+            'bytes': 0
+        }
+        self.segments += 1
+        return self._segment
+
+    def _close_segment(self):
+        output, segment = self._output, self._segment
+        self._output = self._output_stream = self._segment = None
+        self._last_pts = -1
+        if output is None:
+            return
+        try:
+            output.close()
+        except Exception as e:
+            logger.error(f"❌ Video segment close error: {e}")
+            self.errors += 1
+        if segment['frames']:
+            self.index.add(segment)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get recorder counters"""
+        segment = self._segment
+        return {
+            'recording': self._task is not None,
+            'directory': self.directory,
+            'container': self.container_name,
+            'codec': self.stream.codec_name,
+            'bitrate': self.stream.bitrate,
+            'segment_seconds': self.segment_seconds,
+            'current': dict(segment) if segment else None,
+            'packets': self.packets,
+            'bytes_written': self.bytes_written,
+            'queued': self._queue.qsize(),
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'segments': self.segments,
+            'errors': self.errors
+        }
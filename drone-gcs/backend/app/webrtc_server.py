@@ -5,45 +5,196 @@ AirCast-style video transport
 import asyncio
 import json
 import logging
-from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
-from aiortc.contrib.media import MediaBlackhole, MediaPlayer, MediaRecorder
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+from aiortc import RTCPeerConnection, RTCRtpSender, RTCSessionDescription
 from av import VideoFrame
 import cv2
 import numpy as np
 import time
+from peer_governor import PeerGovernor
+from video import SHARED_CODECS, VideoDistributor, VideoSource, bitrate_tier
 
 logger = logging.getLogger(__name__)
 
-class WebRTCVideoStream(VideoStreamTrack):
-    """Custom video stream track for drone camera simulation"""
+RTPMAP = re.compile(r"^a=rtpmap:\d+ ([\w-]+)/90000", re.MULTILINE)
+
+def offered_codecs(sdp: str) -> List[str]:
+    """Video codec names in the remote offer, in its order of preference"""
+    names = []
+    for name in RTPMAP.findall(sdp):
+        if name.upper() not in names:
+            names.append(name.upper())
+    return names
+
+def shared_codec(sdp: str) -> Optional[str]:
+    """First offered codec we can encode once and relay as packets to every viewer"""
+    for name in offered_codecs(sdp):
+        if name in SHARED_CODECS:
+            return name
+    return None
+
+def negotiated_codec(sdp: str) -> Optional[str]:
+    """Video codec an answer settled on (its first video payload type)"""
+    video = sdp.find("m=video")
+    if video < 0:
+        return None
+    codecs = offered_codecs(sdp[video:])
+    return codecs[0] if codecs else None
+
+Rect = Tuple[int, int, int, int]
+
+class GlyphCache:
+    """Characters rasterized once per font and blitted as tiles instead of cv2.putText"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, scale: float, thickness: int = 1, color=(255, 255, 255),
+                 font: int = cv2.FONT_HERSHEY_SIMPLEX):
+        self.scale = scale
+        self.thickness = thickness
+        self.color = color
+        self.font = font
+        (_, ascent), descent = cv2.getTextSize("Ag", font, scale, thickness)
+        self.ascent = ascent + thickness
+        self.height = self.ascent + descent + thickness
+        self.glyphs: Dict[str, np.ndarray] = {}
+    
+    def glyph(self, char: str) -> np.ndarray:
+        tile = self.glyphs.get(char)
+        if tile is None:
+            (width, _), _ = cv2.getTextSize(char, self.font, self.scale, self.thickness)
+            tile = np.zeros((self.height, width, 3), dtype=np.uint8)
+            cv2.putText(tile, char, (0, self.ascent), self.font, self.scale, self.color, self.thickness)
+            self.glyphs[char] = tile
+        return tile
+    
+    def draw(self, canvas: np.ndarray, text: str, x: int, baseline: int) -> Rect:
+        """Blit `text` with its baseline at (x, baseline); returns the touched rect"""
+        if not text:
+            return x, baseline, x, baseline
+        strip = np.concatenate([self.glyph(char) for char in text], axis=1)
+        top = baseline - self.ascent
+        y0, y1 = max(0, top), min(canvas.shape[0], top + self.height)
+        x0, x1 = max(0, x), min(canvas.shape[1], x + strip.shape[1])
+        if y1 <= y0 or x1 <= x0:
+            return x0, y0, x0, y0
+        region = canvas[y0:y1, x0:x1]
+        np.maximum(region, strip[y0 - top:y1 - top, x0 - x:x1 - x], out=region)
+        return x0, y0, x1, y1
+
+class SyntheticCamera:
+    """Drone camera simulation, rendered once per frame by the shared video source
+    
+    The canvas persists between frames over a cached static layer. Each
+    frame restores only the rects the moving elements covered, and redraws
+    a HUD line only when its text changed (or a moving element erased it).
+    HUD values come from `telemetry()`, which returns the vehicle's
+    TelemetryState (or None).
+    """
+    
+    def __init__(self, width: int = 640, height: int = 480,
+                 telemetry: Optional[Callable[[], object]] = None):
         self.counter = 0
-        self.fps = 30
-        self.width = 640
-        self.height = 480
+        self.width = width
+        self.height = height
+        self.telemetry = telemetry
+        self.hud = GlyphCache(0.5)
+        self.background = self._create_background()
+        self.canvas = self.background.copy()
+        # YUV 4:2:0 planes kept in step with the canvas, so no encoder has to reformat
+        self.planes = (np.empty((height, width), dtype=np.uint8),
+                       np.empty((height // 2, width // 2), dtype=np.uint8),
+                       np.empty((height // 2, width // 2), dtype=np.uint8))
+        self._convert((0, 0, width, height))
+        self.dirty: List[Rect] = []
+        # HUD lines: text origin, last text drawn, rect it covers
+        self.lines: List[list] = [[(50, y), None, None] for y in (60, 80, 100, 120)]
+        self.sprites: List[Rect] = []
         
-    async def recv(self):
-        pts = time.time()
+        # Render counters
+        self.frames = 0
+        self.line_redraws = 0
+        self.restored_pixels = 0
         
+    def __call__(self) -> VideoFrame:
         # Create a synthetic video frame (simulating drone camera)
-        frame = self._create_synthetic_frame()
-        
-        # Convert to VideoFrame
-        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
-        video_frame.pts = pts
-        video_frame.time_base = 1 / 90000
-        
+        self._update_canvas()
+        for rect in _merge_rects(self.dirty):
+            self._convert(rect)
+        self.dirty = []
         self.counter += 1
-        return video_frame
+        self.frames += 1
+        frame = VideoFrame(self.width, self.height, "yuv420p")
+        if any(plane.buffer_size != data.size for plane, data in zip(frame.planes, self.planes)):
+            # Padded planes: let PyAV lay them out
+            return VideoFrame.from_ndarray(np.concatenate([data.reshape(-1) for data in self.planes])
+                                           .reshape(self.height * 3 // 2, self.width), format="yuv420p")
+        for plane, data in zip(frame.planes, self.planes):
+            plane.update(data)
+        return frame
+    
+    def _convert(self, rect: Rect):
+        """Convert one canvas rect (grown to even bounds) into the YUV planes"""
+        x0, y0, x1, y1 = rect
+        x0 &= ~1
+        y0 &= ~1
+        x1 = min(self.width, x1 + (x1 & 1))
+        y1 = min(self.height, y1 + (y1 & 1))
+        width = x1 - x0
+        height = y1 - y0
+        if width <= 0 or height <= 0:
+            return
+        block = cv2.cvtColor(self.canvas[y0:y1, x0:x1], cv2.COLOR_BGR2YUV_I420).reshape(-1)
+        luma = width * height
+        luma_plane, u_plane, v_plane = self.planes
+        luma_plane[y0:y1, x0:x1] = block[:luma].reshape(height, width)
+        chroma = (height // 2, width // 2)
+        u_plane[y0 // 2:y1 // 2, x0 // 2:x1 // 2] = block[luma:luma * 5 // 4].reshape(chroma)
+        v_plane[y0 // 2:y1 // 2, x0 // 2:x1 // 2] = block[luma * 5 // 4:].reshape(chroma)
     
-    def _create_synthetic_frame(self):
-        """Create synthetic drone camera footage"""
-        # Create a black frame
+    def _create_background(self) -> np.ndarray:
+        """Static layer drawn once: black frame and title"""
         frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        cv2.putText(frame, "DRONE CAMERA", (50, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        return frame
+    
+    def _restore(self, rect: Rect):
+        x0, y0, x1, y1 = rect
+        self.canvas[y0:y1, x0:x1] = self.background[y0:y1, x0:x1]
+        self.restored_pixels += (x1 - x0) * (y1 - y0)
+        self.dirty.append(rect)
+    
+    def _hud_text(self) -> List[str]:
+        state = self.telemetry() if self.telemetry else None
+        clock = f"TIME: {time.strftime('%H:%M:%S')}"
+        if state is None:
+            return ["LAT: --- LON: ---", "ALT: --- SPD: ---", "MODE: ---", clock]
+        return [
+            f"LAT: {state.lat:.5f} LON: {state.lon:.5f}",
+            f"ALT: {state.relative_alt:.0f}m SPD: {state.groundspeed:.1f}m/s",
+            f"MODE: {state.mode} {'ARMED' if state.armed else 'DISARMED'} BAT: {state.battery_remaining:.0f}%",
+            clock
+        ]
+    
+    def _update_canvas(self):
+        """Erase last frame's moving elements, refresh changed HUD lines, draw this frame's elements"""
+        erased = self.sprites
+        for rect in erased:
+            self._restore(rect)
+        
+        for line, text in zip(self.lines, self._hud_text()):
+            origin, drawn, rect = line
+            if text == drawn and not (rect and any(_overlaps(rect, sprite) for sprite in erased)):
+                continue
+            if rect:
+                self._restore(rect)
+            line[1] = text
+            line[2] = self.hud.draw(self.canvas, text, *origin)
+            self.dirty.append(line[2])
+            self.line_redraws += 1
         
         # Add some moving elements to simulate drone camera
+        frame = self.canvas
+        sprites = []
         center_x = self.width // 2 + int(50 * np.sin(self.counter * 0.1))
         center_y = self.height // 2 + int(30 * np.cos(self.counter * 0.05))
         
@@ -51,55 +202,149 @@ class WebRTCVideoStream(VideoStreamTrack):
         cv2.line(frame, (center_x - 20, center_y), (center_x + 20, center_y), (0, 255, 0), 2)
         cv2.line(frame, (center_x, center_y - 20), (center_x, center_y + 20), (0, 255, 0), 2)
         cv2.circle(frame, (center_x, center_y), 10, (0, 255, 0), 2)
-        
-        # Add some text
-        cv2.putText(frame, "DRONE CAMERA", (50, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(frame, f"LAT: 12.9716 LON: 77.5946", (50, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(frame, f"ALT: 100m SPD: 10m/s", (50, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(frame, f"TIME: {time.strftime('%H:%M:%S')}", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        sprites.append(self._clip(center_x - 22, center_y - 22, center_x + 23, center_y + 23))
         
         # Add moving objects to simulate real footage
         for i in range(3):
             x = int(self.width * 0.2 * i + self.counter * 2) % self.width
             y = int(self.height * 0.3 + 50 * np.sin(self.counter * 0.05 + i))
             cv2.circle(frame, (x, y), 5, (0, 0, 255), -1)
-        
-        return frame
+            sprites.append(self._clip(x - 6, y - 6, x + 7, y + 7))
+        self.sprites = sprites
+        self.dirty.extend(sprites)
+    
+    def _clip(self, x0: int, y0: int, x1: int, y1: int) -> Rect:
+        return max(0, x0), max(0, y0), min(self.width, x1), min(self.height, y1)
+    
+    def get_statistics(self) -> Dict:
+        """Get render counters"""
+        return {
+            "frames": self.frames,
+            "glyphs": len(self.hud.glyphs),
+            "line_redraws": self.line_redraws,
+            "restored_px_avg": round(self.restored_pixels / self.frames) if self.frames else None
+        }
+
+def _overlaps(a: Rect, b: Rect) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def _merge_rects(rects: List[Rect]) -> List[Rect]:
+    """Union overlapping rects (an element's old and new position) so each area converts once"""
+    merged: List[Rect] = []
+    for rect in rects:
+        if rect[2] <= rect[0] or rect[3] <= rect[1]:
+            continue
+        while True:
+            for i, other in enumerate(merged):
+                if _overlaps(rect, other):
+                    rect = (min(rect[0], other[0]), min(rect[1], other[1]),
+                            max(rect[2], other[2]), max(rect[3], other[3]))
+                    del merged[i]
+                    break
+            else:
+                break
+        merged.append(rect)
+    return merged
 
 class WebRTCServer:
     def __init__(self):
-        self.pcs = set()
-        self.video_stream = WebRTCVideoStream()
+        # Called with (pc, channel, offer) for every data channel a client opens
+        self.on_datachannel: Optional[Callable] = None
+        # One render task per camera; viewers share its frames and encodes
+        self.video = VideoDistributor()
+        self.camera = SyntheticCamera()
+        self.video.add_source(VideoSource("camera", self.camera, fps=30))
+        # Every peer from offer to close, with admission limits and stale-peer eviction
+        self.governor = PeerGovernor(self.video)
         
-    async def offer(self, offer):
-        """Handle WebRTC offer from client"""
-        pc = RTCPeerConnection()
-        self.pcs.add(pc)
+    async def offer(self, offer, source: str = "camera", bitrate: Optional[float] = None):
+        """Handle WebRTC offer from client
         
-        # Add video track
-        pc.addTrack(self.video_stream)
+        Viewers whose offer includes VP8 or H264 get packets from the encoder
+        shared by every viewer of `source` at the same bitrate tier; others
+        get the shared frames and encode them in their own sender. Offers
+        without a video section only carry data channels. Raises
+        AdmissionError when the node is at its peer or encoder limit.
+        """
+        if source not in self.video.sources:
+            raise KeyError(f"unknown video source {source}")
+        video = "m=video" in offer["sdp"]
+        codec = shared_codec(offer["sdp"]) if video else None
+        profile, tier = self.governor.admit(source, codec, bitrate_tier(bitrate) if video else None)
+        pc = RTCPeerConnection()
+        peer = self.governor.add(pc, source)
         
         @pc.on("connectionstatechange")
         async def on_connectionstatechange():
             logger.info(f"🎥 WebRTC connection state: {pc.connectionState}")
-            if pc.connectionState == "failed":
-                await pc.close()
-                self.pcs.discard(pc)
+            self.governor.set_state(pc, pc.connectionState)
+            if pc.connectionState in ("failed", "closed"):
+                await self.governor.close(pc, pc.connectionState)
         
-        # Handle the offer
-        await pc.setRemoteDescription(RTCSessionDescription(sdp=offer["sdp"], type=offer["type"]))
-        await pc.setLocalDescription(await pc.createAnswer())
+        @pc.on("datachannel")
+        def on_datachannel(channel):
+            if self.on_datachannel is not None:
+                self.on_datachannel(pc, channel, offer)
         
-        return {
+        try:
+            # The video transceiver exists before the offer is applied so its codec preference takes part
+            sender = self._add_video(pc, peer, codec, source, tier, profile) if video else None
+            await pc.setRemoteDescription(RTCSessionDescription(sdp=offer["sdp"], type=offer["type"]))
+            answer = await pc.createAnswer()
+            if codec and negotiated_codec(answer.sdp) != codec:
+                self._relay_frames(sender, peer, source, profile)
+                codec = None
+            await pc.setLocalDescription(answer)
+        except Exception:
+            await self.governor.close(pc, "error")
+            raise
+        
+        answer = {
             "sdp": pc.localDescription.sdp,
             "type": pc.localDescription.type
         }
+        if video:
+            answer["video"] = {"codec": codec, "bitrate": tier, "profile": profile}
+        return answer
+    
+    def _add_video(self, pc: RTCPeerConnection, peer, codec: Optional[str], source: str,
+                   tier: int, profile: str) -> RTCRtpSender:
+        if codec:
+            track = self.video.packet_track(source, codec, tier, profile)
+            peer.stream = track.stream
+        else:
+            track = self.video.frame_track(source, profile)
+        peer.track = track
+        peer.profile = profile
+        sender = pc.addTrack(track)
+        if codec:
+            # The relayed packets are only valid in the codec they were encoded with
+            transceiver = next(t for t in pc.getTransceivers() if t.sender is sender)
+            transceiver.setCodecPreferences([
+                capability for capability in RTCRtpSender.getCapabilities("video").codecs
+                if capability.mimeType in (f"video/{codec}", "video/rtx")
+            ])
+        return sender
+
+    def _relay_frames(self, sender: RTCRtpSender, peer, source: str, profile: str):
+        """Swap a packet track for shared frames when the answer settled on another codec"""
+        logger.warning(f"⚠️ {peer.label} negotiated a codec other than the shared encode, relaying frames")
+        peer.track.stop()
+        peer.stream = None
+        peer.track = self.video.frame_track(source, profile)
+        sender.replaceTrack(peer.track)
+    
+    def get_statistics(self) -> Dict:
+        """Get peer and video pipeline counters"""
+        return {
+            "peers": len(self.governor.peers),
+            "governor": self.governor.get_statistics(),
+            "video": self.video.get_statistics()
+        }
     
     async def cleanup(self):
-        """Clean up WebRTC connections"""
-        for pc in self.pcs:
-            await pc.close()
-        self.pcs.clear()
+        """Close every peer connection at once"""
+        await self.governor.close_all()
 
 # For systems without camera access, we'll use synthetic video
 webrtc_server = WebRTCServer()
\ No newline at end of file
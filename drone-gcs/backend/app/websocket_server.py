@@ -3,10 +3,11 @@ WebSocket Server for real-time telemetry and command transmission
 """
 import asyncio
 import websockets
-import json
 import logging
-from typing import Set
 import time
+from fanout import FanoutHub
+from scheduler import scheduler
+import ws_codec
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +15,7 @@ class WebSocketServer:
     def __init__(self, host='localhost', port=8765):
         self.host = host
         self.port = port
-        self.connected_clients: Set = set()
+        self.hub = FanoutHub(encoders=ws_codec.ENCODERS)
         self.mavlink_handler = None
         self.network_manager = None
         
@@ -27,12 +28,13 @@ class WebSocketServer:
     async def handle_client(self, websocket, path):
         """Handle WebSocket client connection"""
         client_id = id(websocket)
-        self.connected_clients.add(websocket)
-        logger.info(f"✅ Client connected: {client_id}. Total: {len(self.connected_clients)}")
+        encoding = websocket.subprotocol or ws_codec.ENCODING_JSON
+        self.hub.add(websocket, websocket.send, encoding)
+        logger.info(f"✅ Client connected: {client_id} ({encoding}). Total: {len(self.hub)}")
         
         try:
             # Send initial connection data
-            await websocket.send(json.dumps({
+            self._send(websocket, {
                 'type': 'connection',
                 'status': 'connected',
                 'client_id': client_id,
@@ -42,34 +44,38 @@ class WebSocketServer:
                     'version': '2.0.0',
                     'features': ['MAVLink', 'WebRTC', '4G/LTE', 'ZeroTier']
                 }
-            }))
+            })
             
             # Send initial network status
             if self.network_manager:
-                await websocket.send(json.dumps({
+                self._send(websocket, {
                     'type': 'network_status',
                     'data': self.network_manager.get_network_status()
-                }))
+                })
             
             # Handle incoming messages
             async for message in websocket:
                 try:
-                    data = json.loads(message)
+                    data = ws_codec.decode_message(encoding, message)
                     await self.handle_message(data, websocket)
-                except json.JSONDecodeError as e:
-                    logger.error(f"❌ Invalid JSON received: {e}")
-                    await websocket.send(json.dumps({
+                except (ValueError, TypeError) as e:
+                    logger.error(f"❌ Invalid message received: {e}")
+                    self._send(websocket, {
                         'type': 'error',
-                        'message': 'Invalid JSON format'
-                    }))
+                        'message': 'Invalid message format'
+                    })
                     
         except websockets.exceptions.ConnectionClosed:
             logger.info(f"🔌 Client disconnected: {client_id}")
         except Exception as e:
             logger.error(f"❌ Client handler error: {e}")
         finally:
-            self.connected_clients.remove(websocket)
-            logger.info(f"🗑️ Client removed: {client_id}. Total: {len(self.connected_clients)}")
+            self.hub.remove(websocket)
+            logger.info(f"🗑️ Client removed: {client_id}. Total: {len(self.hub)}")
+    
+    def _send(self, websocket, data: dict):
+        """Queue a reliable message for one client in its negotiated encoding"""
+        self.hub.send_to(websocket, data)
     
     async def handle_message(self, data: dict, websocket):
         """Handle incoming WebSocket messages"""
@@ -77,108 +83,94 @@ class WebSocketServer:
             message_type = data.get('type')
             
             if message_type == 'command' and self.mavlink_handler:
-                command = data.get('command')
-                params = data.get('params', {})
-                
-                success = self.mavlink_handler.send_command(command, params)
-                
-                # Send command acknowledgment
-                await websocket.send(json.dumps({
-                    'type': 'command_ack',
-                    'command': command,
-                    'success': success,
-                    'timestamp': time.time()
-                }))
+                # Acked once the vehicle answers; other messages keep flowing meanwhile
+                asyncio.ensure_future(self.run_command(data, websocket))
                 
             elif message_type == 'network_command':
                 await self.handle_network_command(data, websocket)
                 
             elif message_type == 'ping':
-                await websocket.send(json.dumps({
+                self._send(websocket, {
                     'type': 'pong',
                     'timestamp': time.time()
-                }))
+                })
                 
             else:
-                await websocket.send(json.dumps({
+                self._send(websocket, {
                     'type': 'error',
                     'message': f'Unknown message type: {message_type}'
-                }))
+                })
                 
         except Exception as e:
             logger.error(f"❌ Error handling message: {e}")
     
+    async def run_command(self, data: dict, websocket):
+        """Send a command and report the vehicle's COMMAND_ACK result to the client"""
+        command = data.get('command')
+        try:
+            outcome = await self.mavlink_handler.execute_command(command, data.get('params') or {},
+                                                                data.get('vehicle_id') or '1:1')
+        except Exception as e:
+            logger.error(f"❌ Error sending command: {e}")
+            outcome = {'command': command, 'result': 'FAILED', 'success': False, 'error': str(e)}
+        self._send(websocket, {
+            'type': 'command_ack',
+            **outcome,
+            'timestamp': time.time()
+        })
+    
     async def handle_network_command(self, data: dict, websocket):
         """Handle network-related commands"""
         command = data.get('command')
         
         if command == 'get_network_status' and self.network_manager:
-            await websocket.send(json.dumps({
+            self._send(websocket, {
                 'type': 'network_status',
                 'data': self.network_manager.get_network_status()
-            }))
+            })
             
         elif command == 'get_zerotier_networks' and self.network_manager:
-            await websocket.send(json.dumps({
+            self._send(websocket, {
                 'type': 'zerotier_networks',
                 'data': self.network_manager.get_zerotier_networks()
-            }))
+            })
             
         elif command == 'connect_zerotier' and self.network_manager:
             network_id = data.get('network_id')
             success = self.network_manager.connect_to_zerotier(network_id)
-            await websocket.send(json.dumps({
+            self._send(websocket, {
                 'type': 'zerotier_connection',
                 'success': success,
                 'network_id': network_id
-            }))
+            })
     
-    async def broadcast_telemetry(self):
-        """Broadcast telemetry to all connected clients"""
-        while True:
-            try:
-                if self.mavlink_handler and self.connected_clients:
-                    telemetry = self.mavlink_handler.get_telemetry()
-                    
-                    if telemetry:
-                        message = json.dumps({
-                            'type': 'telemetry',
-                            'data': telemetry,
-                            'timestamp': time.time(),
-                            'mavlink_stats': self.mavlink_handler.get_statistics()
-                        })
-                        
-                        # Send to all connected clients
-                        closed_clients = []
-                        for client in self.connected_clients:
-                            try:
-                                await client.send(message)
-                            except (websockets.exceptions.ConnectionClosed, Exception):
-                                closed_clients.append(client)
-                        
-                        # Remove closed clients
-                        for client in closed_clients:
-                            if client in self.connected_clients:
-                                self.connected_clients.remove(client)
-                
-                # Broadcast network status periodically
-                if self.network_manager and self.connected_clients and int(time.time()) % 10 == 0:
-                    network_message = json.dumps({
-                        'type': 'network_status',
-                        'data': self.network_manager.get_network_status()
-                    })
-                    
-                    for client in self.connected_clients.copy():
-                        try:
-                            await client.send(network_message)
-                        except:
-                            self.connected_clients.discard(client)
-                
-                await asyncio.sleep(0.1)  # 10Hz update rate
-                
-            except Exception as e:
-                logger.error(f"❌ Error broadcasting telemetry: {e}")
-                await asyncio.sleep(1)
+    def publish_telemetry(self):
+        """Publish telemetry to all connected clients"""
+        if self.mavlink_handler and len(self.hub):
+            telemetry = self.mavlink_handler.get_telemetry()
+            
+            if telemetry:
+                # Serialized once, latest-value-wins for slow clients
+                self.hub.publish({
+                    'type': 'telemetry',
+                    'data': telemetry,
+                    'timestamp': time.time(),
+                    'mavlink_stats': self.mavlink_handler.get_statistics()
+                }, topic='telemetry')
+    
+    def publish_network_status(self):
+        """Publish network status to all connected clients"""
+        if self.network_manager and len(self.hub):
+            self.hub.publish({
+                'type': 'network_status',
+                'data': self.network_manager.get_network_status()
+            }, topic='network_status')
+    
+    def start_broadcast(self, telemetry_interval: float = 0.1, network_interval: float = 10.0):
+        """Register the broadcast jobs (10Hz telemetry, network status every 10s) and start the scheduler"""
+        scheduler.register('telemetry_broadcast', telemetry_interval, self.publish_telemetry)
+        scheduler.register('network_status', network_interval, self.publish_network_status)
+        scheduler.start()
     
     async def start_server(self):
         """Start WebSocket server"""
@@ -188,7 +180,8 @@ class WebSocketServer:
                 self.host,
                 self.port,
                 ping_interval=20,
-                ping_timeout=60
+                ping_timeout=60,
+                subprotocols=ws_codec.supported_subprotocols()
             )
             
             logger.info(f"🚀 WebSocket server running on ws://{self.host}:{self.port}")
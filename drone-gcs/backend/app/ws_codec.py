@@ -0,0 +1,156 @@
+"""
+WebSocket payload encodings negotiated per client
+JSON text stays the default; clients can request a binary subprotocol at accept time:
+
+    gcs.msgpack.v1  every message as MessagePack (needs the msgpack package)
+    gcs.struct.v1   telemetry as a fixed little-endian struct frame,
+                    everything else as JSON text
+"""
+import json
+import logging
+import struct
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+from mavlink_codec import MAV_STATE_NAMES, MAV_STATE_NUMBERS, MODE_NAMES, MODE_NUMBERS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODING_JSON = 'json'
+SUBPROTOCOL_MSGPACK = 'gcs.msgpack.v1'
+SUBPROTOCOL_STRUCT = 'gcs.struct.v1'
+
+# Telemetry struct frame, schema 1:
+#   u8 schema_id, u8 flags (bit0 armed), u16 vehicle sysid, u16 compid, u16 seq,
+#   f64 timestamp, f64 lat, f64 lon, 17 x f32, u8 satellites, u8 fix_type,
+#   u8 mode (custom_mode, 255 = unknown), u8 system_status (MAV_STATE),
+#   u16 mission_current, u16 mission_total
+STRUCT_SCHEMA_ID = 1
+STRUCT_FLOAT_FIELDS = (
+    'alt', 'relative_alt', 'roll', 'pitch', 'yaw', 'heading',
+    'groundspeed', 'airspeed', 'climb', 'vx', 'vy', 'vz',
+    'battery_remaining', 'voltage_battery', 'current_battery', 'eph', 'epv'
+)
+TELEMETRY_STRUCT = struct.Struct('<BBHHHddd' + 'f' * len(STRUCT_FLOAT_FIELDS) + 'BBBBHH')
+MODE_UNKNOWN = 255
+
+# Telemetry reports system_status as a MAV_STATE name; the number goes on the wire
+SYSTEM_STATUS_CODES = MAV_STATE_NUMBERS
+
+
+def supported_subprotocols() -> list:
+    """Subprotocols this server can speak, in order of preference"""
+    protocols = [SUBPROTOCOL_STRUCT]
+    if msgpack is not None:
+        protocols.insert(0, SUBPROTOCOL_MSGPACK)
+    return protocols
+
+
+def negotiate(requested: Iterable[str]) -> Optional[str]:
+    """Pick the first client-requested subprotocol we support, or None for JSON"""
+    supported = supported_subprotocols()
+    for protocol in requested or ():
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def _vehicle_ids(vehicle_id: Optional[str]):
+    if not vehicle_id:
+        return 1, 1
+    sysid, _, compid = vehicle_id.partition(':')
+    return int(sysid), int(compid or 1)
+
+
+def pack_telemetry(telemetry: Dict[str, Any], vehicle_id: Optional[str] = None,
+                   seq: int = 0, timestamp: Optional[float] = None) -> bytes:
+    """Pack one telemetry dict into a schema-1 struct frame"""
+    get = telemetry.get
+    sysid, compid = _vehicle_ids(vehicle_id)
+    status = get('system_status', 0)
+    if isinstance(status, str):
+        status = SYSTEM_STATUS_CODES.get(status, 0)
+    return TELEMETRY_STRUCT.pack(
+        STRUCT_SCHEMA_ID,
+        1 if get('armed') else 0,
+        sysid, compid, seq & 0xFFFF,
+        timestamp if timestamp is not None else get('timestamp', 0.0),
+        get('lat', 0.0), get('lon', 0.0),
+        *[float(get(name) or 0.0) for name in STRUCT_FLOAT_FIELDS],
+        int(get('satellites', 0)) & 0xFF,
+        int(get('fix_type', 0)) & 0xFF,
+        MODE_NUMBERS.get(get('mode'), MODE_UNKNOWN),
+        int(status) & 0xFF,
+        int(get('mission_current', 0)) & 0xFFFF,
+        int(get('mission_total', 0)) & 0xFFFF
+    )
+
+
+def unpack_telemetry(payload: bytes) -> Dict[str, Any]:
+    """Decode a schema-1 struct frame back into a telemetry message dict"""
+    values = TELEMETRY_STRUCT.unpack(payload)
+    if values[0] != STRUCT_SCHEMA_ID:
+        raise ValueError(f"Unknown telemetry schema: {values[0]}")
+    floats = values[8:8 + len(STRUCT_FLOAT_FIELDS)]
+    satellites, fix_type, mode, status, mission_current, mission_total = values[8 + len(STRUCT_FLOAT_FIELDS):]
+    data = dict(zip(STRUCT_FLOAT_FIELDS, floats))
+    data.update({
+        'lat': values[6],
+        'lon': values[7],
+        'armed': bool(values[1] & 1),
+        'mode': MODE_NAMES.get(mode, 'UNKNOWN'),
+        'system_status': MAV_STATE_NAMES.get(status, 'UNKNOWN'),
+        'satellites': satellites,
+        'fix_type': fix_type,
+        'mission_current': mission_current,
+        'mission_total': mission_total,
+        'timestamp': values[5]
+    })
+    return {
+        'type': 'telemetry',
+        'vehicle_id': f"{values[2]}:{values[3]}",
+        'seq': values[4],
+        'data': data,
+        'timestamp': values[5]
+    }
+
+
+def encode_json(message: Dict[str, Any]) -> str:
+    return json.dumps(message)
+
+
+def encode_msgpack(message: Dict[str, Any]) -> bytes:
+    return msgpack.packb(message, use_bin_type=True)
+
+
+def encode_struct(message: Dict[str, Any]) -> Union[str, bytes]:
+    """Full telemetry frames become struct frames; other messages stay JSON text"""
+    if message.get('type') == 'telemetry' and message.get('frame', 'keyframe') == 'keyframe':
+        return pack_telemetry(message['data'], message.get('vehicle_id'),
+                              message.get('seq', 0), message.get('timestamp'))
+    return json.dumps(message)
+
+
+ENCODERS: Dict[str, Callable[[Dict[str, Any]], Union[str, bytes]]] = {
+    ENCODING_JSON: encode_json,
+    SUBPROTOCOL_STRUCT: encode_struct,
+}
+if msgpack is not None:
+    ENCODERS[SUBPROTOCOL_MSGPACK] = encode_msgpack
+
+
+def encode_message(encoding: Optional[str], message: Dict[str, Any]) -> Union[str, bytes]:
+    """Encode a message for a client using its negotiated encoding"""
+    return ENCODERS.get(encoding or ENCODING_JSON, encode_json)(message)
+
+
+def decode_message(encoding: Optional[str], payload: Union[str, bytes]) -> Dict[str, Any]:
+    """Decode a client message; binary frames are MessagePack, text frames JSON"""
+    if isinstance(payload, bytes):
+        if encoding == SUBPROTOCOL_MSGPACK and msgpack is not None:
+            return msgpack.unpackb(payload, raw=False)
+        raise ValueError("Binary messages require the msgpack subprotocol")
+    return json.loads(payload)
@@ -0,0 +1,7 @@
+"""Make the flat app/ modules importable the way the app and its scripts import them"""
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
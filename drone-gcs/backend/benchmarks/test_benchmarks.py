@@ -0,0 +1,90 @@
+"""
+pytest-benchmark cases for the hot paths: MAVLink decode, fan-out encode
+and a short in-process load test
+
+Usage: python -m pytest benchmarks/ [--benchmark-autosave] [--benchmark-compare]
+"""
+import argparse
+import asyncio
+import time
+
+import pytest
+
+import ws_codec
+from bench_mavlink_codec import build_datagrams
+from fanout import FanoutHub
+from mavlink_codec import MAVLinkDecoder, TelemetryState
+from mavlink_handler import MAVLinkHandler
+
+VEHICLES = 20
+ROUNDS = 50
+CLIENTS = 50
+
+
+@pytest.fixture(scope='module')
+def datagrams():
+    return build_datagrams(VEHICLES, ROUNDS)
+
+
+@pytest.fixture(scope='module')
+def telemetry_message():
+    handler = MAVLinkHandler()
+    handler.telemetry_data['armed'] = True
+    return {
+        'type': 'telemetry',
+        'vehicle_id': '1:1',
+        'seq': 1,
+        'data': handler.update_simulation(),
+        'timestamp': time.time(),
+        'mavlink': True
+    }
+
+
+def test_decode(benchmark, datagrams):
+    states = {(sysid, 1): TelemetryState(sysid, 1) for sysid in range(1, VEHICLES + 1)}
+    decoder = MAVLinkDecoder(state_for=lambda sysid, compid, msg_id: states.get((sysid, compid)))
+
+    def decode():
+        return sum(decoder.feed(datagram, 0.0) for datagram in datagrams)
+
+    assert benchmark(decode) == len(datagrams)
+
+
+@pytest.mark.parametrize('encoding', [ws_codec.ENCODING_JSON, ws_codec.SUBPROTOCOL_MSGPACK,
+                                      ws_codec.SUBPROTOCOL_STRUCT])
+def test_fanout_encode(benchmark, telemetry_message, encoding):
+    if encoding not in ws_codec.ENCODERS:
+        pytest.skip('msgpack not installed')
+    loop = asyncio.new_event_loop()
+
+    async def connect() -> FanoutHub:
+        hub = FanoutHub(encoders=ws_codec.ENCODERS)
+
+        async def send(payload):
+            pass
+
+        for client in range(CLIENTS):
+            hub.add(client, send, encoding=encoding)
+        return hub
+
+    hub = loop.run_until_complete(connect())
+    try:
+        assert benchmark(hub.publish, telemetry_message, 'telemetry') == CLIENTS
+    finally:
+        async def disconnect():
+            hub.close_all()
+            await asyncio.sleep(0)
+
+        loop.run_until_complete(disconnect())
+        loop.close()
+
+
+def test_run_load(benchmark):
+    import loadtest
+
+    args = argparse.Namespace(vehicles=4, clients=4, hz=10.0, rate=10.0, duration=2.0, warmup=1.0,
+                              workers=1, seed=1)
+    result = benchmark.pedantic(lambda: asyncio.run(loadtest.run_load(args)), rounds=1, iterations=1)
+    benchmark.extra_info.update(result['ingest'])
+    assert result['ingest']['vehicles_seen'] == args.vehicles
+    assert result['fanout']['client_messages_per_second'] > 0
@@ -1,7 +1,26 @@
-import React, { createContext, useState, useContext, useEffect } from 'react';
+import React, { createContext, useState, useContext, useEffect, useRef } from 'react';
 
 const TelemetryContext = createContext();
 
+const GCS_HOST = 'localhost:8000';
+// Give up on WebRTC telemetry (and keep it on /ws) if the data channel is not open by then
+const RTC_CONNECT_TIMEOUT = 5000;
+
+// The server does not trickle ICE candidates, so the offer is sent once gathering is done
+const waitForIceGathering = (pc) => new Promise((resolve) => {
+  if (pc.iceGatheringState === 'complete') {
+    resolve();
+    return;
+  }
+  const check = () => {
+    if (pc.iceGatheringState === 'complete') {
+      pc.removeEventListener('icegatheringstatechange', check);
+      resolve();
+    }
+  };
+  pc.addEventListener('icegatheringstatechange', check);
+});
+
 export const useTelemetry = () => {
   const context = useContext(TelemetryContext);
   if (!context) {
@@ -12,9 +31,18 @@ export const useTelemetry = () => {
 
 export const TelemetryProvider = ({ children }) => {
   const [telemetry, setTelemetry] = useState({});
+  const [fleet, setFleet] = useState({});
+  const [selectedVehicle, setSelectedVehicle] = useState(null);
+  const selectedVehicleRef = useRef(null);
+  const deltaSeqRef = useRef({});
   const [connectionStatus, setConnectionStatus] = useState('disconnected');
   const [networkStatus, setNetworkStatus] = useState({});
+  const [missionTransfers, setMissionTransfers] = useState({});
+  const [missions, setMissions] = useState({});
   const [websocket, setWebsocket] = useState(null);
+  const [telemetryTransport, setTelemetryTransport] = useState('ws');
+  const rtcRef = useRef(null);
+  const controlChannelRef = useRef(null);
 
   useEffect(() => {
     connectWebSocket();
@@ -26,31 +54,91 @@ export const TelemetryProvider = ({ children }) => {
     };
   }, []);
 
+  // Messages from /ws or the WebRTC data channels; replies go back on `channel`
+  const handleMessage = (data, channel) => {
+    console.log('📨 Received:', data.type);
+    
+    if (data.type === 'telemetry') {
+      const vehicleId = data.vehicle_id || '1:1';
+
+      if (data.frame) {
+        // Field-group subscriptions track a seq per group
+        const seqKey = data.groups ? `${vehicleId}/${data.groups[0]}` : vehicleId;
+        const lastSeq = deltaSeqRef.current[seqKey];
+        if (data.frame === 'delta') {
+          if (lastSeq === undefined || data.seq <= lastSeq) {
+            return;
+          }
+          // Rate-limited clients get merged deltas that start at base_seq
+          const baseSeq = data.base_seq !== undefined ? data.base_seq : data.seq - 1;
+          if (baseSeq !== lastSeq) {
+            // Missed a delta: ask for a fresh keyframe
+            delete deltaSeqRef.current[seqKey];
+            channel.send(JSON.stringify({ type: 'resync', vehicle_id: vehicleId }));
+            return;
+          }
+        }
+        deltaSeqRef.current[seqKey] = data.seq;
+      }
+      setFleet(prev => ({ ...prev, [vehicleId]: { ...prev[vehicleId], ...data.data } }));
+
+      // The main dashboard follows the selected (or first seen) vehicle
+      if (!selectedVehicleRef.current) {
+        selectedVehicleRef.current = vehicleId;
+        setSelectedVehicle(vehicleId);
+      }
+      if (vehicleId === selectedVehicleRef.current) {
+        setTelemetry(prev => ({ ...prev, ...data.data }));
+      }
+    } else if (data.type === 'viewport_leave') {
+      // Vehicles that left the map viewport; they come back with a keyframe
+      data.vehicle_ids.forEach((vehicleId) => {
+        Object.keys(deltaSeqRef.current)
+          .filter((key) => key === vehicleId || key.startsWith(`${vehicleId}/`))
+          .forEach((key) => delete deltaSeqRef.current[key]);
+      });
+      setFleet(prev => {
+        const next = { ...prev };
+        data.vehicle_ids.forEach((vehicleId) => delete next[vehicleId]);
+        return next;
+      });
+    } else if (data.type === 'rtt_probe') {
+      // Lets the server measure our round trip and adapt the telemetry rate
+      channel.send(JSON.stringify({ type: 'rtt_ack', probe_id: data.probe_id }));
+    } else if (data.type === 'network_status') {
+      setNetworkStatus(data.data);
+    } else if (data.type === 'connection') {
+      console.log('🔗', data.message);
+    } else if (data.type === 'command_ack') {
+      // result is the vehicle's COMMAND_ACK verdict (ACCEPTED, DENIED, ..., TIMEOUT)
+      console.log(data.success ? '✅ Command result:' : '⚠️ Command result:', data.command, data.result);
+    } else if (data.type === 'mission_progress' || data.type === 'mission_result') {
+      // Transfer state per vehicle; a finished download carries the items
+      const vehicleId = data.data.vehicle_id;
+      setMissionTransfers(prev => ({ ...prev, [vehicleId]: data.data }));
+      if (data.items) {
+        setMissions(prev => ({ ...prev, [vehicleId]: data.items }));
+      }
+    }
+  };
+
   const connectWebSocket = () => {
     console.log('🔗 Connecting to GCS WebSocket...');
     
     try {
-      const ws = new WebSocket('ws://localhost:8000/ws');
+      // Delta protocol: keyframes plus changed fields, with seq numbers for gap detection
+      const ws = new WebSocket(`ws://${GCS_HOST}/ws?protocol=delta`);
+      deltaSeqRef.current = {};
       
       ws.onopen = () => {
         console.log('✅ WebSocket connected successfully!');
         setConnectionStatus('connected');
+        startDataChannels(ws);
       };
 
       ws.onmessage = (event) => {
         try {
-          const data = JSON.parse(event.data);
-          console.log('📨 Received:', data.type);
-          
-          if (data.type === 'telemetry') {
-            setTelemetry(prev => ({ ...prev, ...data.data }));
-          } else if (data.type === 'network_status') {
-            setNetworkStatus(data.data);
-          } else if (data.type === 'connection') {
-            console.log('🔗', data.message);
-          } else if (data.type === 'command_ack') {
-            console.log('✅ Command result:', data);
-          }
+          handleMessage(JSON.parse(event.data), ws);
         } catch (error) {
           console.error('❌ Error parsing message:', error);
         }
@@ -59,6 +147,7 @@ export const TelemetryProvider = ({ children }) => {
       ws.onclose = () => {
         console.log('🔌 WebSocket disconnected');
         setConnectionStatus('disconnected');
+        stopDataChannels();
         
         // Auto-reconnect after 2 seconds
         setTimeout(() => {
@@ -79,12 +168,115 @@ export const TelemetryProvider = ({ children }) => {
     }
   };
 
+  // Telemetry over an unordered, maxRetransmits=0 WebRTC data channel so a lost packet never
+  // holds back later updates; commands and their acks use the reliable "control" channel.
+  // /ws stays open and takes telemetry back whenever the data channels are not up.
+  const startDataChannels = async (ws) => {
+    if (typeof RTCPeerConnection === 'undefined') {
+      return;
+    }
+    const pc = new RTCPeerConnection();
+    rtcRef.current = pc;
+    const telemetryChannel = pc.createDataChannel('telemetry', { ordered: false, maxRetransmits: 0 });
+    const controlChannel = pc.createDataChannel('control');
+    let active = false;
+
+    const fallBack = () => {
+      if (rtcRef.current !== pc) {
+        return;
+      }
+      rtcRef.current = null;
+      controlChannelRef.current = null;
+      if (active && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ type: 'telemetry_transport', transport: 'ws' }));
+        console.log('🔄 Telemetry back on WebSocket');
+      }
+      active = false;
+      setTelemetryTransport('ws');
+      pc.close();
+    };
+
+    const onChannelMessage = (event) => {
+      try {
+        handleMessage(JSON.parse(event.data), controlChannel);
+      } catch (error) {
+        console.error('❌ Error parsing message:', error);
+      }
+    };
+    telemetryChannel.onmessage = onChannelMessage;
+    controlChannel.onmessage = onChannelMessage;
+    controlChannel.onopen = () => {
+      controlChannelRef.current = controlChannel;
+    };
+    telemetryChannel.onopen = () => {
+      active = true;
+      ws.send(JSON.stringify({ type: 'telemetry_transport', transport: 'webrtc' }));
+      setTelemetryTransport('webrtc');
+      console.log('📡 Telemetry over WebRTC data channel');
+    };
+    telemetryChannel.onclose = fallBack;
+    controlChannel.onclose = fallBack;
+    pc.onconnectionstatechange = () => {
+      if (['failed', 'disconnected', 'closed'].includes(pc.connectionState)) {
+        fallBack();
+      }
+    };
+    setTimeout(() => {
+      if (!active) {
+        fallBack();
+      }
+    }, RTC_CONNECT_TIMEOUT);
+
+    try {
+      await pc.setLocalDescription(await pc.createOffer());
+      await waitForIceGathering(pc);
+      const response = await fetch(`http://${GCS_HOST}/api/webrtc/offer`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          sdp: pc.localDescription.sdp,
+          type: pc.localDescription.type,
+          // Full frames: each one stands alone, so a dropped frame needs no resync
+          telemetry: { protocol: 'json' }
+        })
+      });
+      if (!response.ok) {
+        throw new Error(`offer rejected (${response.status})`);
+      }
+      await pc.setRemoteDescription(await response.json());
+    } catch (error) {
+      console.warn('⚠️ WebRTC telemetry unavailable, staying on WebSocket:', error.message);
+      fallBack();
+    }
+  };
+
+  const stopDataChannels = () => {
+    const pc = rtcRef.current;
+    rtcRef.current = null;
+    controlChannelRef.current = null;
+    setTelemetryTransport('ws');
+    if (pc) {
+      pc.close();
+    }
+  };
+
   const sendCommand = (command, params = {}) => {
-    if (websocket && connectionStatus === 'connected') {
+    const controlChannel = controlChannelRef.current;
+    if (controlChannel && controlChannel.readyState === 'open') {
+      controlChannel.send(JSON.stringify({
+        type: 'command',
+        command,
+        params,
+        vehicle_id: selectedVehicleRef.current,
+        timestamp: Date.now()
+      }));
+      console.log('📡 MAVLink Command (WebRTC):', command, params);
+    } else if (websocket && connectionStatus === 'connected') {
       const message = {
         type: 'command',
         command,
         params,
+        vehicle_id: selectedVehicleRef.current,
         timestamp: Date.now()
       };
       websocket.send(JSON.stringify(message));
@@ -106,12 +298,49 @@ export const TelemetryProvider = ({ children }) => {
     }
   };
 
+  const sendMissionMessage = (type, vehicleId, payload = {}) => {
+    if (websocket && connectionStatus === 'connected') {
+      websocket.send(JSON.stringify({ type, vehicle_id: vehicleId || selectedVehicleRef.current, ...payload }));
+    } else {
+      console.warn('⚠️ Cannot send mission: WebSocket not connected');
+    }
+  };
+
+  // waypoints: [[lat, lon, alt], ...]; the server adds the ArduPilot home item
+  const uploadMission = (waypoints, vehicleId, rtl = true) =>
+    sendMissionMessage('mission_upload', vehicleId, { waypoints, rtl });
+  const downloadMission = (vehicleId) => sendMissionMessage('mission_download', vehicleId);
+  const clearMission = (vehicleId) => sendMissionMessage('mission_clear', vehicleId);
+
+  // bounds: [south, west, north, east] of the map, or null for every vehicle
+  const setViewport = (bounds) => {
+    if (websocket && connectionStatus === 'connected') {
+      websocket.send(JSON.stringify({ type: 'viewport', bbox: bounds }));
+    }
+  };
+
+  const selectVehicle = (vehicleId) => {
+    selectedVehicleRef.current = vehicleId;
+    setSelectedVehicle(vehicleId);
+    setTelemetry(fleet[vehicleId] || {});
+  };
+
   const value = {
     telemetry,
+    fleet,
+    selectedVehicle,
+    selectVehicle,
     connectionStatus,
+    telemetryTransport,
     networkStatus,
     sendCommand,
-    connectToZeroTier
+    connectToZeroTier,
+    missions,
+    missionTransfers,
+    uploadMission,
+    downloadMission,
+    clearMission,
+    setViewport
   };
 
   return (